@@ -0,0 +1,107 @@
+"""
+Endpoint de verificación para nginx auth_request
+================================================
+
+nginx hace una subrequest a GET /auth/verify con las cabeceras de la request
+original antes de pasarla a cualquier upstream. Aquí solo se responde:
+
+- 204 + X-User, X-User-Sub, X-Roles si el token (o la sesión BFF) es válido
+- 401 si no hay credenciales o no son válidas
+- 403 si se pide un rol (?role=admin) que el usuario no tiene
+
+Es ASGI directo, sin FastAPI: no hay routing, dependencias, parsing de body
+ni middlewares por medio. Se usa de dos formas:
+
+- Como middleware más externo de la app: intercepta solo el path de
+  verificación y deja pasar el resto
+- Como app independiente (app=None), para servirla en un Unix domain socket
+  junto a nginx:  uvicorn main:auth_gateway --uds /run/keycloak-lab/auth.sock
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# verify(authorization, cookie, original_uri) -> claims o None
+VerifyFunction = Callable[[Optional[str], Optional[str], Optional[str]], Awaitable[Optional[Dict[str, Any]]]]
+LifespanHook = Callable[[], Awaitable[None]]
+Headers = Tuple[Tuple[bytes, bytes], ...]
+
+_UNAUTHORIZED: Headers = ((b"www-authenticate", b"Bearer"), (b"cache-control", b"no-store"))
+_FORBIDDEN: Headers = ((b"cache-control", b"no-store"),)
+
+
+class AuthRequestGateway:
+    """Responde a nginx auth_request; el resto del tráfico pasa a `app`"""
+
+    def __init__(
+        self,
+        app: Optional[ASGIApp],
+        verify: VerifyFunction,
+        path: str = "/auth/verify",
+        on_startup: Optional[LifespanHook] = None,
+        on_shutdown: Optional[LifespanHook] = None,
+    ):
+        self.app = app
+        self.verify = verify
+        self.path = path
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] == self.path:
+            await self._verify(scope, send)
+        elif self.app is not None:
+            await self.app(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        else:
+            await _respond(send, 404)
+
+    async def _verify(self, scope: Scope, send: Send) -> None:
+        authorization = cookie = original_uri = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"cookie":
+                cookie = value.decode("latin-1")
+            elif name == b"x-original-uri":
+                original_uri = value.decode("latin-1")
+
+        claims = await self.verify(authorization, cookie, original_uri)
+        if claims is None:
+            await _respond(send, 401, _UNAUTHORIZED)
+            return
+
+        roles = claims.get("realm_access", {}).get("roles", ())
+        if scope["query_string"]:
+            required = parse_qs(scope["query_string"].decode("latin-1")).get("role")
+            if required and not any(role in roles for role in required):
+                await _respond(send, 403, _FORBIDDEN)
+                return
+
+        await _respond(send, 204, (
+            (b"x-user", str(claims.get("preferred_username", "")).encode()),
+            (b"x-user-sub", str(claims.get("sub", "")).encode()),
+            (b"x-roles", ",".join(roles).encode()),
+            (b"cache-control", b"no-store"),
+        ))
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.on_startup is not None:
+                    await self.on_startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.on_shutdown is not None:
+                    await self.on_shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _respond(send: Send, status: int, headers: Headers = ()) -> None:
+    await send({"type": "http.response.start", "status": status, "headers": [*headers, (b"content-length", b"0")]})
+    await send({"type": "http.response.body", "body": b""})
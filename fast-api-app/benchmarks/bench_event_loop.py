@@ -0,0 +1,111 @@
+"""
+Benchmark del event loop con tráfico mixto autenticado/público
+==============================================================
+
+Lanza en proceso (ASGI, sin red) clientes concurrentes contra /protected
+con tokens siempre nuevos (peor caso: sin aciertos de caché) y clientes
+contra /health, y mide:
+
+- lag del event loop (retraso de un ticker de 1 ms)
+- latencia de /health mientras el path autenticado está ocupado
+- throughput de ambos tipos de request
+
+Se ejecuta dos veces: con la verificación en el pool (VERIFY_OFFLOAD) y
+verificando inline en el event loop.
+
+Uso (desde fast-api-app/):
+    python benchmarks/bench_event_loop.py [--duration 3] [--auth-clients 16] [--public-clients 4]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import TokenFactory, install_jwks, percentile
+
+import main  # noqa: E402
+
+
+async def ticker(stop: asyncio.Event, lags: list, interval: float = 0.001):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def auth_client(client, tokens, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        token = tokens.pop() if tokens else None
+        if token is None:
+            return
+        response = await client.get("/protected", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200, response.text
+        counter[0] += 1
+        await asyncio.sleep(0)
+
+
+async def public_client(client, stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/health")
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+        # El transporte ASGI en proceso no hace I/O real: ceder el turno
+        # explícitamente para no acaparar el loop
+        await asyncio.sleep(0)
+
+
+async def run_scenario(offload: bool, tokens: list, args) -> dict:
+    main.VERIFY_OFFLOAD = offload
+    main._token_cache.clear()
+
+    stop = asyncio.Event()
+    lags, health_latencies, auth_count = [], [], [0]
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tasks = [asyncio.create_task(ticker(stop, lags))]
+        tasks += [asyncio.create_task(auth_client(client, tokens, stop, auth_count)) for _ in range(args.auth_clients)]
+        tasks += [asyncio.create_task(public_client(client, stop, health_latencies)) for _ in range(args.public_clients)]
+        start = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "offload": offload,
+        "auth_rps": auth_count[0] / elapsed,
+        "health_rps": len(health_latencies) / elapsed,
+        "health_p50_ms": percentile(health_latencies, 50) * 1000,
+        "health_p99_ms": percentile(health_latencies, 99) * 1000,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": max(lags, default=0.0) * 1000,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--auth-clients", type=int, default=16)
+    parser.add_argument("--public-clients", type=int, default=4)
+    parser.add_argument("--tokens", type=int, default=5000, help="tokens pre-generados por escenario")
+    args = parser.parse_args()
+
+    factory = TokenFactory()
+    install_jwks(main, factory.jwks)
+
+    print(f"{'offload':<8} {'auth/s':>8} {'health/s':>9} {'health p50':>11} {'health p99':>11} {'lag p99':>8} {'lag max':>8}")
+    for offload in (True, False):
+        tokens = [factory.mint(username=f"user-{i}") for i in range(args.tokens)]
+        result = asyncio.run(run_scenario(offload, tokens, args))
+        print(
+            f"{str(result['offload']):<8} {result['auth_rps']:>8.0f} {result['health_rps']:>9.0f} "
+            f"{result['health_p50_ms']:>9.2f}ms {result['health_p99_ms']:>9.2f}ms "
+            f"{result['lag_p99_ms']:>6.2f}ms {result['lag_max_ms']:>6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,110 @@
+"""
+Benchmark del fast path de probes y métricas
+============================================
+
+Llama a la app ASGI directamente (sin cliente HTTP ni red, para que solo se
+mida el servidor) y compara, por path, el coste por request:
+
+- fastapi    la pila de la app sin FastPathMiddleware: CORS, access log,
+             routing, dependencias y serialización JSON
+- fast path  la app tal como se despliega: FastPathMiddleware responde con
+             bytes precalculados
+
+Uso (desde fast-api-app/):
+    python benchmarks/bench_fast_path.py [--requests 20000]
+"""
+
+import argparse
+import asyncio
+import time
+
+from common import percentile
+
+import main  # noqa: E402
+from fast_path import FastPathMiddleware  # noqa: E402
+
+PATHS = ["/health", "/health/live", "/health/ready", "/metrics"]
+
+
+def scope_for(path: str) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"user-agent", b"kube-probe/1.29")],
+        "client": ("10.0.0.1", 40000),
+        "server": ("10.0.0.2", 8000),
+        "app": main.app,
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def measure(app, path: str, requests: int) -> dict:
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    scope = scope_for(path)
+    for _ in range(min(200, requests)):
+        await app(dict(scope), receive, send)
+    latencies = []
+    for _ in range(requests):
+        request_scope = dict(scope)
+        start = time.perf_counter()
+        await app(request_scope, receive, send)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "status": status[-1],
+        "mean_us": sum(latencies) / len(latencies) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+    }
+
+
+def stack_without_fast_path():
+    """La pila de middlewares de la app sin FastPathMiddleware"""
+    saved = main.app.user_middleware
+    main.app.user_middleware = [m for m in saved if m.cls is not FastPathMiddleware]
+    try:
+        return main.app.build_middleware_stack()
+    finally:
+        main.app.user_middleware = saved
+
+
+async def run(requests: int) -> None:
+    # Réplica ya lista: /health/ready responde 200 en ambos casos
+    main.warmup_state.update(done=True, duration_ms=0.0)
+    slow = stack_without_fast_path()
+    fast = main.app.build_middleware_stack()
+
+    print(f"{'path':<15} {'fastapi':>10} {'fast path':>10} {'ahorro':>9} {'p99 fastapi':>12} {'p99 fast':>9}")
+    for path in PATHS:
+        baseline = await measure(slow, path, requests)
+        optimized = await measure(fast, path, requests)
+        assert baseline["status"] == optimized["status"], (path, baseline["status"], optimized["status"])
+        print(
+            f"{path:<15} {baseline['mean_us']:>8.1f}us {optimized['mean_us']:>8.1f}us "
+            f"{baseline['mean_us'] - optimized['mean_us']:>7.1f}us "
+            f"{baseline['p99_us']:>10.1f}us {optimized['p99_us']:>7.1f}us"
+        )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,69 @@
+"""
+Benchmark del ledger de compras: fsync por compra vs group commit
+=================================================================
+
+Lanza compras concurrentes contra PurchaseLedger en un directorio temporal
+y compara el throughput con distintas ventanas de group commit. Con
+--concurrency 1 cada compra paga su propio fsync (el caso ingenuo).
+
+Uso (desde fast-api-app/):
+    python benchmarks/bench_ledger.py [--purchases 2000] [--concurrency 1 16 64] [--windows 0 2]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from purchase_ledger import PurchaseLedger  # noqa: E402
+
+
+async def run_case(purchases: int, concurrency: int, window_ms: float) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = PurchaseLedger(directory, commit_window=window_ms / 1000)
+        ledger.replay()
+        await ledger.start()
+        next_id = iter(range(purchases))
+
+        async def buyer(n: int):
+            for item_id in next_id:
+                await ledger.append(item_id, f"user-{n}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(buyer(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        await ledger.close()
+
+        replay_start = time.perf_counter()
+        restored = PurchaseLedger(directory).replay()
+        replay_ms = (time.perf_counter() - replay_start) * 1000
+        assert len(restored) == purchases
+
+        return {
+            "purchases_per_s": purchases / elapsed,
+            "fsyncs": ledger.commits,
+            "replay_ms": replay_ms,
+        }
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{'concurrency':>11} {'window':>8} {'purchases/s':>12} {'fsyncs':>7} {'replay':>9}")
+    for concurrency in args.concurrency:
+        for window in args.windows:
+            r = await run_case(args.purchases, concurrency, window)
+            print(
+                f"{concurrency:>11} {window:>6.1f}ms {r['purchases_per_s']:>12.0f} "
+                f"{r['fsyncs']:>7} {r['replay_ms']:>7.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""
+Benchmark de asignaciones: Principal vs UserInfo
+================================================
+
+Compara la memoria asignada por request al construir el usuario actual
+desde un payload ya decodificado:
+
+- antes: modelo Pydantic UserInfo (validación + lista nueva de roles)
+- ahora: Principal inmutable con tupla de roles internada
+
+Uso (desde fast-api-app/):
+    python benchmarks/bench_principal.py [--iterations 20000]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import Principal, UserInfo  # noqa: E402
+
+PAYLOAD = {
+    "sub": "6f1c2a9e-1111-4c2b-9a55-0c1d2e3f4a5b",
+    "preferred_username": "demo-user",
+    "email": "demo-user@example.com",
+    "name": "Demo User",
+    "realm_access": {"roles": ["user", "offline_access", "uma_authorization"]},
+}
+
+
+def build_user_info(payload):
+    return UserInfo(
+        username=payload.get("preferred_username", "unknown"),
+        email=payload.get("email"),
+        name=payload.get("name"),
+        roles=payload.get("realm_access", {}).get("roles", []),
+        sub=payload.get("sub"),
+    )
+
+
+def build_principal(payload):
+    return Principal.from_claims(payload)
+
+
+def measure(builder, iterations: int):
+    """Devuelve (bytes asignados por request, µs por request)"""
+    # Calentamiento para no contar cachés de primera llamada
+    for _ in range(100):
+        builder(PAYLOAD)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [builder(PAYLOAD) for _ in range(iterations)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del keep
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        builder(PAYLOAD)
+    elapsed = time.perf_counter() - start
+    return allocated / iterations, elapsed / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'builder':<12} {'bytes/req':>10} {'us/req':>8}")
+    for name, builder in (("UserInfo", build_user_info), ("Principal", build_principal)):
+        per_req, us = measure(builder, args.iterations)
+        print(f"{name:<12} {per_req:>10.1f} {us:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark del prefiltro de tokens
+=================================
+
+Mide cuánto cuesta rechazar cada tipo de token inválido con decode_token y
+lo compara con la verificación completa de un token válido (carga de
+claves + firma), que es lo que pagaba cualquier token con "iss" de
+confianza antes de que se comprobara si estaba expirado o era basura:
+
+- basura          sin tres segmentos
+- demasiado grande  por encima de TOKEN_MAX_SIZE
+- alg none        header con un algoritmo fuera de la allowlist
+- otro emisor     "iss" que no es de confianza
+- expirado        firma válida pero exp en el pasado
+- firma falsa     repetido: tras el primer rechazo sale de la caché negativa
+
+Uso (desde fast-api-app/):
+    python benchmarks/bench_token_prefilter.py [--requests 20000]
+"""
+
+import argparse
+import json
+import time
+
+from common import TokenFactory, b64url, install_jwks, percentile
+
+import main  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+
+def measure(token: str, requests: int) -> dict:
+    latencies = []
+    outcome = "ok"
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            main.decode_token(token)
+        except HTTPException as e:
+            outcome = e.headers["WWW-Authenticate"].rsplit("=", 1)[-1].strip('"')
+        latencies.append(time.perf_counter() - start)
+    return {
+        "outcome": outcome,
+        "mean_us": sum(latencies) / len(latencies) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+    }
+
+
+def run(requests: int) -> None:
+    factory = TokenFactory()
+    install_jwks(main, factory.jwks)
+    valid = factory.mint()
+    header, payload, signature = valid.split(".")
+    forged_signature = ("A" if signature[0] != "A" else "B") + signature[1:]
+
+    cases = [
+        ("basura", "not-a-jwt"),
+        ("demasiado grande", "a." * (main.TOKEN_MAX_SIZE // 2) + "b"),
+        ("alg none", f"{b64url(json.dumps({'alg': 'none', 'kid': factory.kid}).encode())}.{payload}."),
+        ("otro emisor", TokenFactory(issuer="https://attacker.example/realms/x").mint()),
+        ("expirado", factory.mint(lifetime=-60)),
+        ("firma falsa", f"{header}.{payload}.{forged_signature}"),
+    ]
+
+    # Referencia: un token válido distinto en cada request (sin caché de tokens verificados)
+    tokens = [factory.mint() for _ in range(min(requests, 2000))]
+    latencies = []
+    for token in tokens:
+        start = time.perf_counter()
+        main.decode_token(token)
+        latencies.append(time.perf_counter() - start)
+    reference = sum(latencies) / len(latencies) * 1e6
+
+    print(f"{'token':<18} {'motivo':<16} {'media':>9} {'p99':>9} {'vs firma':>9}")
+    print(f"{'válido (firma)':<18} {'-':<16} {reference:>7.1f}us {percentile(latencies, 99) * 1e6:>7.1f}us {'1.0x':>9}")
+    for name, token in cases:
+        result = measure(token, requests)
+        print(
+            f"{name:<18} {result['outcome']:<16} {result['mean_us']:>7.1f}us {result['p99_us']:>7.1f}us "
+            f"{reference / result['mean_us']:>8.0f}x"
+        )
+    stats = main.token_prefilter.stats()
+    print(f"\nCaché negativa: {stats['cache_hits']} aciertos, {stats['cache_entries']} entradas")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    run(args.requests)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,61 @@
+"""
+Benchmark de verificación de firma: python-jose vs JWTVerifier
+==============================================================
+
+Compara, por token, el coste de:
+
+- la ruta anterior de decode_token: jose.jwt.decode con el JWK en dict
+  (la clave RSA se reconstruye en cada llamada)
+- JWTVerifier (jwt_verifier.py) con la clave construida una vez por kid,
+  para RS256, PS256, ES256 y EdDSA
+
+Uso (desde fast-api-app/):
+    python benchmarks/bench_verifier.py [--iterations 2000]
+"""
+
+import argparse
+import time
+
+from jose import jwt
+
+from common import TokenFactory
+
+from jwt_verifier import JWTVerifier  # noqa: E402
+
+
+def jose_decode(jwk, token):
+    return jwt.decode(token, jwk, algorithms=["RS256"], options={"verify_aud": False})
+
+
+def timed(fn, tokens) -> float:
+    """µs por token"""
+    start = time.perf_counter()
+    for token in tokens:
+        fn(token)
+    return (time.perf_counter() - start) / len(tokens) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    rsa_factory = TokenFactory(kid="rsa", alg="RS256")
+    tokens = [rsa_factory.mint(username=f"user-{i}") for i in range(args.iterations)]
+    rows.append(("RS256", "python-jose", timed(lambda t: jose_decode(rsa_factory.jwk, t), tokens)))
+
+    for alg in ("RS256", "PS256", "ES256", "EdDSA"):
+        factory = rsa_factory if alg == "RS256" else TokenFactory(kid=alg.lower(), alg=alg)
+        verifier = JWTVerifier()
+        verifier.load_jwks(factory.jwks)
+        alg_tokens = tokens if alg == "RS256" else [factory.mint(username=f"user-{i}") for i in range(args.iterations)]
+        rows.append((alg, "JWTVerifier", timed(verifier.verify, alg_tokens)))
+
+    print(f"{'alg':<7} {'engine':<12} {'us/token':>9} {'tokens/s':>9}")
+    for alg, engine, us in rows:
+        print(f"{alg:<7} {engine:<12} {us:>9.1f} {1e6 / us:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Utilidades compartidas por los benchmarks
+=========================================
+
+Generan claves locales y tokens firmados con la forma de los de Keycloak,
+y sustituyen la descarga de discovery/JWKS de main.py para que los benchmarks corran
+en proceso sin un Keycloak levantado.
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+ISSUER = "http://localhost:8080/realms/demo-app"
+
+
+def b64url(raw: bytes) -> str:
+    """Codifica bytes como base64url sin padding"""
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def b64url_uint(value: int) -> str:
+    """Codifica un entero como base64url sin padding (formato JWK)"""
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+class TokenFactory:
+    """Emite tokens firmados con una clave generada en local (RS256, PS256, ES256 o EdDSA)"""
+
+    def __init__(self, kid: str = "bench-rsa", issuer: str = ISSUER, alg: str = "RS256"):
+        self.kid = kid
+        self.issuer = issuer
+        self.alg = alg
+        self.jwk = {"kid": kid, "use": "sig", "alg": alg}
+        if alg in ("RS256", "PS256"):
+            self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            numbers = self._private_key.public_key().public_numbers()
+            self.jwk.update(kty="RSA", n=b64url_uint(numbers.n), e=b64url_uint(numbers.e))
+        elif alg == "ES256":
+            self._private_key = ec.generate_private_key(ec.SECP256R1())
+            numbers = self._private_key.public_key().public_numbers()
+            self.jwk.update(kty="EC", crv="P-256", x=b64url(numbers.x.to_bytes(32, "big")), y=b64url(numbers.y.to_bytes(32, "big")))
+        elif alg == "EdDSA":
+            self._private_key = ed25519.Ed25519PrivateKey.generate()
+            raw = self._private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+            self.jwk.update(kty="OKP", crv="Ed25519", x=b64url(raw))
+        else:
+            raise ValueError(f"Algoritmo no soportado: {alg}")
+
+    @property
+    def jwks(self) -> Dict[str, Any]:
+        return {"keys": [self.jwk]}
+
+    def claims(
+        self,
+        username: str = "demo-user",
+        roles: Iterable[str] = ("user",),
+        lifetime: int = 300,
+        sub: Optional[str] = None,
+        **extra: Any,
+    ) -> Dict[str, Any]:
+        now = int(time.time())
+        claims = {
+            "exp": now + lifetime,
+            "iat": now,
+            "jti": str(uuid.uuid4()),
+            "iss": self.issuer,
+            "aud": "account",
+            "sub": sub or str(uuid.uuid5(uuid.NAMESPACE_DNS, username)),
+            "typ": "Bearer",
+            "azp": "demo-app-frontend",
+            "sid": str(uuid.uuid4()),
+            "preferred_username": username,
+            "email": f"{username}@example.com",
+            "name": username.replace("-", " ").title(),
+            "realm_access": {"roles": list(roles)},
+        }
+        claims.update(extra)
+        return claims
+
+    def sign(self, claims: Dict[str, Any]) -> str:
+        # Firma directa con cryptography: jose.jwt.encode re-parsea la clave
+        # privada en cada llamada y domina el tiempo de preparación
+        header = b64url(json.dumps({"alg": self.alg, "typ": "JWT", "kid": self.kid}).encode())
+        payload = b64url(json.dumps(claims, separators=(",", ":")).encode())
+        signing_input = f"{header}.{payload}".encode()
+        if self.alg == "RS256":
+            signature = self._private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        elif self.alg == "PS256":
+            pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH)
+            signature = self._private_key.sign(signing_input, pss, hashes.SHA256())
+        elif self.alg == "ES256":
+            r, s = decode_dss_signature(self._private_key.sign(signing_input, ec.ECDSA(hashes.SHA256())))
+            signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        else:
+            signature = self._private_key.sign(signing_input)
+        return f"{header}.{payload}.{b64url(signature)}"
+
+    def mint(self, **kwargs: Any) -> str:
+        return self.sign(self.claims(**kwargs))
+
+
+def install_jwks(main_module, jwks: Dict[str, Any], issuer: str = ISSUER) -> None:
+    """Hace que main.py use un JWKS local para el emisor en lugar de llamar a Keycloak"""
+    main_module.issuer_registry.fetch_json = lambda url: jwks
+    main_module.issuer_registry.load_jwks(issuer, jwks)
+
+
+def percentile(values, pct: float) -> float:
+    """Percentil por vecino más cercano (suficiente para informes de benchmark)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,358 @@
+"""
+Replay de tráfico capturado, acelerado
+======================================
+
+Reproduce una captura de TrafficCaptureMiddleware (CAPTURE_OUTPUT, JSON
+lines o gzip) contra la app, con un Keycloak sustituto local:
+
+- Cada request sale en su instante original dividido por --speed (1, 10,
+  100...): se mantienen las distribuciones de llegada, comprimidas
+- Las requests de cada usuario (seudónimo) van en orden y de una en una,
+  como en la sesión original; las anónimas no esperan a nadie
+- Las credenciales redactadas se regeneran: cada seudónimo pasa a ser el
+  usuario replay-<seudónimo>, que hace /login y /refresh contra el sustituto
+  y usa sus propios tokens. Si la captura empieza a mitad de sesión, el
+  token se pide directamente al sustituto. Un login que falló en la captura
+  se repite con una contraseña incorrecta
+- Roles: admin para los usuarios que en la captura pasaron por /admin
+
+Las sesiones con cookie BFF se reproducen con bearer (el flujo del
+navegador no se puede repetir sin él).
+
+El sustituto de Keycloak sirve discovery, JWKS, token (password y
+refresh_token), userinfo y logout. Sin --url la app corre en proceso (ASGI,
+sin red) ya apuntando a él; con --url hay que arrancar la app con
+KEYCLOAK_URL y KEYCLOAK_ISSUER_URL igual a la URL que se imprime.
+
+Uso (desde fast-api-app/):
+    python benchmarks/replay.py capture.jsonl [--speed 10] [--url http://localhost:8000] [--keycloak-port 8180]
+"""
+
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode
+
+import httpx
+
+from common import TokenFactory, percentile
+
+REDACTED = "<redacted>"
+WRONG_PASSWORD = "replay-wrong-password"
+
+
+def load_capture(path: str) -> List[Dict[str, Any]]:
+    """Registros "request" de la captura, en orden de llegada"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+    records = []
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if record.get("type") == "request":
+            records.append(record)
+    records.sort(key=lambda record: record["started_at"])
+    return records
+
+
+class KeycloakStandIn:
+    """Keycloak mínimo en un hilo: tokens firmados con una clave local"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, realm: str = "demo-app", lifetime: int = 300):
+        self.realm = realm
+        self.lifetime = lifetime
+        self.roles: Dict[str, Tuple[str, ...]] = {}
+        self.token_requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_port}"
+        self.factory = TokenFactory(issuer=self.issuer)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def issuer(self) -> str:
+        return f"{self.base_url}/realms/{self.realm}"
+
+    @property
+    def token_url(self) -> str:
+        return f"{self.issuer}/protocol/openid-connect/token"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="keycloak-stand-in", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def issue(self, username: str) -> Dict[str, Any]:
+        """Respuesta del token endpoint para username"""
+        self.token_requests += 1
+        claims = self.factory.claims(username=username, roles=self.roles.get(username, ("user",)), lifetime=self.lifetime)
+        return {
+            "access_token": self.factory.sign(claims),
+            "refresh_token": f"replay-rt.{username}.{self.token_requests}",
+            "token_type": "Bearer",
+            "expires_in": self.lifetime,
+            "refresh_expires_in": 1800,
+        }
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _json(self, status: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                prefix = f"/realms/{stand_in.realm}"
+                if self.path == f"{prefix}/.well-known/openid-configuration":
+                    self._json(200, {
+                        "issuer": stand_in.issuer,
+                        "jwks_uri": f"{stand_in.issuer}/protocol/openid-connect/certs",
+                        "token_endpoint": stand_in.token_url,
+                        "userinfo_endpoint": f"{stand_in.issuer}/protocol/openid-connect/userinfo",
+                    })
+                elif self.path == f"{prefix}/protocol/openid-connect/certs":
+                    self._json(200, stand_in.factory.jwks)
+                elif self.path == f"{prefix}/protocol/openid-connect/userinfo":
+                    token = self.headers.get("Authorization", "").partition(" ")[2]
+                    try:
+                        segment = token.split(".")[1]
+                        payload = json.loads(base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4)))
+                    except (IndexError, ValueError):
+                        self._json(401, {"error": "invalid_token"})
+                        return
+                    self._json(200, {name: payload.get(name) for name in ("sub", "preferred_username", "email", "name")})
+                else:
+                    self._json(404, {"error": "not_found"})
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                form = {name: values[0] for name, values in parse_qs(self.rfile.read(length).decode()).items()}
+                if self.path.endswith("/logout"):
+                    self.send_response(204)
+                    self.end_headers()
+                    return
+                if not self.path.endswith("/token"):
+                    self._json(404, {"error": "not_found"})
+                    return
+                grant = form.get("grant_type")
+                if grant == "password" and form.get("password") != WRONG_PASSWORD:
+                    self._json(200, stand_in.issue(form.get("username", "")))
+                elif grant == "refresh_token" and form.get("refresh_token", "").startswith("replay-rt."):
+                    self._json(200, stand_in.issue(form["refresh_token"].split(".")[1]))
+                else:
+                    self._json(401, {"error": "invalid_grant"})
+
+        return Handler
+
+
+@dataclass
+class ReplayUser:
+    username: str
+    access_token: Optional[str] = None
+    refresh_token: Optional[str] = None
+
+
+@dataclass
+class ReplayResult:
+    route: str
+    captured_status: int
+    status: int
+    latency: float
+    lag: float
+
+
+@dataclass
+class Replayer:
+    client: httpx.AsyncClient
+    stand_in: KeycloakStandIn
+    speed: float = 1.0
+    results: List[ReplayResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def _token(self, user: ReplayUser) -> str:
+        if user.access_token is None:
+            self._store(user, self.stand_in.issue(user.username))
+        return user.access_token
+
+    @staticmethod
+    def _store(user: ReplayUser, token_data: Dict[str, Any]) -> None:
+        user.access_token = token_data.get("access_token", user.access_token)
+        user.refresh_token = token_data.get("refresh_token", user.refresh_token)
+
+    def _fill(self, value: Any, name: str, user: Optional[ReplayUser], record: Dict[str, Any]) -> Any:
+        """Sustituye un valor redactado o seudonimizado por uno válido para el replay"""
+        if name == "username" and user is not None:
+            return user.username
+        if value != REDACTED and not (isinstance(value, list) and REDACTED in value):
+            return value
+        if name == "password":
+            return WRONG_PASSWORD if record["status"] == 401 else "replay"
+        if name == "refresh_token":
+            # /refresh va sin bearer: si no se sabe de quién era, uno nuevo
+            if user is None:
+                return self.stand_in.issue("replay-anonymous")["refresh_token"]
+            if user.refresh_token is None:
+                self._store(user, self.stand_in.issue(user.username))
+            return user.refresh_token
+        if name == "tokens" and isinstance(value, list):
+            return [self.stand_in.issue(user.username if user else "replay-anonymous")["access_token"] for _ in value]
+        return None
+
+    def build(self, record: Dict[str, Any], user: Optional[ReplayUser]) -> Dict[str, Any]:
+        """Argumentos de client.request() para el registro"""
+        request: Dict[str, Any] = {"method": record["method"], "url": record["path"], "headers": {}}
+        if record.get("query"):
+            query = {name: self._fill(value, name, user, record) for name, value in record["query"].items()}
+            request["url"] += "?" + urlencode({name: value for name, value in query.items() if value is not None})
+        body = record.get("body")
+        if isinstance(body, dict):
+            body = {name: self._fill(value, name, user, record) for name, value in body.items()}
+            body = {name: value for name, value in body.items() if value is not None}
+            if record.get("body_type") == "form":
+                request["data"] = body
+            else:
+                request["json"] = body
+        if record.get("auth") in ("bearer", "cookie") and user is not None:
+            request["headers"]["Authorization"] = f"Bearer {self._token(user)}"
+        return request
+
+    async def send(self, record: Dict[str, Any], user: Optional[ReplayUser], scheduled: float) -> None:
+        lag = time.perf_counter() - scheduled
+        start = time.perf_counter()
+        response = await self.client.request(**self.build(record, user))
+        latency = time.perf_counter() - start
+        if user is not None and record["path"] in ("/login", "/refresh") and response.status_code == 200:
+            self._store(user, response.json())
+        self.results.append(ReplayResult(record.get("route") or record["path"], record["status"], response.status_code, latency, lag))
+
+    async def replay_session(self, records: List[Dict[str, Any]], user: Optional[ReplayUser], t0: float, start: float) -> None:
+        """Las requests de un usuario, en orden y cada una no antes de su instante"""
+        for record in records:
+            scheduled = start + (record["started_at"] - t0) / self.speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self.send(record, user, scheduled)
+
+    async def run(self, records: List[Dict[str, Any]]) -> None:
+        """Reproduce la captura; la duración queda en elapsed"""
+        sessions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        anonymous = []
+        for record in records:
+            if record.get("user"):
+                sessions[record["user"]].append(record)
+            else:
+                anonymous.append(record)
+        for pseudonym, session in sessions.items():
+            if any(record["path"].startswith("/admin") and record["status"] < 400 for record in session):
+                self.stand_in.roles[f"replay-{pseudonym}"] = ("admin", "user")
+
+        t0 = records[0]["started_at"]
+        start = time.perf_counter()
+        tasks = [
+            self.replay_session(session, ReplayUser(f"replay-{pseudonym}"), t0, start)
+            for pseudonym, session in sessions.items()
+        ]
+        # Las anónimas no dependen entre sí: una tarea por request
+        tasks += [self.replay_session([record], None, t0, start) for record in anonymous]
+        await asyncio.gather(*tasks)
+        self.elapsed = time.perf_counter() - start
+
+
+def report(results: List[ReplayResult], captured_span: float, elapsed: float, speed: float) -> None:
+    by_route: Dict[str, List[ReplayResult]] = defaultdict(list)
+    for result in results:
+        by_route[result.route].append(result)
+
+    print(f"{len(results)} requests en {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):.0f} req/s); "
+          f"capturadas en {captured_span:.2f}s, speed {speed:g}x")
+    print(f"{'ruta':<28} {'n':>6} {'p50':>9} {'p99':>9} {'=status':>8}")
+    for route, rows in sorted(by_route.items(), key=lambda item: -len(item[1])):
+        latencies = [row.latency for row in rows]
+        matched = sum(row.status == row.captured_status for row in rows) / len(rows)
+        print(f"{route:<28} {len(rows):>6} {percentile(latencies, 50) * 1000:>7.2f}ms "
+              f"{percentile(latencies, 99) * 1000:>7.2f}ms {matched:>7.0%}")
+    lags = [result.lag for result in results]
+    print(f"retraso sobre el instante programado: p50 {percentile(lags, 50) * 1000:.2f}ms  "
+          f"p99 {percentile(lags, 99) * 1000:.2f}ms")
+
+
+async def replay_in_process(records: List[Dict[str, Any]], stand_in: KeycloakStandIn, speed: float) -> Replayer:
+    # main.py lee la configuración de Keycloak al importarse
+    os.environ.update(
+        KEYCLOAK_URL=stand_in.base_url,
+        KEYCLOAK_ISSUER_URL=stand_in.base_url,
+        KEYCLOAK_REALM=stand_in.realm,
+        TRUSTED_REALMS=stand_in.realm,
+    )
+    import main  # noqa: E402
+
+    # Sin ledger (el catálogo empieza sin vender, como en la captura)
+    main.purchase_ledger = None
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+        replayer = Replayer(client, stand_in, speed)
+        await replayer.run(records)
+    return replayer
+
+
+async def replay_remote(records: List[Dict[str, Any]], stand_in: KeycloakStandIn, speed: float, url: str) -> Replayer:
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        replayer = Replayer(client, stand_in, speed)
+        await replayer.run(records)
+    return replayer
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="fichero de CAPTURE_OUTPUT (JSON lines, opcionalmente gzip)")
+    parser.add_argument("--speed", type=float, default=1.0, help="factor de aceleración (1, 10, 100...)")
+    parser.add_argument("--url", help="app ya arrancada; sin --url corre en proceso")
+    parser.add_argument("--keycloak-port", type=int, default=0, help="puerto del Keycloak sustituto (0 = libre)")
+    parser.add_argument("--realm", default="demo-app")
+    args = parser.parse_args()
+
+    records = load_capture(args.capture)
+    if not records:
+        parser.error("La captura no tiene requests")
+    stand_in = KeycloakStandIn(port=args.keycloak_port, realm=args.realm)
+    stand_in.start()
+    try:
+        if args.url:
+            print(f"Keycloak sustituto en {stand_in.base_url}: arrancar la app con "
+                  f"KEYCLOAK_URL={stand_in.base_url} KEYCLOAK_ISSUER_URL={stand_in.base_url} KEYCLOAK_REALM={args.realm}")
+            replayer = asyncio.run(replay_remote(records, stand_in, args.speed, args.url))
+        else:
+            replayer = asyncio.run(replay_in_process(records, stand_in, args.speed))
+    finally:
+        stand_in.close()
+    span = records[-1]["started_at"] - records[0]["started_at"]
+    report(replayer.results, span, replayer.elapsed, args.speed)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,246 @@
+"""
+Suite de microbenchmarks de los hot paths de main.py
+====================================================
+
+Corre en proceso: las rutas se llaman a través de un cliente ASGI (httpx,
+sin red) y los tokens se firman con una clave RSA local, así que no hace
+falta Keycloak.
+
+Casos:
+- decode_token              verificación completa (firma + claims)
+- get_current_user[cold]    dependency sin acierto en la caché de tokens
+- get_current_user[cached]  dependency con el token ya verificado
+- require_role              comprobación de rol sobre un Principal
+- GET /items                catálogo público, con N items (cuerpo cacheado)
+- GET /items[304]           revalidación con If-None-Match
+- GET /my-items             items del usuario, con N items (10% suyos)
+- POST /items/{id}/buy      compra, con N items
+
+Uso (desde fast-api-app/):
+    python benchmarks/suite.py run [--output results.json] [--sizes 10 1000 10000]
+    python benchmarks/suite.py compare benchmarks/baseline.json [results.json] [--threshold 0.25]
+
+compare ejecuta la suite si no se le pasa un fichero de resultados, y sale
+con código 1 si algún caso es más lento que la baseline por encima del
+umbral. Se compara el mínimo de las rondas (el ruido del sistema solo suma
+tiempo, así que el mínimo es lo más estable) y además tiene que quedar por
+encima del p95 de la baseline: una diferencia dentro de la dispersión que
+ya tenía la baseline no cuenta como regresión.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+from fastapi.security import HTTPAuthorizationCredentials
+
+from common import TokenFactory, install_jwks
+
+import main  # noqa: E402
+
+DEFAULT_SIZES = [10, 1000, 10000]
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def load_items(size: int, owner: str = "", owned_ratio: float = 0.0) -> None:
+    """Sustituye el catálogo simulado por `size` items; una fracción queda a nombre de owner"""
+    owned_every = int(1 / owned_ratio) if owned_ratio else 0
+    main.fake_items_db[:] = [
+        {
+            "id": i,
+            "name": f"Item {i}",
+            "price": round(1 + i * 0.01, 2),
+            "owner": owner if owned_every and i % owned_every == 0 else None,
+        }
+        for i in range(1, size + 1)
+    ]
+    main.index_items()
+
+
+async def measure(fn: Callable[[], Awaitable[Any]], rounds: int, per_round: int) -> Dict[str, float]:
+    """Mínimo, mediana y p95 (µs/op) sobre las medias de cada ronda"""
+    for _ in range(max(1, per_round // 5)):
+        await fn()
+    samples: List[float] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(per_round):
+            await fn()
+        samples.append((time.perf_counter() - start) / per_round * 1e6)
+    samples.sort()
+    return {
+        "min_us": round(samples[0], 3),
+        "median_us": round(statistics.median(samples), 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "ops_per_s": round(1e6 / statistics.median(samples), 1),
+    }
+
+
+async def run_suite(sizes: List[int], rounds: int, per_round: int) -> Dict[str, Dict[str, float]]:
+    factory = TokenFactory()
+    install_jwks(main, factory.jwks)
+    # Sin ledger: se mide la ruta en memoria (el coste del disco lo mide bench_ledger.py)
+    main.purchase_ledger = None
+    token = factory.mint(username="bench-user", roles=("user", "admin"))
+    headers = {"Authorization": f"Bearer {token}"}
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    results: Dict[str, Dict[str, float]] = {}
+
+    async def decode():
+        main.decode_token(token)
+
+    async def current_user_cold():
+        main._token_cache.pop(token, None)
+        await main.get_current_user(credentials)
+
+    async def current_user_cached():
+        await main.get_current_user(credentials)
+
+    principal = await main.get_current_user(credentials)
+    role_checker = main.require_role(["admin"])
+
+    async def role_check():
+        await role_checker(principal)
+
+    results["decode_token"] = await measure(decode, rounds, per_round)
+    results["get_current_user[cold]"] = await measure(current_user_cold, rounds, per_round)
+    results["get_current_user[cached]"] = await measure(current_user_cached, rounds, per_round * 10)
+    results["require_role"] = await measure(role_check, rounds, per_round * 10)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for size in sizes:
+            # Las rutas de datos escalan con el catálogo: menos iteraciones cuanto mayor
+            n = max(10, min(per_round, per_round * 100 // size))
+
+            load_items(size)
+
+            async def list_items():
+                response = await client.get("/items")
+                assert response.status_code == 200
+
+            results[f"GET /items[n={size}]"] = await measure(list_items, rounds, n)
+
+            etag = (await client.get("/items")).headers["etag"]
+
+            async def list_items_not_modified():
+                response = await client.get("/items", headers={"If-None-Match": etag})
+                assert response.status_code == 304
+
+            results[f"GET /items[304,n={size}]"] = await measure(list_items_not_modified, rounds, per_round)
+
+            load_items(size, owner="bench-user", owned_ratio=0.1)
+
+            async def my_items():
+                response = await client.get("/my-items", headers=headers)
+                assert response.status_code == 200
+
+            results[f"GET /my-items[n={size}]"] = await measure(my_items, rounds, n)
+
+            # Compra del último item (peor caso de búsqueda); se libera tras cada compra
+            load_items(size)
+            last = main.fake_items_db[-1]
+
+            async def buy():
+                response = await client.post(f"/items/{size}/buy", headers=headers)
+                assert response.status_code == 200, response.text
+                last["owner"] = None
+                main.catalog_cache.bump()
+
+            results[f"POST /items/{{id}}/buy[n={size}]"] = await measure(buy, rounds, n)
+
+    return results
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results = asyncio.run(run_suite(args.sizes, args.rounds, args.per_round))
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": args.sizes,
+            "rounds": args.rounds,
+            "per_round": args.per_round,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> bool:
+    """
+    Imprime la comparación y devuelve True si hay regresiones
+
+    Compara mínimos (baselines antiguas sin min_us: medianas). Un caso es
+    regresión si supera el umbral y además su mínimo queda por encima del p95
+    de la baseline.
+    """
+    regressions = False
+    print(f"{'case (min)':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+    for case, base in baseline["results"].items():
+        now = current["results"].get(case)
+        key = "min_us" if "min_us" in base else "median_us"
+        if now is None:
+            print(f"{case:<34} {base[key]:>8.1f}us {'-':>10} {'missing':>8}")
+            continue
+        change = now[key] / base[key] - 1
+        flag = ""
+        if change > threshold and now[key] > base["p95_us"]:
+            flag = "  REGRESSION"
+            regressions = True
+        print(f"{case:<34} {base[key]:>8.1f}us {now[key]:>8.1f}us {change:>+7.1%}{flag}")
+    for case in current["results"].keys() - baseline["results"].keys():
+        print(f"{case:<34} {'-':>10} {current['results'][case]['min_us']:>8.1f}us {'new':>8}")
+    return regressions
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Ejecutar la suite")
+    run_parser.add_argument("--output", help="Fichero JSON de resultados (por defecto stdout)")
+
+    compare_parser = sub.add_parser("compare", help="Comparar con una baseline")
+    compare_parser.add_argument("baseline", nargs="?", default=BASELINE_PATH)
+    compare_parser.add_argument("current", nargs="?", help="Resultados ya generados (si no, se ejecuta la suite)")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="Regresión relativa tolerada (0.25 = 25%%)")
+
+    for p in (run_parser, compare_parser):
+        p.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+        p.add_argument("--rounds", type=int, default=20)
+        p.add_argument("--per-round", type=int, default=200)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        data = run(args)
+        text = json.dumps(data, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+    return 1 if compare(baseline, current, args.threshold) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
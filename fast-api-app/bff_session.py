@@ -0,0 +1,190 @@
+"""
+Sesiones BFF en cookies cifradas
+================================
+
+En modo backend-for-frontend el navegador nunca ve los tokens: el backend
+hace el Authorization Code Flow con PKCE y guarda el token set en una
+cookie HttpOnly cifrada con AES-GCM.
+
+- Sin almacén de sesiones en el servidor: cualquier réplica con la misma
+  clave descifra la cookie, así que escala horizontalmente sin más
+- Autenticar una request es descifrar (simétrico) y comprobar la
+  expiración; la firma RSA del access token solo se verifica al emitirlo
+  (login y cada refresh)
+- El valor se comprime antes de cifrarse y, si aun así supera el límite de
+  ~4 KB por cookie, se reparte en varias (<nombre>.0, <nombre>.1, ...)
+- Varias claves: se cifra con la primera y se descifra con cualquiera, para
+  rotarlas sin cerrar las sesiones abiertas
+- El nombre de la cookie va como dato asociado de AES-GCM: una cookie de
+  flujo de login no se acepta como cookie de sesión ni al revés
+"""
+
+import base64
+import hashlib
+import json
+import os
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from starlette.responses import Response
+
+# Claims que se guardan en la sesión (los necesarios para Principal y la denylist).
+# iat y jti son de la denylist: sin iat, un logout por sub rechazaría también
+# las sesiones abiertas después; sin jti no se podría revocar un token concreto
+SESSION_CLAIMS = ("sub", "preferred_username", "email", "name", "realm_access", "sid", "iss", "exp", "iat", "jti")
+
+_NONCE_SIZE = 12
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def pkce_pair() -> Tuple[str, str]:
+    """(code_verifier, code_challenge S256) según RFC 7636"""
+    verifier = _b64encode(os.urandom(32))
+    challenge = _b64encode(hashlib.sha256(verifier.encode()).digest())
+    return verifier, challenge
+
+
+def random_token() -> str:
+    """Valor aleatorio para state y nonce"""
+    return _b64encode(os.urandom(16))
+
+
+class CookieCipher:
+    """Cifrado AES-GCM de valores JSON para cookies, con rotación de claves"""
+
+    def __init__(self, secrets: List[str]):
+        if not secrets:
+            raise ValueError("Se necesita al menos un secreto")
+        # Los secretos deben ser de alta entropía (p.ej. openssl rand -hex 32)
+        self._keys = [AESGCM(hashlib.sha256(secret.encode()).digest()) for secret in secrets]
+
+    def seal(self, data: Dict[str, Any], purpose: str) -> str:
+        plaintext = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+        nonce = os.urandom(_NONCE_SIZE)
+        return _b64encode(nonce + self._keys[0].encrypt(nonce, plaintext, purpose.encode()))
+
+    def unseal(self, value: str, purpose: str) -> Optional[Dict[str, Any]]:
+        """Datos descifrados, o None si la cookie está manipulada o no es de este propósito"""
+        try:
+            raw = _b64decode(value)
+        except ValueError:
+            return None
+        nonce, ciphertext = raw[:_NONCE_SIZE], raw[_NONCE_SIZE:]
+        for key in self._keys:
+            try:
+                plaintext = key.decrypt(nonce, ciphertext, purpose.encode())
+            except (InvalidTag, ValueError):
+                continue
+            try:
+                return json.loads(zlib.decompress(plaintext))
+            except (zlib.error, ValueError):
+                return None
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class Session:
+    """Token set de un usuario tal como viaja en la cookie"""
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: float
+    refresh_expires_at: Optional[float]
+    claims: Dict[str, Any]
+
+    @classmethod
+    def from_token_response(cls, token_data: Dict[str, Any], claims: Dict[str, Any]) -> "Session":
+        """Sesión desde la respuesta del token endpoint y los claims ya verificados"""
+        now = time.time()
+        refresh_expires_in = token_data.get("refresh_expires_in")
+        return cls(
+            access_token=token_data["access_token"],
+            refresh_token=token_data.get("refresh_token"),
+            expires_at=claims.get("exp") or now + token_data.get("expires_in", 0),
+            # Keycloak devuelve refresh_expires_in=0 para tokens offline (sin caducidad)
+            refresh_expires_at=now + refresh_expires_in if refresh_expires_in else None,
+            claims={name: claims[name] for name in SESSION_CLAIMS if name in claims},
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "at": self.access_token,
+            "rt": self.refresh_token,
+            "exp": self.expires_at,
+            "rexp": self.refresh_expires_at,
+            "c": self.claims,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["Session"]:
+        try:
+            return cls(data["at"], data.get("rt"), data["exp"], data.get("rexp"), data["c"])
+        except (KeyError, TypeError):
+            return None
+
+    def max_age(self) -> Optional[int]:
+        """Vida de la cookie: hasta que caduque el refresh token (o el access token si no hay)"""
+        expires_at = self.refresh_expires_at if self.refresh_token else self.expires_at
+        if expires_at is None:
+            return None
+        return max(0, int(expires_at - time.time()))
+
+
+def read_chunked_cookie(cookies: Mapping[str, str], name: str, max_chunks: int) -> Optional[str]:
+    """Une <name>.0, <name>.1, ... en el valor original"""
+    parts = []
+    for index in range(max_chunks):
+        part = cookies.get(f"{name}.{index}")
+        if part is None:
+            break
+        parts.append(part)
+    return "".join(parts) or None
+
+
+def write_chunked_cookie(
+    response: Response,
+    cookies: Mapping[str, str],
+    name: str,
+    value: str,
+    chunk_size: int,
+    max_chunks: int,
+    **options: Any,
+) -> None:
+    """
+    Escribe el valor en trozos de chunk_size y borra los trozos sobrantes de
+    una cookie anterior más larga
+
+    Raises:
+        ValueError: Si el valor necesita más de max_chunks cookies
+    """
+    chunks = [value[i:i + chunk_size] for i in range(0, len(value), chunk_size)]
+    if len(chunks) > max_chunks:
+        raise ValueError(f"La sesión ocupa {len(value)} bytes, más de {max_chunks} cookies")
+    for index, chunk in enumerate(chunks):
+        response.set_cookie(f"{name}.{index}", chunk, **options)
+    clear_chunked_cookie(response, cookies, name, max_chunks, start=len(chunks), **options)
+
+
+def clear_chunked_cookie(
+    response: Response,
+    cookies: Mapping[str, str],
+    name: str,
+    max_chunks: int,
+    start: int = 0,
+    **options: Any,
+) -> None:
+    """Borra los trozos <name>.<start>... que el navegador tenga"""
+    options.pop("max_age", None)
+    for index in range(start, max_chunks):
+        if f"{name}.{index}" in cookies:
+            response.delete_cookie(f"{name}.{index}", **options)
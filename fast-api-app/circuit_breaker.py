@@ -0,0 +1,63 @@
+"""
+Circuit breaker para las llamadas a Keycloak
+============================================
+
+Tras failure_threshold fallos seguidos el circuito se abre y las llamadas
+fallan al instante (sin esperar timeouts) durante reset_timeout segundos.
+Pasado ese tiempo se deja pasar una sola llamada de prueba (half_open): si
+va bien el circuito se cierra, si falla vuelve a abrirse.
+
+Es seguro entre hilos: fetch_json se llama desde los pools de verificación.
+"""
+
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Estado closed / open / half_open de una dependencia externa"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """True si la llamada puede hacerse (en half_open, solo la de prueba)"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._state = HALF_OPEN
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
@@ -0,0 +1,128 @@
+"""
+Hub de eventos en proceso para Server-Sent Events
+=================================================
+
+Un único hub reparte los cambios del catálogo a todas las conexiones SSE
+abiertas:
+
+- Cada evento se serializa una sola vez al formato SSE y el mismo objeto
+  bytes se encola en cada suscriptor
+- Cada suscriptor tiene una cola acotada; si un cliente lento la llena, se
+  le desconecta (recibe un evento "dropped" y el stream termina) en lugar de
+  acumular memoria o frenar al resto
+- publish() nunca espera: es seguro llamarlo desde los endpoints
+
+No es thread-safe: publish/subscribe se llaman desde el event loop.
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+
+def format_event(event: str, data: Any, event_id: Optional[str] = None) -> bytes:
+    """Serializa un evento al formato text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+HEARTBEAT_FRAME = b": ping\n\n"
+
+
+class Subscription:
+    """Cola acotada de frames SSE de una conexión"""
+
+    __slots__ = ("max_queue", "closed", "_frames", "_ready")
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.closed = False
+        self._frames: Deque[bytes] = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, frame: bytes) -> bool:
+        """Encola un frame; False si la cola está llena"""
+        if len(self._frames) >= self.max_queue:
+            return False
+        self._frames.append(frame)
+        self._ready.set()
+        return True
+
+    def close(self, final_frame: Optional[bytes] = None) -> None:
+        """Descarta lo pendiente y deja solo el frame final (si lo hay)"""
+        self.closed = True
+        self._frames.clear()
+        if final_frame is not None:
+            self._frames.append(final_frame)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[bytes]:
+        """
+        Siguiente frame; None si no llega nada en `timeout` segundos y b""
+        cuando la suscripción está cerrada y ya no quedan frames
+        """
+        if not self._frames:
+            if self.closed:
+                return b""
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if not self._frames:
+                return b""
+        return self._frames.popleft()
+
+
+class EventHub:
+    """Difusión de eventos a suscriptores con colas acotadas"""
+
+    def __init__(self, queue_size: int = 100, max_subscribers: int = 10000):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Set[Subscription] = set()
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> Optional[Subscription]:
+        """Nueva suscripción, o None si se alcanzó max_subscribers"""
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def publish(self, event: str, data: Any, event_id: Optional[str] = None) -> None:
+        """Encola el evento en todos los suscriptores; desconecta a los que van llenos"""
+        self.published += 1
+        if not self._subscribers:
+            return
+        frame = format_event(event, data, event_id)
+        slow = [subscription for subscription in self._subscribers if not subscription.push(frame)]
+        if slow:
+            dropped_frame = format_event("dropped", {"reason": "slow consumer"})
+            for subscription in slow:
+                subscription.close(dropped_frame)
+                self._subscribers.discard(subscription)
+            self.dropped += len(slow)
+
+    def close_all(self) -> None:
+        """Termina todos los streams (parada de la aplicación)"""
+        for subscription in self._subscribers:
+            subscription.close()
+        self._subscribers.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": self.subscribers, "published": self.published, "dropped": self.dropped}
@@ -0,0 +1,114 @@
+"""
+Respuestas precalculadas para probes y métricas
+===============================================
+
+Los health checks de Kubernetes y del balanceador y los scrapes de
+Prometheus llegan de cada réplica cada pocos segundos y no necesitan nada
+de FastAPI: ni CORS, ni routing, ni dependencias, ni serialización JSON.
+FastPathMiddleware va delante de todo y responde esos paths (GET y HEAD)
+con bytes ya preparados; el resto de requests pasa a la app sin cambios.
+
+Cada path tiene un proveedor que devuelve un PrecomputedResponse:
+
+- Fijo: la misma respuesta siempre (/health/live)
+- MemoizedResponse: se vuelve a generar solo cuando cambia una clave
+  barata de calcular (/health/ready: estado del warm-up y del circuito)
+- TimedResponse: se vuelve a generar como mucho cada ttl segundos
+  (/metrics: varios scrapers en la misma ventana comparten el texto)
+
+Estas requests no pasan por el access log.
+"""
+
+import json
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+RawHeaders = List[Tuple[bytes, bytes]]
+
+
+class PrecomputedResponse:
+    """Estado, cabeceras y cuerpo ya codificados"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(
+        self,
+        body: bytes,
+        status: int = 200,
+        content_type: bytes = b"application/json",
+        headers: Iterable[Tuple[bytes, bytes]] = (),
+    ):
+        self.status = status
+        self.body = body
+        self.headers: RawHeaders = [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ]
+
+    @classmethod
+    def json(cls, data: Any, status: int = 200, headers: Iterable[Tuple[bytes, bytes]] = ()) -> "PrecomputedResponse":
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+        return cls(body, status, b"application/json", headers)
+
+    def __call__(self) -> "PrecomputedResponse":
+        # Una respuesta fija es su propio proveedor
+        return self
+
+
+Provider = Callable[[], PrecomputedResponse]
+
+
+class MemoizedResponse:
+    """Regenera la respuesta solo cuando cambia key()"""
+
+    def __init__(self, key: Callable[[], Hashable], render: Provider):
+        self.key = key
+        self.render = render
+        self._key: Optional[Hashable] = None
+        self._response: Optional[PrecomputedResponse] = None
+
+    def __call__(self) -> PrecomputedResponse:
+        key = self.key()
+        if self._response is None or key != self._key:
+            self._response = self.render()
+            self._key = key
+        return self._response
+
+
+class TimedResponse:
+    """Regenera la respuesta como mucho cada ttl segundos"""
+
+    def __init__(self, render: Provider, ttl: float):
+        self.render = render
+        self.ttl = ttl
+        self._expires_at = 0.0
+        self._response: Optional[PrecomputedResponse] = None
+
+    def __call__(self) -> PrecomputedResponse:
+        now = time.monotonic()
+        if self._response is None or now >= self._expires_at:
+            self._response = self.render()
+            self._expires_at = now + self.ttl
+        return self._response
+
+
+class FastPathMiddleware:
+    """Responde GET/HEAD de los paths registrados sin llegar a la app"""
+
+    def __init__(self, app: ASGIApp, routes: Dict[str, Provider]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            provider = self.routes.get(scope["path"])
+            method = scope["method"]
+            if provider is not None and (method == "GET" or method == "HEAD"):
+                response = provider()
+                await send({"type": "http.response.start", "status": response.status, "headers": response.headers})
+                await send({"type": "http.response.body", "body": response.body if method == "GET" else b""})
+                return
+        await self.app(scope, receive, send)
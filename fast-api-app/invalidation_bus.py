@@ -0,0 +1,363 @@
+"""
+Bus de invalidación entre réplicas
+==================================
+
+Cada réplica tiene sus propias cachés (JWKS, tokens verificados, denylist de
+sesiones, respuestas del catálogo) y sin coordinación cada una se entera de
+los cambios a su ritmo: el JWKS al caducar su copia, un logout solo en la
+réplica a la que Keycloak llamó. El bus difunde esos cambios como eventos
+pequeños (un datagrama JSON) para que el resto invalide al momento:
+
+- MemoryBus: dentro del proceso; varios buses sobre el mismo MemoryChannel
+  simulan réplicas en tests (y uno solo equivale a no tener cluster)
+- UnixSocketBus: réplicas en el mismo host; cada una escucha en
+  <directorio>/<node_id>.sock y publica a todos los sockets del directorio
+- MulticastBus: réplicas en la misma red; UDP a un grupo multicast
+
+Entrega best-effort, sin reintentos: es un atajo para invalidar antes, no la
+única vía (los TTL de cada caché siguen funcionando si se pierde un evento).
+Con secret, cada mensaje lleva un HMAC-SHA256 y se descartan los que no
+coinciden: sin él, cualquiera que llegue al socket o al grupo podría revocar
+sesiones ajenas. El cuerpo firmado incluye el instante de envío y un nonce:
+se descartan los mensajes con más de max_age segundos (o del futuro, más
+allá de ese margen de reloj) y los nonces ya vistos dentro de esa ventana,
+así que un datagrama capturado no se puede reinyectar más tarde.
+
+publish() es seguro entre hilos (se llama desde el pool de verificación).
+Los handlers se ejecutan en el event loop, también para los eventos de la
+propia réplica (con event.local=True), y solo mientras el bus está arrancado.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+_MAC_SIZE = 32
+# Por debajo de la MTU habitual: un evento nunca se fragmenta
+MAX_MESSAGE_SIZE = 1400
+# Nonces recordados como máximo (los de más de max_age se olvidan antes)
+MAX_SEEN_NONCES = 100000
+
+
+@dataclass(frozen=True, slots=True)
+class InvalidationEvent:
+    kind: str
+    fields: Dict[str, Any]
+    origin: str
+    local: bool
+
+
+Handler = Callable[[InvalidationEvent], Any]
+
+
+class InvalidationBus:
+    """Base común: codificación, firma, suscripciones y entrega en el event loop"""
+
+    def __init__(self, node_id: Optional[str] = None, secret: Optional[str] = None, max_age: float = 30):
+        self.node_id = node_id or os.urandom(6).hex()
+        self._key = hashlib.sha256(secret.encode()).digest() if secret else None
+        self.max_age = max_age
+        # nonce -> instante a partir del cual ya no hace falta recordarlo; en orden de llegada
+        self._seen: Dict[str, float] = {}
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.rejected = 0
+        self.send_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def subscribe(self, kind: str, handler: Handler) -> None:
+        """Registra handler(event) para los eventos de tipo kind (puede ser async)"""
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def publish(self, kind: str, **fields: Any) -> None:
+        """Difunde el evento al resto de réplicas y lo entrega a los handlers locales"""
+        if self._loop is None:
+            return
+        message = self._encode(kind, fields)
+        event = InvalidationEvent(kind, fields, self.node_id, local=True)
+        self._loop.call_soon_threadsafe(self._dispatch, event)
+        self._send(message)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+
+    async def close(self) -> None:
+        self._loop = None
+
+    def _send(self, message: bytes) -> None:
+        """Envía el mensaje a las demás réplicas (lo implementa cada backend)"""
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _encode(self, kind: str, fields: Dict[str, Any]) -> bytes:
+        body = json.dumps(
+            {"k": kind, "o": self.node_id, "t": time.time(), "n": os.urandom(8).hex(), "f": fields},
+            separators=(",", ":"),
+        ).encode()
+        if len(body) + _MAC_SIZE > MAX_MESSAGE_SIZE:
+            raise ValueError(f"Evento de {len(body)} bytes, el máximo es {MAX_MESSAGE_SIZE - _MAC_SIZE}")
+        if self._key is None:
+            return body
+        return hmac.new(self._key, body, hashlib.sha256).digest() + body
+
+    def _decode(self, message: bytes) -> Optional[InvalidationEvent]:
+        if self._key is not None:
+            mac, message = message[:_MAC_SIZE], message[_MAC_SIZE:]
+            if not hmac.compare_digest(mac, hmac.new(self._key, message, hashlib.sha256).digest()):
+                return None
+        try:
+            data = json.loads(message)
+            kind, origin, sent_at, nonce, fields = data["k"], data["o"], data["t"], data["n"], data["f"]
+        except (ValueError, KeyError, TypeError, RecursionError):
+            return None
+        if not isinstance(kind, str) or not isinstance(fields, dict) or not isinstance(nonce, str):
+            return None
+        if not isinstance(sent_at, (int, float)) or not self._fresh(sent_at, nonce):
+            return None
+        return InvalidationEvent(kind, fields, str(origin), local=False)
+
+    def _fresh(self, sent_at: float, nonce: str) -> bool:
+        """False si el mensaje es viejo, del futuro o un nonce repetido (replay)"""
+        now = time.time()
+        if abs(now - sent_at) > self.max_age:
+            return False
+        seen = self._seen
+        while seen:
+            oldest, forget_at = next(iter(seen.items()))
+            if forget_at > now and len(seen) < MAX_SEEN_NONCES:
+                break
+            del seen[oldest]
+        if nonce in seen:
+            return False
+        # Pasado sent_at + max_age el propio instante ya lo rechaza
+        seen[nonce] = sent_at + self.max_age
+        return True
+
+    def _receive(self, message: bytes) -> None:
+        """Entrega un mensaje recibido de otra réplica (desde el event loop)"""
+        event = self._decode(message)
+        if event is None:
+            self._count("rejected")
+            return
+        # Multicast y el directorio de sockets también devuelven lo propio
+        if event.origin == self.node_id:
+            return
+        self._count("received")
+        self._dispatch(event)
+
+    def _dispatch(self, event: InvalidationEvent) -> None:
+        for handler in self._handlers.get(event.kind, ()):
+            result = handler(event)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "rejected": self.rejected,
+            "send_errors": self.send_errors,
+        }
+
+
+class MemoryChannel:
+    """Medio compartido por los MemoryBus de un mismo proceso"""
+
+    def __init__(self):
+        self.buses: List["MemoryBus"] = []
+
+
+class MemoryBus(InvalidationBus):
+    """Réplicas simuladas dentro del proceso"""
+
+    def __init__(self, channel: Optional[MemoryChannel] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.channel = channel if channel is not None else MemoryChannel()
+
+    async def start(self) -> None:
+        await super().start()
+        self.channel.buses.append(self)
+
+    async def close(self) -> None:
+        if self in self.channel.buses:
+            self.channel.buses.remove(self)
+        await super().close()
+
+    def _send(self, message: bytes) -> None:
+        for bus in list(self.channel.buses):
+            if bus is not self and bus._loop is not None:
+                bus._loop.call_soon_threadsafe(bus._receive, message)
+                self._count("sent")
+
+
+class _SocketBus(InvalidationBus):
+    """Backends de datagramas: un socket de recepción leído con add_reader"""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._receiver: Optional[socket.socket] = None
+        self._sender: Optional[socket.socket] = None
+
+    def _open(self) -> None:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        await super().start()
+        self._open()
+        self._loop.add_reader(self._receiver.fileno(), self._on_readable)
+
+    async def close(self) -> None:
+        if self._receiver is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._receiver.fileno())
+            self._receiver.close()
+            self._receiver = None
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+        await super().close()
+
+    def _on_readable(self) -> None:
+        while self._receiver is not None:
+            try:
+                message = self._receiver.recv(MAX_MESSAGE_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                self._count("rejected")
+                return
+            self._receive(message)
+
+
+class UnixSocketBus(_SocketBus):
+    """Réplicas en el mismo host que comparten un directorio de sockets"""
+
+    def __init__(self, directory: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{self.node_id}.sock")
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._receiver.bind(self.path)
+        self._receiver.setblocking(False)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    async def close(self) -> None:
+        await super().close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _send(self, message: bytes) -> None:
+        sender = self._sender
+        if sender is None:
+            return
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            self._count("send_errors")
+            return
+        for entry in entries:
+            if not entry.name.endswith(".sock") or entry.path == self.path:
+                continue
+            try:
+                sender.sendto(message, entry.path)
+            except ConnectionRefusedError:
+                # Nadie escucha: socket de una réplica que murió sin limpiar
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            except OSError:
+                # Buffer del receptor lleno (o réplica parando): se pierde el evento
+                self._count("send_errors")
+            else:
+                self._count("sent")
+
+
+class MulticastBus(_SocketBus):
+    """Réplicas en la misma red: UDP a un grupo multicast IPv4"""
+
+    def __init__(self, group: str, port: int, ttl: int = 1, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.group = group
+        self.port = port
+        self.ttl = ttl
+
+    def _open(self) -> None:
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        receiver.bind(("", self.port))
+        membership = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton("0.0.0.0"))
+        receiver.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        receiver.setblocking(False)
+        self._receiver = receiver
+
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+        # Loopback activo: otras réplicas del mismo host también lo reciben
+        sender.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        sender.setblocking(False)
+        self._sender = sender
+
+    def _send(self, message: bytes) -> None:
+        sender = self._sender
+        if sender is None:
+            return
+        try:
+            sender.sendto(message, (self.group, self.port))
+        except OSError:
+            self._count("send_errors")
+        else:
+            self._count("sent")
+
+
+def create_bus(url: str, node_id: Optional[str] = None, secret: Optional[str] = None, max_age: float = 30) -> InvalidationBus:
+    """
+    Bus a partir de una URL:
+
+    - memory://                       solo este proceso
+    - unix:///run/keycloak-lab/bus    directorio de sockets compartido
+    - udp://239.255.42.1:7946?ttl=1   grupo multicast
+
+    Raises:
+        ValueError: Si el esquema no está soportado
+    """
+    parts = urlsplit(url or "memory://")
+    if parts.scheme == "memory":
+        return MemoryBus(node_id=node_id, secret=secret, max_age=max_age)
+    if parts.scheme == "unix":
+        return UnixSocketBus(parts.path, node_id=node_id, secret=secret, max_age=max_age)
+    if parts.scheme == "udp":
+        ttl = 1
+        for param in parts.query.split("&"):
+            name, _, value = param.partition("=")
+            if name == "ttl" and value.isdigit():
+                ttl = int(value)
+        return MulticastBus(parts.hostname, parts.port or 7946, ttl=ttl, node_id=node_id, secret=secret, max_age=max_age)
+    raise ValueError(f"Bus de invalidación no soportado: {url}")
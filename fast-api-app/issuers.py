@@ -0,0 +1,218 @@
+"""
+Validación multi-realm: un almacén de claves por emisor
+=======================================================
+
+Cada tenant vive en su propio realm de Keycloak, con su propio "iss" y su
+propio JWKS. IssuerRegistry enruta cada token a su realm:
+
+- El "iss" del payload (sin verificar todavía) se busca en un dict; el
+  coste por request no depende del número de tenants
+- Solo se aceptan emisores de la allowlist; cualquier otro "iss" se
+  rechaza sin llamar a Keycloak
+- Discovery y JWKS de cada realm se cargan la primera vez que llega un
+  token suyo; si hay más realms cargados que max_loaded, se descarga el
+  usado hace más tiempo (se volverá a cargar si vuelve a usarse)
+- El JWKS se descarga siempre de base_url (URL interna). Del discovery solo
+  se usa "issuer", para comprobar que el realm es el esperado: su jwks_uri
+  lleva el hostname público, que desde el contenedor puede no ser accesible
+- El verificador del realm comprueba además que "iss" coincide con el
+  suyo (antes de la firma, igual que exp y nbf)
+- Si una recarga trae claves distintas de las que había (rotación o
+  retirada de una clave) se llama a on_keys_changed(issuer)
+
+El registro es seguro entre hilos: se usa desde el pool de verificación.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from jwt_verifier import INVALID_ISSUER, JWTVerifier, TokenVerificationError, UnknownKeyError, parse_segment, split_token
+
+
+@dataclass(frozen=True, slots=True)
+class IssuerConfig:
+    """
+    Configuración de un realm de confianza
+
+    issuer es el "iss" tal como aparece en los tokens (URL pública);
+    base_url es desde donde el backend descarga discovery y JWKS (puede ser
+    la URL interna, p.ej. http://keycloak-dev:8080/realms/<realm>).
+    """
+    realm: str
+    issuer: str
+    base_url: str
+
+    @property
+    def discovery_url(self) -> str:
+        return f"{self.base_url}/.well-known/openid-configuration"
+
+    @property
+    def jwks_url(self) -> str:
+        return f"{self.base_url}/protocol/openid-connect/certs"
+
+
+class Tenant:
+    """Claves y discovery cargados de un realm"""
+
+    __slots__ = ("config", "verifier", "discovery", "loaded_at", "last_used", "lock")
+
+    def __init__(self, config: IssuerConfig, leeway: int = 0):
+        self.config = config
+        self.verifier = JWTVerifier(leeway=leeway, issuer=config.issuer)
+        self.discovery: Dict[str, Any] = {}
+        self.loaded_at = 0.0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class IssuerRegistry:
+    """
+    Verificadores por emisor con carga perezosa y expulsión LRU
+
+    Uso:
+        registry = IssuerRegistry([IssuerConfig(...), ...], fetch_json)
+        payload = registry.verify(token)
+    """
+
+    def __init__(
+        self,
+        configs: Iterable[IssuerConfig],
+        fetch_json: Callable[[str], Dict[str, Any]],
+        max_loaded: int = 32,
+        jwks_ttl: float = 300,
+        min_refresh_interval: float = 10,
+        leeway: int = 0,
+        on_keys_changed: Optional[Callable[[str], None]] = None,
+        on_issuer_mismatch: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.fetch_json = fetch_json
+        self.on_keys_changed = on_keys_changed
+        self.on_issuer_mismatch = on_issuer_mismatch
+        self.max_loaded = max_loaded
+        self.jwks_ttl = jwks_ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self._configs: Dict[str, IssuerConfig] = {config.issuer: config for config in configs}
+        self._tenants: Dict[str, Tenant] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def issuers(self) -> List[str]:
+        return list(self._configs)
+
+    @property
+    def loaded(self) -> List[str]:
+        return list(self._tenants)
+
+    def config_for(self, issuer: Optional[str]) -> Optional[IssuerConfig]:
+        return self._configs.get(issuer)
+
+    def tenant(self, issuer: Optional[str]) -> Tenant:
+        """
+        Tenant del emisor, creándolo si está en la allowlist
+
+        Raises:
+            TokenVerificationError: Si el emisor no está permitido
+        """
+        tenant = self._tenants.get(issuer)
+        if tenant is None:
+            config = self._configs.get(issuer)
+            if config is None:
+                raise TokenVerificationError("Emisor no permitido", INVALID_ISSUER)
+            with self._lock:
+                tenant = self._tenants.get(issuer)
+                if tenant is None:
+                    tenant = Tenant(config, self.leeway)
+                    if len(self._tenants) >= self.max_loaded:
+                        oldest = min(self._tenants.values(), key=lambda t: t.last_used)
+                        del self._tenants[oldest.config.issuer]
+                    self._tenants[issuer] = tenant
+        tenant.last_used = time.monotonic()
+        return tenant
+
+    def refresh(self, tenant: Tenant, force: bool = False, notify: bool = True) -> None:
+        """
+        Recarga el JWKS del tenant
+
+        Sin force solo descarga si la copia tiene más de jwks_ttl segundos;
+        con force (kid desconocido) como mucho una vez cada
+        min_refresh_interval, para que kids inventados no se conviertan en
+        llamadas a Keycloak. notify=False no avisa a on_keys_changed (para
+        recargas que ya vienen de un aviso).
+
+        Si el discovery anuncia otro "issuer" no se cargan claves (se avisa a
+        on_issuer_mismatch y se reintenta en la siguiente recarga).
+        """
+        changed = first_load = False
+        with tenant.lock:
+            age = time.monotonic() - tenant.loaded_at
+            if age < (self.min_refresh_interval if force else self.jwks_ttl):
+                return
+            if not tenant.discovery:
+                tenant.discovery = self.fetch_json(tenant.config.discovery_url)
+            advertised = tenant.discovery.get("issuer")
+            mismatch = advertised if advertised is not None and advertised != tenant.config.issuer else None
+            if mismatch is not None:
+                tenant.discovery = {}
+            else:
+                jwks = self.fetch_json(tenant.config.jwks_url)
+                # La primera carga no es un cambio: no había claves que invalidar
+                first_load = not tenant.verifier.key_count
+                changed = bool(jwks) and tenant.verifier.load_jwks(jwks)
+            tenant.loaded_at = time.monotonic()
+        if mismatch is not None and self.on_issuer_mismatch is not None:
+            self.on_issuer_mismatch(tenant.config.issuer, mismatch)
+        if changed and not first_load and notify and self.on_keys_changed is not None:
+            self.on_keys_changed(tenant.config.issuer)
+
+    def invalidate(self, issuer: str) -> Optional[Tenant]:
+        """
+        Marca el JWKS del emisor como caducado: la próxima refresh() lo
+        descarga aunque sea reciente. None si el realm no está cargado
+        """
+        tenant = self._tenants.get(issuer)
+        if tenant is not None:
+            with tenant.lock:
+                tenant.loaded_at = float("-inf")
+        return tenant
+
+    def load_jwks(self, issuer: str, jwks: Dict[str, Any]) -> None:
+        """Carga un JWKS directamente (sin descargarlo) en el tenant del emisor"""
+        tenant = self.tenant(issuer)
+        with tenant.lock:
+            tenant.verifier.load_jwks(jwks)
+            tenant.loaded_at = time.monotonic()
+
+    def verify(self, token: str, refresh: bool = True) -> Dict[str, Any]:
+        """
+        Verifica el token con las claves de su emisor
+
+        Con refresh, recarga el JWKS si ha caducado y, si el kid no se conoce,
+        fuerza una recarga y reintenta una vez.
+
+        Raises:
+            UnknownKeyError: Si el kid no está entre las claves del emisor
+            TokenVerificationError: Si el token no es válido o el emisor no está permitido
+        """
+        segments = split_token(token)
+        return self.verify_segments(segments, parse_segment(segments[1]), refresh=refresh)
+
+    def verify_segments(
+        self,
+        segments: Tuple[str, str, str],
+        payload: Dict[str, Any],
+        header: Optional[Dict[str, Any]] = None,
+        refresh: bool = True,
+    ) -> Dict[str, Any]:
+        """Como verify() sobre un token ya separado, con payload (y header) decodificados"""
+        tenant = self.tenant(payload.get("iss"))
+        if not refresh:
+            return tenant.verifier.verify_segments(*segments, payload, header)
+        self.refresh(tenant)
+        try:
+            return tenant.verifier.verify_segments(*segments, payload, header)
+        except UnknownKeyError:
+            self.refresh(tenant, force=True)
+            return tenant.verifier.verify_segments(*segments, payload, header)
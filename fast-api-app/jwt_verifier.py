@@ -0,0 +1,284 @@
+"""
+Verificador JWT sobre primitivas de cryptography
+================================================
+
+Motor de verificación de tokens de Keycloak sin pasar por la ruta genérica
+de python-jose:
+
+- Las claves públicas se construyen una sola vez por kid al cargar el JWKS
+- Cada clave queda fijada a un único algoritmo; un token con otro "alg" en
+  el header se rechaza aunque la firma fuese válida con otro esquema
+- El header y el payload se parsean con base64url + json, sin más capas
+- Algoritmos soportados: RS256, PS256, ES256 y EdDSA (Ed25519)
+- Los claims (iss, exp, nbf) se comprueban antes que la firma: un token
+  expirado o de otro emisor no cuesta una operación de clave pública
+- Cada error lleva un motivo fijo (reason) apto para respuestas y métricas
+"""
+
+import base64
+import binascii
+import json
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+SUPPORTED_ALGORITHMS = ("RS256", "PS256", "ES256", "EdDSA")
+
+# Motivos de rechazo: valores fijos, nunca derivados del contenido del token
+MALFORMED = "malformed"
+TOO_LARGE = "too_large"
+UNSUPPORTED_ALGORITHM = "unsupported_alg"
+UNKNOWN_KEY = "unknown_key"
+INVALID_ISSUER = "invalid_issuer"
+INVALID_CLAIMS = "invalid_claims"
+EXPIRED = "expired"
+NOT_YET_VALID = "not_yet_valid"
+BAD_SIGNATURE = "bad_signature"
+INVALID_TOKEN = "invalid_token"
+
+
+class TokenVerificationError(Exception):
+    """El token no es válido (formato, firma, algoritmo o claims temporales)"""
+
+    reason = INVALID_TOKEN
+
+    def __init__(self, message: str, reason: Optional[str] = None):
+        super().__init__(message)
+        if reason is not None:
+            self.reason = reason
+
+
+class UnknownKeyError(TokenVerificationError):
+    """El kid del token no está entre las claves cargadas"""
+
+    reason = UNKNOWN_KEY
+
+
+def b64url_decode(segment: str) -> bytes:
+    """Decodifica base64url sin padding"""
+    try:
+        return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+    except (binascii.Error, ValueError) as e:
+        raise TokenVerificationError("Segmento base64url inválido", MALFORMED) from e
+
+
+def _b64url_uint(segment: str) -> int:
+    return int.from_bytes(b64url_decode(segment), "big")
+
+
+def parse_segment(segment: str) -> Dict[str, Any]:
+    """Decodifica un segmento JSON (header o payload) sin verificar nada"""
+    try:
+        value = json.loads(b64url_decode(segment))
+    except (ValueError, RecursionError) as e:
+        # RecursionError: JSON anidado a propósito ('[' * 5000) para tumbar el parser
+        raise TokenVerificationError("Segmento JSON inválido", MALFORMED) from e
+    if not isinstance(value, dict):
+        raise TokenVerificationError("Segmento JSON inválido", MALFORMED)
+    return value
+
+
+def split_token(token: str) -> Tuple[str, str, str]:
+    """Separa header, payload y firma (sin decodificar)"""
+    parts = token.split(".")
+    if len(parts) != 3:
+        raise TokenVerificationError("Formato de token inválido", MALFORMED)
+    return parts[0], parts[1], parts[2]
+
+
+def parse_header(token: str) -> Dict[str, Any]:
+    """Devuelve el header del token sin verificar la firma"""
+    return parse_segment(token.split(".", 1)[0])
+
+
+class VerificationKey:
+    """Clave pública ya construida y fijada a un algoritmo"""
+
+    __slots__ = ("kid", "alg", "_verify")
+
+    def __init__(self, kid: str, alg: str, verify: Callable[[bytes, bytes], None]):
+        self.kid = kid
+        self.alg = alg
+        self._verify = verify
+
+    def verify(self, signing_input: bytes, signature: bytes) -> None:
+        """Lanza TokenVerificationError si la firma no es válida"""
+        try:
+            self._verify(signing_input, signature)
+        except (InvalidSignature, ValueError) as e:
+            raise TokenVerificationError("Firma inválida", BAD_SIGNATURE) from e
+
+
+def key_from_jwk(jwk: Dict[str, Any]) -> VerificationKey:
+    """
+    Construye una VerificationKey a partir de una entrada del JWKS
+
+    El algoritmo se toma del campo "alg" del JWK y, si falta, se deduce del
+    tipo de clave (RSA -> RS256, EC P-256 -> ES256, OKP Ed25519 -> EdDSA).
+
+    Raises:
+        TokenVerificationError: Si el tipo de clave o el algoritmo no están soportados
+    """
+    kty = jwk.get("kty")
+    kid = jwk.get("kid")
+
+    if kty == "RSA":
+        alg = jwk.get("alg", "RS256")
+        public_key = rsa.RSAPublicNumbers(_b64url_uint(jwk["e"]), _b64url_uint(jwk["n"])).public_key()
+        if alg == "RS256":
+            pkcs1 = padding.PKCS1v15()
+            return VerificationKey(kid, alg, lambda data, sig: public_key.verify(sig, data, pkcs1, hashes.SHA256()))
+        if alg == "PS256":
+            pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH)
+            return VerificationKey(kid, alg, lambda data, sig: public_key.verify(sig, data, pss, hashes.SHA256()))
+
+    elif kty == "EC":
+        alg = jwk.get("alg", "ES256")
+        if alg == "ES256" and jwk.get("crv") == "P-256":
+            public_key = ec.EllipticCurvePublicNumbers(
+                _b64url_uint(jwk["x"]), _b64url_uint(jwk["y"]), ec.SECP256R1()
+            ).public_key()
+            ecdsa = ec.ECDSA(hashes.SHA256())
+
+            def verify_es256(data: bytes, sig: bytes) -> None:
+                # JWS usa r||s en crudo (32 + 32 bytes); cryptography espera DER
+                if len(sig) != 64:
+                    raise InvalidSignature()
+                der = encode_dss_signature(int.from_bytes(sig[:32], "big"), int.from_bytes(sig[32:], "big"))
+                public_key.verify(der, data, ecdsa)
+
+            return VerificationKey(kid, alg, verify_es256)
+
+    elif kty == "OKP":
+        alg = jwk.get("alg", "EdDSA")
+        if alg == "EdDSA" and jwk.get("crv") == "Ed25519":
+            public_key = ed25519.Ed25519PublicKey.from_public_bytes(b64url_decode(jwk["x"]))
+            return VerificationKey(kid, alg, lambda data, sig: public_key.verify(sig, data))
+
+    else:
+        alg = jwk.get("alg")
+
+    raise TokenVerificationError(f"Clave no soportada: kty={kty} alg={alg}", UNSUPPORTED_ALGORITHM)
+
+
+class JWTVerifier:
+    """
+    Verifica tokens contra un conjunto de claves indexado por kid
+
+    Con issuer, además se exige que el claim "iss" coincida.
+
+    Uso:
+        verifier = JWTVerifier(issuer="https://kc.example.com/realms/demo-app")
+        verifier.load_jwks(jwks)
+        payload = verifier.verify(token)
+    """
+
+    def __init__(self, leeway: int = 0, issuer: Optional[str] = None):
+        self.leeway = leeway
+        self.issuer = issuer
+        self._keys: Dict[str, VerificationKey] = {}
+        self._jwks_entries: Dict[str, Dict[str, Any]] = {}
+
+    def load_jwks(self, jwks: Dict[str, Any]) -> bool:
+        """
+        Carga las claves de firma de un JWKS y devuelve si han cambiado
+
+        Las claves cuyo kid y contenido no cambian se reutilizan sin volver a
+        construirse. Las entradas de cifrado ("use": "enc") y las de tipo no
+        soportado se ignoran. El diccionario se sustituye de una vez, así que
+        es seguro llamarlo mientras otros hilos verifican.
+        """
+        keys: Dict[str, VerificationKey] = {}
+        entries: Dict[str, Dict[str, Any]] = {}
+        for entry in jwks.get("keys", []):
+            kid = entry.get("kid")
+            if not kid or entry.get("use", "sig") != "sig":
+                continue
+            current = self._keys.get(kid)
+            if current is not None and self._jwks_entries.get(kid) == entry:
+                keys[kid] = current
+            else:
+                try:
+                    keys[kid] = key_from_jwk(entry)
+                except (TokenVerificationError, KeyError, ValueError):
+                    continue
+            entries[kid] = entry
+        changed = entries != self._jwks_entries
+        self._keys = keys
+        self._jwks_entries = entries
+        return changed
+
+    def has_key(self, kid: Optional[str]) -> bool:
+        return kid in self._keys
+
+    @property
+    def key_count(self) -> int:
+        return len(self._keys)
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verifica algoritmo, iss, exp/nbf y firma, y devuelve los claims
+
+        Raises:
+            UnknownKeyError: Si el kid no está cargado
+            TokenVerificationError: Si el token no es válido
+        """
+        return self.verify_segments(*split_token(token))
+
+    def verify_segments(
+        self,
+        header_segment: str,
+        payload_segment: str,
+        signature_segment: str,
+        payload: Optional[Dict[str, Any]] = None,
+        header: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Como verify() sobre un token ya separado
+
+        payload y header permiten reutilizar lo que el llamador ya decodificó
+        (p.ej. para enrutar por "iss"); deben venir de sus segmentos.
+        """
+        if header is None:
+            header = parse_segment(header_segment)
+        key = self._keys.get(header.get("kid"))
+        if key is None:
+            raise UnknownKeyError("No se pudo validar el token - clave no encontrada")
+        if header.get("alg") != key.alg:
+            raise TokenVerificationError("Algoritmo no permitido para esta clave", UNSUPPORTED_ALGORITHM)
+
+        if payload is None:
+            payload = parse_segment(payload_segment)
+        if self.issuer is not None and payload.get("iss") != self.issuer:
+            raise TokenVerificationError("Emisor no válido", INVALID_ISSUER)
+        check_time_claims(payload, time.time(), self.leeway)
+
+        # La firma, lo más caro, al final
+        signing_input = f"{header_segment}.{payload_segment}".encode()
+        key.verify(signing_input, b64url_decode(signature_segment))
+        return payload
+
+
+def check_time_claims(payload: Dict[str, Any], now: float, leeway: float = 0) -> None:
+    """
+    Comprueba exp y nbf (si están)
+
+    Raises:
+        TokenVerificationError: Si el token ha expirado, aún no es válido o los claims no son numéricos
+    """
+    exp = payload.get("exp")
+    if exp is not None:
+        if not isinstance(exp, (int, float)):
+            raise TokenVerificationError("Claim exp inválido", INVALID_CLAIMS)
+        if exp < now - leeway:
+            raise TokenVerificationError("Token expirado", EXPIRED)
+    nbf = payload.get("nbf")
+    if nbf is not None:
+        if not isinstance(nbf, (int, float)):
+            raise TokenVerificationError("Claim nbf inválido", INVALID_CLAIMS)
+        if nbf > now + leeway:
+            raise TokenVerificationError("Token aún no válido (nbf)", NOT_YET_VALID)
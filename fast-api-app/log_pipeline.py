@@ -0,0 +1,205 @@
+"""
+Logs estructurados (JSON) fuera del camino de la request
+========================================================
+
+Los handlers no escriben: emit() deja el registro (un dict) en un buffer
+acotado y vuelve. Un hilo escritor en segundo plano:
+
+- Espera a tener batch_size registros o a que pasen flush_interval segundos
+- Serializa el lote a JSON lines y lo escribe con una sola llamada write
+  (opcionalmente como un miembro gzip; los miembros concatenados se leen con
+  zcat)
+
+Con el buffer lleno:
+- policy="drop": el registro se descarta y se cuenta en dropped
+- policy="block": el llamante espera hasta block_timeout a que haya hueco
+  (y si no, se descarta). Bloquea también el event loop: solo para cuando
+  perder registros de auditoría es peor que añadir latencia
+
+emit() es seguro entre hilos: también se llama desde los pools de
+verificación.
+"""
+
+import gzip
+import json
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, BinaryIO, Deque, Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class LogPipeline:
+    """Buffer acotado + escritor por lotes en segundo plano"""
+
+    def __init__(
+        self,
+        output: str = "-",
+        max_records: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        policy: str = "drop",
+        block_timeout: float = 1.0,
+        compress: bool = False,
+    ):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Política no soportada: {policy}")
+        self.output = output
+        self.max_records = max_records
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.compress = compress
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def emit(self, kind: str, **fields: Any) -> None:
+        """Encola un registro {"ts", "type": kind, **fields}; nunca escribe"""
+        record = {"ts": time.time(), "type": kind, **fields}
+        with self._cond:
+            if len(self._buffer) >= self.max_records:
+                # Sin escritor no hay quien libere hueco: no tiene sentido esperar
+                if self.policy == "block" and self.running:
+                    self._cond.wait_for(lambda: len(self._buffer) < self.max_records, self.block_timeout)
+                if len(self._buffer) >= self.max_records:
+                    self.dropped += 1
+                    return
+            self._buffer.append(record)
+            self.emitted += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Vacía lo pendiente y para el escritor"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _open(self) -> BinaryIO:
+        if self.output in ("", "-"):
+            return sys.stdout.buffer
+        return open(self.output, "ab")
+
+    def _run(self) -> None:
+        sink = self._open()
+        try:
+            while True:
+                with self._cond:
+                    if len(self._buffer) < self.batch_size and not self._closing:
+                        self._cond.wait(self.flush_interval)
+                    batch = list(self._buffer)
+                    self._buffer.clear()
+                    closing = self._closing
+                    # Despierta a los emisores bloqueados por buffer lleno
+                    self._cond.notify_all()
+                if batch:
+                    self._write(sink, batch)
+                if closing:
+                    return
+        finally:
+            if sink is not sys.stdout.buffer:
+                sink.close()
+
+    def _write(self, sink: BinaryIO, batch: list) -> None:
+        lines = []
+        for record in batch:
+            record["ts"] = round(record["ts"], 3)
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str))
+            except ValueError:
+                pass
+        lost = len(batch) - len(lines)
+        data = ("\n".join(lines) + "\n").encode()
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+        try:
+            sink.write(data)
+            sink.flush()
+        except OSError:
+            self.write_errors += 1
+            lost = len(batch)
+        else:
+            self.written += len(lines)
+            self.batches += 1
+        if lost:
+            with self._cond:
+                self.dropped += lost
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "emitted": self.emitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "buffered": len(self._buffer),
+            "write_errors": self.write_errors,
+        }
+
+
+class AccessLogMiddleware:
+    """
+    Middleware ASGI que emite un registro "access" por request HTTP
+
+    Usa la plantilla de la ruta (/items/{item_id}/buy) en lugar del path para
+    que los logs se puedan agregar por endpoint.
+    """
+
+    def __init__(self, app: ASGIApp, pipeline: LogPipeline):
+        self.app = app
+        self.pipeline = pipeline
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            client = scope.get("client")
+            self.pipeline.emit(
+                "access",
+                method=scope["method"],
+                path=scope["path"],
+                route=getattr(route, "path", None),
+                status=response["status"],
+                bytes=response["bytes"],
+                duration_ms=round((time.perf_counter() - start) * 1000, 3),
+                client=client[0] if client else None,
+            )
@@ -9,15 +9,52 @@ Esta aplicación demuestra cómo integrar FastAPI con Keycloak para:
 - Autorización basada en roles
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import OAuth2AuthorizationCodeBearer, HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import FastAPI, Depends, Form, Header, HTTPException, Request, Response, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
-from jose import jwt, JWTError
-from typing import Optional, List, Dict, Any
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Mapping
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode, urlsplit
+import asyncio
+import hmac
+import math
+import httpx
 import requests
 from pydantic import BaseModel
+from starlette.requests import cookie_parser
 import os
+import sys
+import time
+
+from jwt_verifier import SUPPORTED_ALGORITHMS, JWTVerifier, TokenVerificationError, parse_segment, split_token
+from issuers import IssuerConfig, IssuerRegistry
+from userinfo_cache import UserInfoCache
+from revocation import RevocationList
+from service_tokens import ServiceTokenManager
+from purchase_ledger import PurchaseLedger
+from response_cache import VersionedResponseCache
+from event_hub import EventHub, HEARTBEAT_FRAME, format_event
+from log_pipeline import AccessLogMiddleware, LogPipeline
+from circuit_breaker import CircuitBreaker, OPEN
+from traffic_sketch import TrafficAnalytics
+from auth_gateway import AuthRequestGateway
+from invalidation_bus import InvalidationEvent, create_bus
+from traffic_capture import TrafficCaptureMiddleware
+from fast_path import FastPathMiddleware, MemoizedResponse, PrecomputedResponse, TimedResponse
+from token_prefilter import ParsedToken, TokenPrefilter
+from rate_limit import KeyedTokenBucket
+from bff_session import (
+    CookieCipher,
+    Session,
+    clear_chunked_cookie,
+    pkce_pair,
+    random_token,
+    read_chunked_cookie,
+    write_chunked_cookie,
+)
 
 # ============================================
 # CONFIGURACIÓN
@@ -37,14 +74,247 @@ JWKS_URL = f"{KEYCLOAK_BASE}/protocol/openid-connect/certs"
 AUTH_URL = f"{KEYCLOAK_BASE}/protocol/openid-connect/auth"
 LOGOUT_URL = f"{KEYCLOAK_BASE}/protocol/openid-connect/logout"
 
+# Enriquecimiento de /profile con userinfo cuando el token no trae email/name
+USERINFO_ENRICHMENT = os.getenv("USERINFO_ENRICHMENT", "true").lower() == "true"
+USERINFO_CACHE_TTL = int(os.getenv("USERINFO_CACHE_TTL", "300"))
+USERINFO_NEGATIVE_TTL = int(os.getenv("USERINFO_NEGATIVE_TTL", "30"))
+USERINFO_CACHE_SIZE = int(os.getenv("USERINFO_CACHE_SIZE", "10000"))
+
+# Back-channel logout: las revocaciones se recuerdan durante la vida máxima
+# de un access token; pasado ese tiempo el exp del token ya lo rechaza
+MAX_TOKEN_LIFETIME = int(os.getenv("MAX_TOKEN_LIFETIME", "3600"))
+REVOCATION_MAX_ENTRIES = int(os.getenv("REVOCATION_MAX_ENTRIES", "100000"))
+BACKCHANNEL_LOGOUT_AUDIENCE = os.getenv("BACKCHANNEL_LOGOUT_AUDIENCE", CLIENT_ID)
+BACKCHANNEL_LOGOUT_EVENT = "http://schemas.openid.net/event/backchannel-logout"
+
+# Caché de claves de firma (JWKS)
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", "300"))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", "10"))
+
+# Multi-tenant: realms cuyos tokens se aceptan (se enrutan por "iss").
+# KEYCLOAK_ISSUER_URL es la URL de Keycloak tal como aparece en "iss" (la que
+# ve el navegador); discovery y JWKS se descargan de KEYCLOAK_URL
+TRUSTED_REALMS = [realm.strip() for realm in os.getenv("TRUSTED_REALMS", REALM).split(",") if realm.strip()]
+KEYCLOAK_ISSUER_URL = os.getenv("KEYCLOAK_ISSUER_URL", KEYCLOAK_URL)
+MAX_LOADED_REALMS = int(os.getenv("MAX_LOADED_REALMS", "32"))
+
+# Validación de tokens en lote (POST /tokens/validate). Solo para cuentas de
+# servicio con uno de TOKEN_VALIDATE_ROLES, y limitado por cliente a
+# TOKEN_VALIDATE_RATE tokens/s (ráfagas de hasta TOKEN_VALIDATE_BURST)
+TOKEN_BATCH_MAX = int(os.getenv("TOKEN_BATCH_MAX", "500"))
+TOKEN_VALIDATE_ROLES = [role.strip() for role in os.getenv("TOKEN_VALIDATE_ROLES", "token-validator").split(",") if role.strip()]
+TOKEN_VALIDATE_RATE = float(os.getenv("TOKEN_VALIDATE_RATE", "1000"))
+TOKEN_VALIDATE_BURST = max(TOKEN_BATCH_MAX, int(os.getenv("TOKEN_VALIDATE_BURST", str(2 * TOKEN_BATCH_MAX))))
+if not TOKEN_VALIDATE_RATE > 0:
+    # Con rate 0 el cubo no se rellena nunca: mejor fallar al arrancar
+    raise ValueError(f"TOKEN_VALIDATE_RATE debe ser > 0 (es {TOKEN_VALIDATE_RATE})")
+TOKEN_BATCH_PARALLEL_THRESHOLD = int(os.getenv("TOKEN_BATCH_PARALLEL_THRESHOLD", "32"))
+TOKEN_BATCH_WORKERS = int(os.getenv("TOKEN_BATCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Verificación de firma fuera del event loop: los tokens ya verificados se
+# sirven inline desde la caché; el resto se verifica en un pool dedicado
+VERIFY_OFFLOAD = os.getenv("VERIFY_OFFLOAD", "true").lower() == "true"
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", str(min(4, os.cpu_count() or 1))))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# Filtro previo a la firma: tamaño, formato, algoritmos aceptados y claims sin
+# verificar; los tokens rechazados se recuerdan (por hash) durante el TTL
+TOKEN_MAX_SIZE = int(os.getenv("TOKEN_MAX_SIZE", "16384"))
+TOKEN_ALGORITHMS = [alg.strip() for alg in os.getenv("TOKEN_ALGORITHMS", ",".join(SUPPORTED_ALGORITHMS)).split(",") if alg.strip()]
+TOKEN_REJECT_CACHE_SIZE = int(os.getenv("TOKEN_REJECT_CACHE_SIZE", "10000"))
+TOKEN_REJECT_CACHE_TTL = float(os.getenv("TOKEN_REJECT_CACHE_TTL", "300"))
+
+# Ledger durable de compras: directorio absoluto (los compose usan /app/data).
+# Vacío (por defecto) = desactivado, las compras solo viven en memoria.
+# Las compras concurrentes comparten fsync; la ventana añade espera extra para agrupar más
+PURCHASE_LEDGER_DIR = os.getenv("PURCHASE_LEDGER_DIR", "")
+PURCHASE_COMMIT_WINDOW_MS = float(os.getenv("PURCHASE_COMMIT_WINDOW_MS", "0"))
+PURCHASE_SNAPSHOT_EVERY = int(os.getenv("PURCHASE_SNAPSHOT_EVERY", "10000"))
+
+# Server-Sent Events (/events): cola por conexión, límite de conexiones y
+# segundos entre heartbeats
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "10000"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+# Circuit breaker de las descargas de Keycloak (discovery, JWKS): fallos
+# seguidos para abrirlo y segundos que permanece abierto
+KEYCLOAK_FAILURE_THRESHOLD = int(os.getenv("KEYCLOAK_FAILURE_THRESHOLD", "5"))
+KEYCLOAK_RESET_TIMEOUT = float(os.getenv("KEYCLOAK_RESET_TIMEOUT", "30"))
+# Reintento del warm-up de los realms cuyo JWKS no se pudo cargar al arrancar
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+
+# Probes (/health, /health/live, /health/ready) y /metrics respondidos
+# antes de CORS y del routing de FastAPI con bytes precalculados. El texto de
+# /metrics se reutiliza durante METRICS_CACHE_TTL segundos
+FAST_PATH = os.getenv("FAST_PATH", "true").lower() == "true"
+METRICS_CACHE_TTL = float(os.getenv("METRICS_CACHE_TTL", "1"))
+
+# Heavy hitters del tráfico autenticado (usuarios, clientes, rutas) con
+# sketches de memoria fija, por ventanas de TRAFFIC_WINDOW segundos
+TRAFFIC_ANALYTICS = os.getenv("TRAFFIC_ANALYTICS", "true").lower() == "true"
+TRAFFIC_TOP_K = int(os.getenv("TRAFFIC_TOP_K", "20"))
+TRAFFIC_SKETCH_WIDTH = int(os.getenv("TRAFFIC_SKETCH_WIDTH", "2048"))
+TRAFFIC_SKETCH_DEPTH = int(os.getenv("TRAFFIC_SKETCH_DEPTH", "4"))
+TRAFFIC_WINDOW = float(os.getenv("TRAFFIC_WINDOW", "60"))
+
+# Bus de invalidación entre réplicas: JWKS rotado, sesión revocada y compra
+# se difunden para que el resto invalide sus cachés al momento.
+# INVALIDATION_BUS: memory:// (solo esta réplica), unix:///<directorio
+# compartido> o udp://<grupo multicast>:<puerto>. INVALIDATION_BUS_SECRET
+# firma los mensajes (HMAC); todas las réplicas deben compartirlo.
+# INVALIDATION_BUS_MAX_AGE: segundos tras los que un mensaje se descarta
+# (también el margen de reloj entre réplicas); impide reinyectar uno capturado
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "memory://")
+INVALIDATION_BUS_SECRET = os.getenv("INVALIDATION_BUS_SECRET", "")
+INVALIDATION_BUS_MAX_AGE = float(os.getenv("INVALIDATION_BUS_MAX_AGE", "30"))
+
+# Logs estructurados (JSON lines) de acceso, auditoría y errores, escritos
+# por lotes desde un hilo aparte. LOG_OUTPUT: "-" (stdout) o una ruta.
+# LOG_OVERFLOW_POLICY con el buffer lleno: drop (descartar) o block (esperar)
+LOG_OUTPUT = os.getenv("LOG_OUTPUT", "-")
+ACCESS_LOG = os.getenv("ACCESS_LOG", "true").lower() == "true"
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "drop")
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "false").lower() == "true"
+
+# Endpoint para nginx auth_request (204/401/403 + X-User, X-Roles). Se
+# atiende antes que cualquier middleware; también se puede servir solo, en un
+# Unix socket, con uvicorn main:auth_gateway --uds <ruta>
+AUTH_VERIFY_PATH = os.getenv("AUTH_VERIFY_PATH", "/auth/verify")
+
+# Captura de tráfico para benchmarks/replay.py (vacío = desactivada): forma
+# de cada request, sin credenciales, en JSON lines. CAPTURE_SALT fija los
+# seudónimos de usuario entre reinicios; CAPTURE_SAMPLE_RATE muestrea por usuario
+CAPTURE_OUTPUT = os.getenv("CAPTURE_OUTPUT", "")
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "1.0"))
+CAPTURE_SALT = os.getenv("CAPTURE_SALT", "")
+CAPTURE_COMPRESS = os.getenv("CAPTURE_COMPRESS", "false").lower() == "true"
+CAPTURE_EXCLUDE = [path.strip() for path in os.getenv(
+    "CAPTURE_EXCLUDE", "/health/live,/health/ready,/health,/metrics,/events"
+).split(",") if path.strip()]
+
+# Modo BFF: GET /login hace el Authorization Code Flow con PKCE y el token
+# set se guarda en una cookie cifrada; el bearer pasa a ser opcional.
+# BFF_COOKIE_SECRETS: secretos separados por comas (el primero cifra, todos
+# descifran). Todas las réplicas deben compartirlos
+BFF_ENABLED = os.getenv("BFF_ENABLED", "true").lower() == "true"
+BFF_COOKIE_SECRETS = [secret.strip() for secret in os.getenv("BFF_COOKIE_SECRETS", "").split(",") if secret.strip()]
+BFF_COOKIE_NAME = os.getenv("BFF_COOKIE_NAME", "kl_session")
+BFF_COOKIE_SECURE = os.getenv("BFF_COOKIE_SECURE", "false").lower() == "true"
+BFF_REDIRECT_URI = os.getenv("BFF_REDIRECT_URI", "http://localhost:8000/callback")
+BFF_REFRESH_MARGIN = int(os.getenv("BFF_REFRESH_MARGIN", "30"))
+BFF_COOKIE_CHUNK_SIZE = 3800
+BFF_MAX_COOKIE_CHUNKS = 5
+BFF_FLOW_TTL = 600
+BFF_FLOW_COOKIE = f"{BFF_COOKIE_NAME}_flow"
+# El navegador va a la URL pública de Keycloak, no a la interna
+BFF_AUTH_URL = f"{KEYCLOAK_ISSUER_URL}/realms/{REALM}/protocol/openid-connect/auth"
+
 # ============================================
 # INICIALIZACIÓN DE FASTAPI
 # ============================================
 
+log_pipeline = LogPipeline(
+    LOG_OUTPUT,
+    max_records=LOG_BUFFER_SIZE,
+    batch_size=LOG_BATCH_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    policy=LOG_OVERFLOW_POLICY,
+    compress=LOG_COMPRESS,
+)
+
+# Escritor propio: la captura no compite con los logs por el buffer
+capture_pipeline = LogPipeline(CAPTURE_OUTPUT, compress=CAPTURE_COMPRESS) if CAPTURE_OUTPUT else None
+
+keycloak_circuit = CircuitBreaker(KEYCLOAK_FAILURE_THRESHOLD, KEYCLOAK_RESET_TIMEOUT)
+
+invalidation_bus = create_bus(INVALIDATION_BUS, secret=INVALIDATION_BUS_SECRET or None, max_age=INVALIDATION_BUS_MAX_AGE)
+if not INVALIDATION_BUS.startswith("memory:") and not INVALIDATION_BUS_SECRET:
+    log_pipeline.emit(
+        "warning",
+        message="INVALIDATION_BUS_SECRET no definido: cualquiera con acceso al bus puede revocar sesiones",
+    )
+
+traffic_analytics = TrafficAnalytics(
+    k=TRAFFIC_TOP_K,
+    width=TRAFFIC_SKETCH_WIDTH,
+    depth=TRAFFIC_SKETCH_DEPTH,
+    window=TRAFFIC_WINDOW,
+) if TRAFFIC_ANALYTICS else None
+
+userinfo_cache = UserInfoCache(
+    USERINFO_URL,
+    ttl=USERINFO_CACHE_TTL,
+    negative_ttl=USERINFO_NEGATIVE_TTL,
+    max_entries=USERINFO_CACHE_SIZE,
+)
+
+revocation_list = RevocationList(ttl=MAX_TOKEN_LIFETIME, max_entries=REVOCATION_MAX_ENTRIES)
+
+# Tokens client_credentials para llamar a otros servicios protegidos:
+#   httpx.AsyncClient(auth=service_tokens.auth(scope="..."))
+# Requiere que el cliente sea confidencial (KEYCLOAK_CLIENT_SECRET)
+service_tokens = ServiceTokenManager(TOKEN_URL, CLIENT_ID, CLIENT_SECRET)
+
+purchase_ledger = PurchaseLedger(
+    PURCHASE_LEDGER_DIR,
+    commit_window=PURCHASE_COMMIT_WINDOW_MS / 1000,
+    snapshot_every=PURCHASE_SNAPSHOT_EVERY,
+) if PURCHASE_LEDGER_DIR else None
+
+# Difusión de cambios del catálogo a las conexiones de /events
+event_hub = EventHub(queue_size=EVENTS_QUEUE_SIZE, max_subscribers=EVENTS_MAX_SUBSCRIBERS)
+
+if BFF_ENABLED and not BFF_COOKIE_SECRETS:
+    log_pipeline.emit(
+        "warning",
+        message="BFF_COOKIE_SECRETS no definido: clave aleatoria, las sesiones no sobreviven a un reinicio ni se comparten entre réplicas",
+    )
+bff_cipher = CookieCipher(BFF_COOKIE_SECRETS or [os.urandom(32).hex()])
+_bff_client: Optional[httpx.AsyncClient] = None
+
+def bff_http() -> httpx.AsyncClient:
+    """Cliente HTTP del flujo BFF (token endpoint y logout), creado al primer uso"""
+    global _bff_client
+    if _bff_client is None or _bff_client.is_closed:
+        _bff_client = httpx.AsyncClient(timeout=10.0)
+    return _bff_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y parada de los recursos compartidos de la aplicación"""
+    log_pipeline.start()
+    if capture_pipeline is not None:
+        capture_pipeline.start()
+    await invalidation_bus.start()
+    if purchase_ledger is not None:
+        restore_purchases(await asyncio.to_thread(purchase_ledger.replay))
+        await purchase_ledger.start()
+    # El resto del warm-up corre con el servidor ya arriba: /health/live
+    # responde y /health/ready da 503 hasta que termine
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    warmup_task.cancel()
+    event_hub.close_all()
+    if purchase_ledger is not None:
+        await purchase_ledger.close()
+    await userinfo_cache.aclose()
+    await service_tokens.aclose()
+    if _bff_client is not None:
+        await _bff_client.aclose()
+    await invalidation_bus.close()
+    if capture_pipeline is not None:
+        capture_pipeline.close()
+    log_pipeline.close()
+
 app = FastAPI(
     title="FastAPI + Keycloak Demo",
     description="Aplicación de ejemplo con autenticación Keycloak",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS para permitir requests desde el frontend
@@ -56,8 +326,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Security schemes
-http_bearer = HTTPBearer()
+# Un registro "access" por request (último middleware: el más externo)
+if ACCESS_LOG:
+    app.add_middleware(AccessLogMiddleware, pipeline=log_pipeline)
+
+# Security schemes: sin cabecera Authorization se intenta la sesión BFF
+http_bearer = HTTPBearer(auto_error=False)
 
 # ============================================
 # MODELOS PYDANTIC
@@ -71,6 +345,49 @@ class UserInfo(BaseModel):
     roles: List[str] = []
     sub: str
 
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """
+    Identidad ligera del usuario autenticado para la cadena de dependencias
+
+    Se construye una vez por request a partir del payload ya verificado, sin
+    validación de Pydantic. Los roles son una tupla internada que comparten
+    todos los usuarios con el mismo conjunto de roles. Solo se convierte a
+    UserInfo cuando una respuesta necesita serializar el usuario completo.
+    """
+    username: str
+    sub: str
+    email: Optional[str] = None
+    name: Optional[str] = None
+    roles: Tuple[str, ...] = ()
+    sid: Optional[str] = None
+
+    @classmethod
+    def from_claims(cls, payload: Dict[str, Any]) -> "Principal":
+        """Construye el principal desde los claims del token"""
+        return cls(
+            username=payload.get("preferred_username", "unknown"),
+            sub=payload.get("sub"),
+            email=payload.get("email"),
+            name=payload.get("name"),
+            roles=intern_roles(payload.get("realm_access", {}).get("roles", ())),
+            sid=payload.get("sid"),
+        )
+
+    def has_any_role(self, roles: frozenset) -> bool:
+        """True si el usuario tiene al menos uno de los roles indicados"""
+        return not roles.isdisjoint(self.roles)
+
+    def to_user_info(self) -> UserInfo:
+        """Convierte al modelo Pydantic para serializarlo en una respuesta"""
+        return UserInfo(
+            username=self.username,
+            email=self.email,
+            name=self.name,
+            roles=list(self.roles),
+            sub=self.sub,
+        )
+
 class TokenResponse(BaseModel):
     """Respuesta del endpoint de token"""
     access_token: str
@@ -83,19 +400,172 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class TokenBatchRequest(BaseModel):
+    """Request para validar varios tokens en una sola llamada"""
+    tokens: List[str]
+
 # ============================================
 # FUNCIONES AUXILIARES
 # ============================================
 
-def get_jwks() -> Dict:
-    """Obtiene las claves públicas de Keycloak (JWKS)"""
+# Tuplas de roles ya vistas; el número de combinaciones distintas en un realm
+# es pequeño, así que el límite solo protege frente a tokens anómalos
+_ROLE_TUPLES: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+_ROLE_TUPLES_MAX = 1024
+
+def intern_roles(roles: Iterable[str]) -> Tuple[str, ...]:
+    """Devuelve una tupla de roles compartida para cada conjunto distinto"""
+    key = tuple(roles)
+    cached = _ROLE_TUPLES.get(key)
+    if cached is not None:
+        return cached
+    key = tuple(sys.intern(role) for role in key)
+    if len(_ROLE_TUPLES) < _ROLE_TUPLES_MAX:
+        _ROLE_TUPLES[key] = key
+    return key
+
+def route_of(request: Request) -> str:
+    """Plantilla de la ruta que atiende la request (/items/{item_id}/buy)"""
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+def audit(event: str, route: str, sub: Optional[str], **fields: Any) -> None:
+    """Registro de auditoría: qué pasó, en qué ruta y a quién (sub)"""
+    log_pipeline.emit("audit", event=event, route=route, sub=sub, **fields)
+
+def revoke_sessions(sid: Optional[str] = None, sub: Optional[str] = None) -> None:
+    """Añade la sesión (o todas las del usuario) a la denylist de todas las réplicas"""
+    revocation_list.revoke(sid=sid, sub=sub)
+    invalidation_bus.publish("session_revoked", sid=sid, sub=sub)
+
+def unverified_sub(token: str) -> Optional[str]:
+    """sub de un token recién emitido por Keycloak, sin verificar (solo para auditoría)"""
     try:
-        response = requests.get(JWKS_URL)
+        return parse_segment(split_token(token)[1]).get("sub")
+    except TokenVerificationError:
+        return None
+
+def fetch_json(url: str) -> Dict:
+    """
+    Descarga un documento JSON de Keycloak (discovery, JWKS)
+    
+    Devuelve {} si falla o si el circuito de Keycloak está abierto; en ese
+    caso no se intenta la conexión y se siguen usando las claves cargadas.
+    """
+    if not keycloak_circuit.allow():
+        return {}
+    try:
+        response = requests.get(url, timeout=10)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except Exception as e:
-        print(f"Error obteniendo JWKS: {e}")
+        keycloak_circuit.record_failure()
+        log_pipeline.emit("error", message="Error obteniendo documento de Keycloak", url=url, error=str(e))
         return {}
+    keycloak_circuit.record_success()
+    return data
+
+# Claves de firma por realm de confianza, cargadas al llegar el primer token de cada uno
+issuer_registry = IssuerRegistry(
+    [
+        IssuerConfig(
+            realm=realm,
+            issuer=f"{KEYCLOAK_ISSUER_URL}/realms/{realm}",
+            base_url=f"{KEYCLOAK_URL}/realms/{realm}",
+        )
+        for realm in TRUSTED_REALMS
+    ],
+    fetch_json=fetch_json,
+    max_loaded=MAX_LOADED_REALMS,
+    jwks_ttl=JWKS_CACHE_TTL,
+    min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+    on_keys_changed=lambda issuer: invalidation_bus.publish("jwks_changed", issuer=issuer),
+    on_issuer_mismatch=lambda expected, advertised: log_pipeline.emit(
+        "error",
+        message="El discovery del realm anuncia otro issuer: revisar KEYCLOAK_ISSUER_URL",
+        expected=expected,
+        advertised=advertised,
+    ),
+)
+
+# Rechazo de tokens inválidos antes de cargar el JWKS o verificar la firma
+token_prefilter = TokenPrefilter(
+    is_trusted_issuer=lambda issuer: issuer_registry.config_for(issuer) is not None,
+    max_size=TOKEN_MAX_SIZE,
+    algorithms=TOKEN_ALGORITHMS,
+    leeway=issuer_registry.leeway,
+    cache_size=TOKEN_REJECT_CACHE_SIZE,
+    cache_ttl=TOKEN_REJECT_CACHE_TTL,
+)
+
+# Detalle de cada motivo de rechazo: fijo, nunca el texto de una excepción
+TOKEN_ERROR_DETAILS = {
+    "malformed": "Token inválido: formato incorrecto",
+    "too_large": "Token inválido: demasiado grande",
+    "unsupported_alg": "Token inválido: algoritmo no permitido",
+    "unknown_key": "No se pudo validar el token - clave no encontrada",
+    "invalid_issuer": "Token inválido: emisor no permitido",
+    "invalid_claims": "Token inválido: claims incorrectos",
+    "expired": "Token inválido: expirado",
+    "not_yet_valid": "Token inválido: aún no es válido",
+    "bad_signature": "Token inválido: firma incorrecta",
+    "revoked": "Sesión revocada",
+    "invalid_token": "Token inválido",
+    "verification_error": "Error validando token",
+}
+
+def token_error_detail(reason: str) -> str:
+    return TOKEN_ERROR_DETAILS.get(reason, TOKEN_ERROR_DETAILS["invalid_token"])
+
+def token_http_error(reason: str) -> HTTPException:
+    """401 con el motivo del rechazo (RFC 6750: error="invalid_token")"""
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=token_error_detail(reason),
+        headers={"WWW-Authenticate": f'Bearer error="invalid_token", error_description="{reason}"'},
+    )
+
+def verify_parsed_token(parsed: ParsedToken) -> Dict[str, Any]:
+    """
+    Verifica firma y claims de un token que ya pasó el prefiltro
+    
+    Si el kid no se conoce, recarga el JWKS de ese realm una vez y reintenta.
+    Los rechazos deterministas se recuerdan en la caché negativa.
+    
+    Raises:
+        TokenVerificationError: Si el token es inválido
+    """
+    try:
+        return issuer_registry.verify_segments(parsed.segments, parsed.payload, parsed.header)
+    except TokenVerificationError as e:
+        token_prefilter.reject(parsed, e)
+        raise
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """
+    Verifica el token con las claves del realm que lo emitió
+    
+    Primero las comprobaciones baratas (token_prefilter), después la firma.
+    
+    Raises:
+        TokenVerificationError: Si el token es inválido o su emisor no es de confianza
+    """
+    return verify_parsed_token(token_prefilter.check(token))
+
+def decode_parsed_token(parsed: ParsedToken) -> Dict[str, Any]:
+    """
+    decode_token para un token que ya pasó el prefiltro
+    
+    Raises:
+        HTTPException: 401 con un detalle fijo según el motivo
+    """
+    try:
+        return verify_parsed_token(parsed)
+    except TokenVerificationError as e:
+        raise token_http_error(e.reason)
+    except Exception as e:
+        log_pipeline.emit("error", message="Error validando token", error=str(e))
+        raise token_http_error("verification_error")
 
 def decode_token(token: str) -> Dict[str, Any]:
     """
@@ -111,81 +581,342 @@ def decode_token(token: str) -> Dict[str, Any]:
         HTTPException: Si el token es inválido
     """
     try:
-        # Obtener JWKS
-        jwks = get_jwks()
-        
-        # Decodificar sin verificar primero para obtener el header
-        unverified_header = jwt.get_unverified_header(token)
-        
-        # Buscar la clave correcta en JWKS
-        rsa_key = {}
-        for key in jwks.get("keys", []):
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-                break
-        
-        if not rsa_key:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="No se pudo validar el token - clave no encontrada",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
-        # Decodificar y validar el token
-        payload = jwt.decode(
-            token,
-            rsa_key,
-            algorithms=["RS256"],
-            audience="account",  # Keycloak usa "account" como audience por defecto
-            options={"verify_aud": False}  # Desactivar por ahora para simplificar
-        )
-        
-        return payload
-        
-    except JWTError as e:
+        parsed = token_prefilter.check(token)
+    except TokenVerificationError as e:
+        raise token_http_error(e.reason)
+    return decode_parsed_token(parsed)
+
+# Pool dedicado a la verificación de tokens del path autenticado
+_verify_executor = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix="token-verify")
+
+# Tokens ya verificados: token -> (payload, exp). Solo se escribe desde el
+# event loop, así que no necesita lock
+_token_cache: Dict[str, Tuple[Dict[str, Any], float]] = {}
+
+def _cache_token(token: str, payload: Dict[str, Any]) -> None:
+    """Guarda un token verificado hasta su exp, expulsando el más antiguo si está lleno"""
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)) or TOKEN_CACHE_SIZE <= 0:
+        return
+    if len(_token_cache) >= TOKEN_CACHE_SIZE:
+        _token_cache.pop(next(iter(_token_cache)), None)
+    _token_cache[token] = (payload, exp)
+
+async def decode_token_async(token: str) -> Dict[str, Any]:
+    """
+    Versión async de decode_token que no bloquea el event loop
+    
+    Un token ya verificado y no expirado se resuelve inline (lookup en dict),
+    y uno que no pasa el prefiltro se rechaza también inline. El resto (recarga
+    de JWKS y verificación de firma) se ejecuta en el pool de verificación
+    (salvo VERIFY_OFFLOAD=false).
+    """
+    cached = _token_cache.get(token)
+    if cached is not None:
+        if cached[1] > time.time():
+            return cached[0]
+        _token_cache.pop(token, None)
+    
+    try:
+        parsed = token_prefilter.check(token)
+    except TokenVerificationError as e:
+        raise token_http_error(e.reason)
+    if VERIFY_OFFLOAD:
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(_verify_executor, decode_parsed_token, parsed)
+    else:
+        payload = decode_parsed_token(parsed)
+    
+    _cache_token(token, payload)
+    return payload
+
+# Presupuesto de verificaciones de /tokens/validate por cliente
+token_validate_limiter = KeyedTokenBucket(rate=TOKEN_VALIDATE_RATE, burst=TOKEN_VALIDATE_BURST)
+
+# Pool para repartir la verificación RSA de lotes grandes
+_batch_executor = ThreadPoolExecutor(max_workers=TOKEN_BATCH_WORKERS, thread_name_prefix="token-batch")
+
+def _rejected(reason: str) -> Dict[str, Any]:
+    return {"valid": False, "error": token_error_detail(reason), "reason": reason}
+
+def _verify_batch_item(verifier: JWTVerifier, parsed: ParsedToken) -> Dict[str, Any]:
+    """Verifica un token del lote y devuelve su resultado (nunca lanza)"""
+    try:
+        return {"valid": True, "claims": verifier.verify_segments(*parsed.segments, parsed.payload, parsed.header)}
+    except TokenVerificationError as e:
+        token_prefilter.reject(parsed, e)
+        return _rejected(e.reason)
+    except Exception as e:
+        log_pipeline.emit("error", message="Error validando token", error=str(e))
+        return _rejected("verification_error")
+
+def validate_token_batch(tokens: List[str]) -> List[Dict[str, Any]]:
+    """
+    Valida un lote de tokens con como mucho una recarga de JWKS
+    
+    - Los tokens repetidos se verifican una sola vez
+    - Los que no pasan el prefiltro se rechazan sin cargar ningún JWKS
+    - El resto se agrupa por emisor y kid; si alguno no se conoce, el
+      JWKS de ese realm se recarga una sola vez para todo el lote
+    - Los lotes grandes reparten la verificación en un pool de hilos
+    
+    Returns:
+        Un resultado por token, en el mismo orden que la entrada
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    groups: Dict[Tuple[str, str], List[Tuple[str, ParsedToken]]] = {}
+    
+    for token in dict.fromkeys(tokens):
+        try:
+            parsed = token_prefilter.check(token)
+        except TokenVerificationError as e:
+            results[token] = _rejected(e.reason)
+            continue
+        groups.setdefault((parsed.payload["iss"], parsed.header["kid"]), []).append((token, parsed))
+    
+    # Se guarda el verificador de cada realm: un lote con más realms que
+    # MAX_LOADED_REALMS no debe expulsar los que aún tiene que usar
+    verifiers: Dict[str, JWTVerifier] = {}
+    kids_by_issuer: Dict[str, List[str]] = {}
+    for issuer, kid in groups:
+        kids_by_issuer.setdefault(issuer, []).append(kid)
+    for issuer, kids in kids_by_issuer.items():
+        tenant = issuer_registry.tenant(issuer)
+        issuer_registry.refresh(tenant)
+        if not all(tenant.verifier.has_key(kid) for kid in kids):
+            issuer_registry.refresh(tenant, force=True)
+        verifiers[issuer] = tenant.verifier
+    
+    work = [item for group in groups.values() for item in group]
+    work_verifiers = [verifiers[issuer] for (issuer, _), group in groups.items() for _ in group]
+    work_parsed = [parsed for _, parsed in work]
+    if len(work) >= TOKEN_BATCH_PARALLEL_THRESHOLD:
+        chunksize = max(1, len(work) // (TOKEN_BATCH_WORKERS * 4))
+        verified = _batch_executor.map(_verify_batch_item, work_verifiers, work_parsed, chunksize=chunksize)
+    else:
+        verified = map(_verify_batch_item, work_verifiers, work_parsed)
+    for (token, _), result in zip(work, verified):
+        results[token] = result
+    
+    return [results[token] for token in tokens]
+
+def validate_logout_token(logout_token: str) -> Dict[str, Any]:
+    """
+    Valida un logout token de Keycloak (OIDC Back-Channel Logout 1.0, 2.6)
+    
+    Raises:
+        TokenVerificationError: Si la firma o los claims no son válidos
+    """
+    claims = verify_token(logout_token)
+    
+    audience = claims.get("aud")
+    audiences = audience if isinstance(audience, list) else [audience]
+    if BACKCHANNEL_LOGOUT_AUDIENCE not in audiences:
+        raise TokenVerificationError("Audience no válida")
+    if "iat" not in claims:
+        raise TokenVerificationError("Falta el claim iat")
+    events = claims.get("events")
+    if not isinstance(events, dict) or BACKCHANNEL_LOGOUT_EVENT not in events:
+        raise TokenVerificationError("No es un logout token")
+    if "nonce" in claims:
+        raise TokenVerificationError("Un logout token no puede llevar nonce")
+    if not claims.get("sid") and not claims.get("sub"):
+        raise TokenVerificationError("Falta sid o sub")
+    
+    return claims
+
+# ============================================
+# SESIONES BFF (COOKIE CIFRADA)
+# ============================================
+
+bff_cookie_options = {
+    "httponly": True,
+    "secure": BFF_COOKIE_SECURE,
+    "samesite": "lax",
+    "path": "/",
+}
+
+# Refrescos en curso por refresh token: las requests concurrentes de una
+# misma sesión comparten una sola llamada al token endpoint
+_bff_refreshes: Dict[str, asyncio.Task] = {}
+
+async def request_tokens(data: Dict[str, str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Pide un token set al token endpoint y verifica el access token
+    
+    La firma solo se verifica aquí (login y refresh); después la cookie
+    cifrada basta para autenticar cada request.
+    
+    Returns:
+        (respuesta del token endpoint, claims del access token)
+    
+    Raises:
+        httpx.HTTPError: Si Keycloak no responde o rechaza el grant
+        TokenVerificationError: Si el access token no es válido
+    """
+    data = {"client_id": CLIENT_ID, **data}
+    if CLIENT_SECRET:
+        data["client_secret"] = CLIENT_SECRET
+    response = await bff_http().post(TOKEN_URL, data=data)
+    response.raise_for_status()
+    token_data = response.json()
+    loop = asyncio.get_running_loop()
+    claims = await loop.run_in_executor(_verify_executor, verify_token, token_data["access_token"])
+    return token_data, claims
+
+async def _refresh_bff_session(refresh_token: str) -> Optional[Session]:
+    try:
+        token_data, claims = await request_tokens({"grant_type": "refresh_token", "refresh_token": refresh_token})
+    except (httpx.HTTPError, TokenVerificationError, KeyError, ValueError) as e:
+        log_pipeline.emit("error", message="Error refrescando sesión BFF", error=str(e))
+        return None
+    return Session.from_token_response(token_data, claims)
+
+async def refresh_bff_session(session: Session) -> Optional[Session]:
+    """Sesión con tokens nuevos, o None si no se pudo refrescar"""
+    refresh_token = session.refresh_token
+    if not refresh_token:
+        return None
+    task = _bff_refreshes.get(refresh_token)
+    if task is None:
+        task = asyncio.ensure_future(_refresh_bff_session(refresh_token))
+        _bff_refreshes[refresh_token] = task
+        task.add_done_callback(lambda _: _bff_refreshes.pop(refresh_token, None))
+    return await asyncio.shield(task)
+
+def write_session_cookie(response: Response, request: Request, session: Session) -> None:
+    """Cifra la sesión y la escribe (en trozos si hace falta) en la respuesta"""
+    write_chunked_cookie(
+        response,
+        request.cookies,
+        BFF_COOKIE_NAME,
+        bff_cipher.seal(session.to_dict(), BFF_COOKIE_NAME),
+        BFF_COOKIE_CHUNK_SIZE,
+        BFF_MAX_COOKIE_CHUNKS,
+        max_age=session.max_age(),
+        **bff_cookie_options,
+    )
+
+def clear_session_cookie(response: Response, request: Request) -> None:
+    clear_chunked_cookie(response, request.cookies, BFF_COOKIE_NAME, BFF_MAX_COOKIE_CHUNKS, **bff_cookie_options)
+
+def _session_error(detail: str) -> HTTPException:
+    """
+    401 que además borra la cookie de sesión
+    
+    Las cookies puestas en la Response de la dependency se pierden al lanzar
+    la excepción; basta con borrar el primer trozo para que el resto se ignore
+    y el navegador no siga enviando (y refrescando) una sesión muerta.
+    """
+    cleared = Response()
+    cleared.delete_cookie(f"{BFF_COOKIE_NAME}.0", **bff_cookie_options)
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer", "Set-Cookie": cleared.headers["set-cookie"]},
+    )
+
+def load_bff_session(cookies: Mapping[str, str]) -> Optional[Session]:
+    """
+    Sesión descifrada de la cookie, sin comprobar expiración
+    
+    Raises:
+        HTTPException: 401 si la cookie está manipulada o no es una sesión
+    """
+    value = read_chunked_cookie(cookies, BFF_COOKIE_NAME, BFF_MAX_COOKIE_CHUNKS)
+    if value is None:
+        return None
+    data = bff_cipher.unseal(value, BFF_COOKIE_NAME)
+    session = Session.from_dict(data) if data is not None else None
+    if session is None:
+        raise _session_error("Sesión no válida")
+    return session
+
+# ============================================
+# DEPENDENCIES
+# ============================================
+
+async def get_bff_session(
+    request: Request,
+    response: Response,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer),
+) -> Optional[Session]:
+    """
+    Sesión BFF de la cookie; None si la request trae bearer o no hay sesión
+    
+    Si al access token le quedan menos de BFF_REFRESH_MARGIN segundos se
+    refresca aquí mismo y la cookie nueva sale en esta respuesta.
+    
+    Raises:
+        HTTPException: 401 si la cookie está manipulada o la sesión caducó sin poder refrescarse
+    """
+    if credentials is not None or not BFF_ENABLED:
+        return None
+    session = load_bff_session(request.cookies)
+    if session is None:
+        return None
+    
+    if session.expires_at - time.time() > BFF_REFRESH_MARGIN:
+        return session
+    refreshed = await refresh_bff_session(session)
+    if refreshed is not None:
+        write_session_cookie(response, request, refreshed)
+        return refreshed
+    # Sin refresh (Keycloak caído o sesión cerrada) el token vale hasta su exp
+    if session.expires_at > time.time():
+        return session
+    raise _session_error("Sesión caducada")
+
+async def get_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer),
+    session: Optional[Session] = Depends(get_bff_session),
+) -> Dict[str, Any]:
+    """
+    Claims verificados del bearer o, si no hay bearer, de la sesión BFF
+    
+    Raises:
+        HTTPException: 401 si no hay credenciales, no son válidas o la sesión está revocada
+    """
+    if credentials is not None:
+        payload = await decode_token_async(credentials.credentials)
+    elif session is not None:
+        payload = session.claims
+    else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Token inválido: {str(e)}",
+            detail="No autenticado",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    except Exception as e:
+    
+    # Sesión cerrada en Keycloak (back-channel logout): lookup local, sin red
+    if revocation_list.is_revoked(payload):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Error validando token: {str(e)}",
+            detail="Sesión revocada",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload
 
-# ============================================
-# DEPENDENCIES
-# ============================================
-
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(http_bearer)) -> UserInfo:
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer),
+    session: Optional[Session] = Depends(get_bff_session),
+    request: Request = None,
+) -> Principal:
     """
-    Dependency que obtiene el usuario actual desde el token JWT
+    Dependency que obtiene el usuario actual desde el token JWT o la sesión BFF
+    
+    Devuelve un Principal inmutable; usar user.to_user_info() solo si la
+    respuesta necesita el modelo Pydantic.
     
     Uso:
         @app.get("/protected")
-        async def protected_route(user: UserInfo = Depends(get_current_user)):
+        async def protected_route(user: Principal = Depends(get_current_user)):
             return {"message": f"Hola {user.username}"}
     """
-    token = credentials.credentials
-    payload = decode_token(token)
-    
-    # Extraer información del usuario
-    user = UserInfo(
-        username=payload.get("preferred_username", "unknown"),
-        email=payload.get("email"),
-        name=payload.get("name"),
-        roles=payload.get("realm_access", {}).get("roles", []),
-        sub=payload.get("sub")
-    )
-    
+    payload = await get_token_claims(credentials, session)
+    user = Principal.from_claims(payload)
+    if traffic_analytics is not None:
+        traffic_analytics.record(user.sub, payload.get("azp"), route_of(request) if request is not None else None)
     return user
 
 def require_role(required_roles: List[str]):
@@ -194,14 +925,24 @@ def require_role(required_roles: List[str]):
     
     Uso:
         @app.get("/admin")
-        async def admin_only(user: UserInfo = Depends(require_role(["admin"]))):
+        async def admin_only(user: Principal = Depends(require_role(["admin"]))):
             return {"message": "Área de admin"}
     """
-    async def role_checker(user: UserInfo = Depends(get_current_user)) -> UserInfo:
-        if not any(role in user.roles for role in required_roles):
+    required = frozenset(required_roles)
+    detail = f"Se requiere uno de estos roles: {', '.join(required_roles)}"
+
+    async def role_checker(user: Principal = Depends(get_current_user), request: Request = None) -> Principal:
+        if not user.has_any_role(required):
+            audit(
+                "access_denied",
+                route_of(request) if request is not None else None,
+                user.sub,
+                username=user.username,
+                required_roles=required_roles,
+            )
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Se requiere uno de estos roles: {', '.join(required_roles)}"
+                detail=detail
             )
         return user
     return role_checker
@@ -213,6 +954,9 @@ def require_role(required_roles: List[str]):
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Página principal con información y botones de login"""
+    return HTMLResponse(prerendered_page("/"))
+
+def render_root_page() -> str:
     html_content = f"""
     <!DOCTYPE html>
     <html>
@@ -278,6 +1022,7 @@ async def root():
 
             <h3>🚀 Acciones</h3>
             <a href="/login-page" class="button">🔑 Login (Página)</a>
+            <a href="/login" class="button">🔐 Login con Keycloak (BFF)</a>
             <a href="{KEYCLOAK_URL}/realms/{REALM}/account" class="button" target="_blank">👤 Mi Cuenta</a>
             <a href="/docs" class="button" target="_blank">📚 API Docs</a>
 
@@ -333,15 +1078,162 @@ curl http://localhost:8000/profile \\
     """
     return html_content
 
-@app.get("/health")
-async def health():
-    """Health check endpoint"""
+# Resultado del warm-up para /health/ready
+warmup_state: Dict[str, Any] = {"done": False, "duration_ms": None, "steps": {}}
+
+async def warm_up() -> None:
+    """
+    Deja la réplica lista antes de que reciba tráfico
+    
+    Los índices de items ya están cargados (import y replay del ledger). En
+    paralelo: discovery y JWKS de cada realm de confianza (las claves RSA se
+    construyen al cargar el JWKS), páginas HTML y cuerpos de /items (JSON y
+    gzip). Los realms que se quedan sin claves se reintentan cada
+    WARMUP_RETRY_INTERVAL segundos; el warm-up no termina hasta tenerlas.
+    """
+    start = time.perf_counter()
+    steps = warmup_state["steps"]
+    
+    async def load_realm(issuer: str) -> None:
+        step_start = time.perf_counter()
+        tenant = issuer_registry.tenant(issuer)
+        while True:
+            await asyncio.to_thread(issuer_registry.refresh, tenant, True)
+            if tenant.verifier.key_count:
+                break
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+        steps[f"jwks:{tenant.config.realm}"] = round((time.perf_counter() - step_start) * 1000, 1)
+    
+    async def render_static() -> None:
+        step_start = time.perf_counter()
+        for path in PAGE_RENDERERS:
+            prerendered_page(path)
+        for available in (False, True):
+            await get_items(available=available, if_none_match=None, accept_encoding="gzip")
+        steps["pages+items"] = round((time.perf_counter() - step_start) * 1000, 1)
+    
+    # Solo los realms que caben cargados a la vez; el resto se carga al llegar su primer token
+    issuers = issuer_registry.issuers[:MAX_LOADED_REALMS]
+    await asyncio.gather(render_static(), *(load_realm(issuer) for issuer in issuers))
+    
+    warmup_state["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    warmup_state["done"] = True
+    log_pipeline.emit("warmup", duration_ms=warmup_state["duration_ms"], steps=dict(steps))
+
+def health_status() -> Dict[str, Any]:
     return {
         "status": "healthy",
         "keycloak_url": KEYCLOAK_URL,
         "realm": REALM
     }
 
+@app.get("/health")
+async def health():
+    """Health check endpoint"""
+    return health_status()
+
+def _label(value: Any) -> str:
+    """Escapa un valor de etiqueta para el formato de texto de Prometheus"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_metrics() -> str:
+    """Métricas de la aplicación en formato de texto de Prometheus"""
+    lines = []
+    
+    def metric(name: str, kind: str, help_text: str, samples: Iterable[Tuple[str, Any]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{labels} {value}")
+    
+    metric("keycloak_lab_ready", "gauge", "1 si /health/ready responde 200",
+           [("", int(warmup_state["done"] and keycloak_circuit.state != OPEN))])
+    metric("keycloak_lab_keycloak_circuit_open", "gauge", "1 si el circuito de Keycloak está abierto",
+           [("", int(keycloak_circuit.state == OPEN))])
+    metric("keycloak_lab_token_cache_entries", "gauge", "Tokens verificados en caché", [("", len(_token_cache))])
+    prefilter = token_prefilter.stats()
+    metric("keycloak_lab_token_rejections_total", "counter", "Tokens rechazados por motivo",
+           [(f'{{reason="{reason}"}}', count) for reason, count in sorted(prefilter["rejections"].items())])
+    metric("keycloak_lab_token_reject_cache_hits_total", "counter", "Rechazos servidos desde la caché negativa",
+           [("", prefilter["cache_hits"])])
+    metric("keycloak_lab_token_reject_cache_entries", "gauge", "Hashes de tokens rechazados en caché",
+           [("", prefilter["cache_entries"])])
+    metric("keycloak_lab_catalog_cache_hits_total", "counter", "Lecturas de /items servidas desde caché",
+           [("", catalog_cache.hits)])
+    metric("keycloak_lab_catalog_cache_misses_total", "counter", "Lecturas de /items que serializaron el catálogo",
+           [("", catalog_cache.misses)])
+    hub = event_hub.stats()
+    metric("keycloak_lab_event_subscribers", "gauge", "Conexiones abiertas en /events", [("", hub["subscribers"])])
+    metric("keycloak_lab_event_subscribers_dropped_total", "counter", "Clientes de /events desconectados por lentos",
+           [("", hub["dropped"])])
+    bus = invalidation_bus.stats()
+    metric("keycloak_lab_invalidation_events_sent_total", "counter", "Eventos de invalidación enviados a otras réplicas",
+           [("", bus["sent"])])
+    metric("keycloak_lab_invalidation_events_received_total", "counter", "Eventos de invalidación recibidos",
+           [("", bus["received"])])
+    metric("keycloak_lab_invalidation_events_rejected_total", "counter", "Mensajes del bus descartados (firma o formato)",
+           [("", bus["rejected"])])
+    logs = log_pipeline.stats()
+    metric("keycloak_lab_log_records_written_total", "counter", "Registros de log escritos", [("", logs["written"])])
+    metric("keycloak_lab_log_records_dropped_total", "counter", "Registros de log descartados", [("", logs["dropped"])])
+    
+    if traffic_analytics is not None:
+        current = traffic_analytics.report(TRAFFIC_TOP_K)["current"]
+        metric("keycloak_lab_window_requests", "gauge", "Requests autenticadas en la ventana en curso",
+               [("", current["total"])])
+        # /metrics no lleva autenticación: nada de subs ni de paths crudos
+        # (los de auth_request vienen del upstream y pueden llevar ids). El
+        # top de usuarios y las rutas completas solo salen en /admin/traffic
+        templates = {getattr(route, "path", None) for route in app.routes}
+        public = {
+            "clients": current["clients"],
+            "routes": [row for row in current["routes"] if row["route"] in templates],
+        }
+        for dimension, label in (("clients", "client"), ("routes", "route")):
+            metric(
+                f"keycloak_lab_top_{dimension}_requests",
+                "gauge",
+                f"Top-{TRAFFIC_TOP_K} por {label} en la ventana en curso (space-saving)",
+                [(f'{{{label}="{_label(row[label])}"}}', row["requests"]) for row in public[dimension]],
+            )
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas para Prometheus (cachés, eventos, logs y heavy hitters)"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness: el proceso responde (no depende de Keycloak)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """
+    Readiness: 200 cuando el warm-up ha terminado y el circuito de Keycloak
+    no está abierto; 503 en otro caso
+    """
+    status_code, body = readiness()
+    return JSONResponse(body, status_code=status_code, headers={"Cache-Control": "no-store"})
+
+def readiness() -> Tuple[int, Dict[str, Any]]:
+    """Código y cuerpo de /health/ready"""
+    circuit = keycloak_circuit.state
+    if not warmup_state["done"]:
+        state = "warming_up"
+    elif circuit == OPEN:
+        state = "keycloak_unavailable"
+    else:
+        state = "ready"
+    body = {
+        "status": state,
+        "warmup_ms": warmup_state["duration_ms"],
+        "warmup_steps": warmup_state["steps"],
+        "keycloak_circuit": circuit,
+    }
+    return (status.HTTP_200_OK if state == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE), body
+
 @app.get("/info")
 async def info():
     """Información de configuración de Keycloak"""
@@ -350,6 +1242,7 @@ async def info():
         return {
             "keycloak_url": KEYCLOAK_URL,
             "realm": REALM,
+            "trusted_realms": TRUSTED_REALMS,
             "client_id": CLIENT_ID,
             "endpoints": {
                 "authorization": oidc_config.get("authorization_endpoint"),
@@ -369,7 +1262,7 @@ async def info():
 # ============================================
 
 @app.post("/login", response_model=TokenResponse)
-async def login(request: LoginRequest):
+async def login(request: LoginRequest, http_request: Request):
     """
     Login con usuario y contraseña (Direct Access Grant / Password Flow)
     
@@ -396,13 +1289,22 @@ async def login(request: LoginRequest):
         
         response = requests.post(TOKEN_URL, data=data)
         
+        client_ip = http_request.client.host if http_request.client else None
         if response.status_code != 200:
+            audit("login_failure", "/login", None, username=request.username, client=client_ip)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Credenciales inválidas"
             )
         
         token_data = response.json()
+        audit(
+            "login_success",
+            "/login",
+            unverified_sub(token_data["access_token"]),
+            username=request.username,
+            client=client_ip,
+        )
         
         return TokenResponse(
             access_token=token_data["access_token"],
@@ -454,9 +1356,163 @@ async def refresh_token(refresh_token: str):
             detail=f"Error refrescando token: {str(e)}"
         )
 
+@app.get("/login")
+async def bff_login(return_to: str = "/"):
+    """
+    Inicia el Authorization Code Flow con PKCE (modo BFF)
+    
+    Redirige a Keycloak, que vuelve a /callback. state, nonce y el
+    code_verifier viajan en una cookie cifrada de corta duración, así que
+    tampoco hace falta estado en el servidor para el flujo.
+    """
+    if not BFF_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Modo BFF desactivado")
+    # Solo rutas locales: evita usar /login como open redirect
+    if not return_to.startswith("/") or return_to.startswith("//") or "\\" in return_to:
+        return_to = "/"
+    
+    verifier, challenge = pkce_pair()
+    flow = {
+        "state": random_token(),
+        "nonce": random_token(),
+        "verifier": verifier,
+        "return_to": return_to,
+        "exp": time.time() + BFF_FLOW_TTL,
+    }
+    params = urlencode({
+        "client_id": CLIENT_ID,
+        "response_type": "code",
+        "scope": "openid profile email",
+        "redirect_uri": BFF_REDIRECT_URI,
+        "state": flow["state"],
+        "nonce": flow["nonce"],
+        "code_challenge": challenge,
+        "code_challenge_method": "S256",
+    })
+    response = RedirectResponse(f"{BFF_AUTH_URL}?{params}", status_code=status.HTTP_302_FOUND)
+    response.set_cookie(BFF_FLOW_COOKIE, bff_cipher.seal(flow, BFF_FLOW_COOKIE), max_age=BFF_FLOW_TTL, **bff_cookie_options)
+    return response
+
+@app.get("/callback")
+async def bff_callback(
+    request: Request,
+    code: Optional[str] = None,
+    state: Optional[str] = None,
+    error: Optional[str] = None,
+):
+    """
+    Vuelta del Authorization Code Flow: canjea el code y abre la sesión BFF
+    """
+    if not BFF_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Modo BFF desactivado")
+    if error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Login cancelado: {error}")
+    
+    flow_cookie = request.cookies.get(BFF_FLOW_COOKIE)
+    flow = bff_cipher.unseal(flow_cookie, BFF_FLOW_COOKIE) if flow_cookie else None
+    if (
+        flow is None
+        or flow.get("exp", 0) < time.time()
+        or not code
+        or not state
+        or not hmac.compare_digest(state, flow.get("state", ""))
+    ):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Flujo de login no válido o caducado")
+    
+    try:
+        token_data, claims = await request_tokens({
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": BFF_REDIRECT_URI,
+            "code_verifier": flow["verifier"],
+        })
+        loop = asyncio.get_running_loop()
+        id_claims = await loop.run_in_executor(_verify_executor, verify_token, token_data.get("id_token", ""))
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        audit("login_failure", "/callback", None, method="bff", reason=str(e))
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"No se pudo completar el login: {e}")
+    except TokenVerificationError as e:
+        audit("login_failure", "/callback", None, method="bff", reason=str(e))
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Token inválido: {e}")
+    
+    audience = id_claims.get("aud")
+    audiences = audience if isinstance(audience, list) else [audience]
+    if id_claims.get("nonce") != flow["nonce"] or CLIENT_ID not in audiences:
+        audit("login_failure", "/callback", claims.get("sub"), method="bff", reason="nonce o audience del ID token")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="ID token no corresponde a este login")
+    
+    audit("login_success", "/callback", claims.get("sub"), username=claims.get("preferred_username"), method="bff")
+    session = Session.from_token_response(token_data, claims)
+    response = RedirectResponse(flow["return_to"], status_code=status.HTTP_303_SEE_OTHER)
+    try:
+        write_session_cookie(response, request, session)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    response.delete_cookie(BFF_FLOW_COOKIE, **bff_cookie_options)
+    return response
+
+@app.get("/logout")
+async def bff_logout(request: Request):
+    """
+    Cierra la sesión BFF: borra la cookie y cierra la sesión en Keycloak
+    
+    Keycloak avisa después a /backchannel-logout, así que los tokens de esa
+    sesión dejan de aceptarse también como bearer.
+    """
+    response = RedirectResponse("/", status_code=status.HTTP_303_SEE_OTHER)
+    value = read_chunked_cookie(request.cookies, BFF_COOKIE_NAME, BFF_MAX_COOKIE_CHUNKS)
+    data = bff_cipher.unseal(value, BFF_COOKIE_NAME) if value else None
+    session = Session.from_dict(data) if data is not None else None
+    if session is not None:
+        audit("logout", "/logout", session.claims.get("sub"), sid=session.claims.get("sid"))
+        if session.claims.get("sid"):
+            revoke_sessions(sid=session.claims["sid"])
+        if session.refresh_token:
+            data = {"client_id": CLIENT_ID, "refresh_token": session.refresh_token}
+            if CLIENT_SECRET:
+                data["client_secret"] = CLIENT_SECRET
+            try:
+                await bff_http().post(LOGOUT_URL, data=data)
+            except httpx.HTTPError as e:
+                log_pipeline.emit("error", message="Error cerrando sesión en Keycloak", error=str(e))
+    clear_session_cookie(response, request)
+    return response
+
+@app.post("/backchannel-logout")
+async def backchannel_logout(logout_token: str = Form(...)):
+    """
+    Receptor de OIDC Back-Channel Logout
+    
+    Keycloak llama a este endpoint (configurado como "Backchannel logout URL"
+    del cliente) al cerrar una sesión. El sid y el sub del logout token se
+    añaden a la denylist, así que los access tokens de esa sesión dejan de
+    aceptarse aunque no hayan expirado.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        claims = await loop.run_in_executor(_verify_executor, validate_logout_token, logout_token)
+    except TokenVerificationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Logout token inválido: {str(e)}",
+            headers={"Cache-Control": "no-store"},
+        )
+    
+    audit("session_revoked", "/backchannel-logout", claims.get("sub"), sid=claims.get("sid"))
+    # Con sid solo se revoca esa sesión; sin sid, todas las del usuario
+    if claims.get("sid"):
+        revoke_sessions(sid=claims["sid"])
+    else:
+        revoke_sessions(sub=claims["sub"])
+    
+    return Response(status_code=status.HTTP_200_OK, headers={"Cache-Control": "no-store"})
+
 @app.get("/login-page", response_class=HTMLResponse)
 async def login_page():
     """Página de login simple"""
+    return HTMLResponse(prerendered_page("/login-page"))
+
+def render_login_page() -> str:
     html = """
     <!DOCTYPE html>
     <html>
@@ -603,24 +1659,92 @@ async def login_page():
     """
     return html
 
+# Páginas HTML estáticas (solo dependen de la configuración): se renderizan
+# una vez, en el warm-up, y se sirven como bytes
+PAGE_RENDERERS = {"/": render_root_page, "/login-page": render_login_page}
+_rendered_pages: Dict[str, bytes] = {}
+
+def prerendered_page(path: str) -> bytes:
+    page = _rendered_pages.get(path)
+    if page is None:
+        page = PAGE_RENDERERS[path]().encode()
+        _rendered_pages[path] = page
+    return page
+
+@app.post("/tokens/validate")
+async def validate_tokens(
+    request: TokenBatchRequest,
+    caller: Principal = Depends(require_role(TOKEN_VALIDATE_ROLES)),
+):
+    """
+    Validar un lote de tokens en una sola llamada (API gateways / sidecars)
+    
+    Requiere: token de una cuenta de servicio con uno de TOKEN_VALIDATE_ROLES.
+    Cada token del lote gasta una unidad del límite del cliente; sin
+    presupuesto se responde 429 con Retry-After.
+    
+    Body: {"tokens": ["<jwt>", ...]}
+    
+    Devuelve un resultado por token, en el mismo orden:
+    {"valid": true, "claims": {...}} o {"valid": false, "error": "...", "reason": "..."}
+    
+    Los tokens de sesiones revocadas (back-channel logout) salen como
+    inválidos con reason "revoked", igual que en los endpoints protegidos.
+    """
+    if len(request.tokens) > TOKEN_BATCH_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Máximo {TOKEN_BATCH_MAX} tokens por lote"
+        )
+    retry_after = token_validate_limiter.acquire(caller.sub, cost=len(request.tokens))
+    if retry_after:
+        # inf: nunca habrá unidades suficientes, no tiene sentido un Retry-After
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Límite de validaciones excedido",
+            headers=None if math.isinf(retry_after) else {"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    
+    results = await asyncio.to_thread(validate_token_batch, request.tokens)
+    # La denylist no es thread-safe: se consulta aquí, ya en el event loop
+    for i, result in enumerate(results):
+        if result["valid"] and revocation_list.is_revoked(result["claims"]):
+            results[i] = _rejected("revoked")
+    return {"results": results}
+
 # ============================================
 # ENDPOINTS PROTEGIDOS
 # ============================================
 
 @app.get("/profile")
-async def get_profile(user: UserInfo = Depends(get_current_user)):
+async def get_profile(
+    user: Principal = Depends(get_current_user),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(http_bearer),
+    session: Optional[Session] = Depends(get_bff_session),
+):
     """
     Obtener perfil del usuario autenticado
     
-    Requiere: Token JWT válido en el header Authorization
+    Requiere: Token JWT válido en el header Authorization o sesión BFF
+    
+    Si el token no incluye email o name (tokens reducidos), se completan
+    desde userinfo a través de la caché por sub.
     """
+    user_info = user.to_user_info()
+    if USERINFO_ENRICHMENT and (user.email is None or user.name is None):
+        access_token = credentials.credentials if credentials is not None else session.access_token
+        claims = await userinfo_cache.get(user.sub, user.sid, access_token)
+        if claims:
+            user_info.email = user_info.email or claims.get("email")
+            user_info.name = user_info.name or claims.get("name")
+    
     return {
         "message": "Perfil del usuario",
-        "user": user.dict()
+        "user": user_info.dict()
     }
 
 @app.get("/protected")
-async def protected_endpoint(user: UserInfo = Depends(get_current_user)):
+async def protected_endpoint(user: Principal = Depends(get_current_user)):
     """
     Endpoint protegido - solo usuarios autenticados
     """
@@ -631,7 +1755,7 @@ async def protected_endpoint(user: UserInfo = Depends(get_current_user)):
     }
 
 @app.get("/admin")
-async def admin_only(user: UserInfo = Depends(require_role(["admin"]))):
+async def admin_only(user: Principal = Depends(require_role(["admin"]))):
     """
     Endpoint solo para administradores
     
@@ -643,8 +1767,29 @@ async def admin_only(user: UserInfo = Depends(require_role(["admin"]))):
         "secret_data": "Datos sensibles solo para admins"
     }
 
+@app.get("/admin/traffic")
+async def admin_traffic(
+    top: int = 20,
+    sub: Optional[str] = None,
+    user: Principal = Depends(require_role(["admin"])),
+):
+    """
+    Usuarios, clientes y rutas que más tráfico autenticado generan
+    
+    Ventana en curso y la anterior completa (TRAFFIC_WINDOW segundos). Las
+    cuentas del top-K pueden sobreestimar como mucho "error"; con ?sub= se
+    añade la estimación del count-min sketch para ese usuario aunque no
+    esté en el top.
+    """
+    if traffic_analytics is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analítica de tráfico desactivada")
+    report = traffic_analytics.report(max(1, top))
+    if sub:
+        report["sub_estimate"] = {"sub": sub, **traffic_analytics.estimate_user(sub)}
+    return report
+
 @app.get("/user-or-admin")
-async def user_or_admin(user: UserInfo = Depends(require_role(["user", "admin"]))):
+async def user_or_admin(user: Principal = Depends(require_role(["user", "admin"]))):
     """
     Endpoint para usuarios con rol "user" o "admin"
     """
@@ -665,13 +1810,51 @@ fake_items_db = [
     {"id": 3, "name": "Keyboard", "price": 79.99, "owner": None},
 ]
 
+# Índice por id para no recorrer el catálogo en cada compra
+items_by_id: Dict[int, Dict[str, Any]] = {}
+
+# Respuestas de /items ya serializadas; cualquier cambio del catálogo hace bump()
+catalog_cache = VersionedResponseCache()
+
+def index_items() -> None:
+    """Reconstruye items_by_id (llamar si se sustituye fake_items_db)"""
+    items_by_id.clear()
+    items_by_id.update((item["id"], item) for item in fake_items_db)
+    catalog_cache.bump()
+
+def restore_purchases(owners: Dict[int, str]) -> None:
+    """Aplica al catálogo la propiedad recuperada del ledger"""
+    for item_id, owner in owners.items():
+        item = items_by_id.get(item_id)
+        if item is not None:
+            item["owner"] = owner
+    catalog_cache.bump()
+
+index_items()
+
 @app.get("/items")
-async def get_items():
-    """Listar items (público)"""
-    return {"items": fake_items_db}
+async def get_items(
+    available: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """
+    Listar items (público)
+
+    Se sirve desde catalog_cache mientras no haya compras nuevas; con
+    If-None-Match y el ETag vigente responde 304.
+    """
+    if available:
+        return catalog_cache.respond(
+            "available",
+            lambda: {"items": [item for item in fake_items_db if not item["owner"]]},
+            if_none_match,
+            accept_encoding,
+        )
+    return catalog_cache.respond("all", lambda: {"items": fake_items_db}, if_none_match, accept_encoding)
 
 @app.get("/my-items")
-async def get_my_items(user: UserInfo = Depends(get_current_user)):
+async def get_my_items(user: Principal = Depends(get_current_user)):
     """Listar items del usuario autenticado"""
     my_items = [item for item in fake_items_db if item["owner"] == user.username]
     return {
@@ -679,10 +1862,80 @@ async def get_my_items(user: UserInfo = Depends(get_current_user)):
         "items": my_items
     }
 
+@app.get("/events")
+async def item_events(
+    response: Response,
+    payload: Dict[str, Any] = Depends(get_token_claims),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Stream SSE de cambios del catálogo (sustituye al polling de /items y /my-items)
+    
+    El token se verifica una sola vez, al conectar. El stream se cierra
+    cuando el token expira o la sesión se revoca; el cliente reconecta con
+    un token nuevo.
+    
+    Eventos:
+        ready         al conectar: versión del catálogo; resync=true si
+                      Last-Event-ID no es la versión actual (recargar /items)
+        item_updated  tras cada compra confirmada: item y nueva versión
+        dropped       el cliente no consumía a tiempo; reconectar
+        expired / revoked  fin del stream por el token
+    """
+    if event_hub.subscribers >= event_hub.max_subscribers:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiadas conexiones de eventos"
+        )
+    user = Principal.from_claims(payload)
+    expires_at = payload.get("exp")
+    
+    async def stream():
+        # La suscripción se crea dentro del generador para que el finally
+        # la libere siempre, también si el cliente se va antes de empezar
+        subscription = event_hub.subscribe()
+        if subscription is None:
+            return
+        try:
+            version = str(catalog_cache.version)
+            yield format_event(
+                "ready",
+                {"user": user.username, "version": catalog_cache.version, "resync": last_event_id != version},
+                version,
+            )
+            while True:
+                timeout = EVENTS_HEARTBEAT
+                if expires_at is not None:
+                    timeout = min(timeout, max(0.0, expires_at - time.time()))
+                frame = await subscription.next(timeout)
+                if expires_at is not None and time.time() >= expires_at:
+                    yield format_event("expired", {})
+                    return
+                if revocation_list.is_revoked(payload):
+                    yield format_event("revoked", {})
+                    return
+                if frame is None:
+                    yield HEARTBEAT_FRAME
+                elif not frame:
+                    return
+                else:
+                    yield frame
+        finally:
+            event_hub.unsubscribe(subscription)
+    
+    stream_response = StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+    # Cookie de sesión BFF refrescada al conectar
+    stream_response.raw_headers.extend(h for h in response.raw_headers if h[0] == b"set-cookie")
+    return stream_response
+
 @app.post("/items/{item_id}/buy")
-async def buy_item(item_id: int, user: UserInfo = Depends(get_current_user)):
+async def buy_item(item_id: int, user: Principal = Depends(get_current_user)):
     """Comprar un item (solo autenticados)"""
-    item = next((item for item in fake_items_db if item["id"] == item_id), None)
+    item = items_by_id.get(item_id)
     
     if not item:
         raise HTTPException(status_code=404, detail="Item no encontrado")
@@ -690,7 +1943,26 @@ async def buy_item(item_id: int, user: UserInfo = Depends(get_current_user)):
     if item["owner"]:
         raise HTTPException(status_code=400, detail="Item ya comprado")
     
+    # Se reserva antes de esperar al disco para que una compra concurrente
+    # del mismo item vea el 400; si el ledger falla se deshace
     item["owner"] = user.username
+    catalog_cache.bump()
+    if purchase_ledger is not None:
+        try:
+            await purchase_ledger.append(item_id, user.username)
+        except (OSError, RuntimeError) as e:
+            item["owner"] = None
+            catalog_cache.bump()
+            audit("purchase_failed", "/items/{item_id}/buy", user.sub, item_id=item_id, error=str(e))
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="No se pudo registrar la compra"
+            )
+    
+    audit("purchase", "/items/{item_id}/buy", user.sub, username=user.username, item_id=item_id)
+    version = catalog_cache.version
+    event_hub.publish("item_updated", {"item": item, "version": version}, str(version))
+    invalidation_bus.publish("item_sold", item_id=item_id, owner=user.username)
     
     return {
         "message": "Compra exitosa",
@@ -698,6 +1970,222 @@ async def buy_item(item_id: int, user: UserInfo = Depends(get_current_user)):
         "buyer": user.username
     }
 
+# ============================================
+# INVALIDACIÓN ENTRE RÉPLICAS
+# ============================================
+
+def forget_tokens(issuer: str) -> int:
+    """Saca de la caché los tokens verificados con claves del emisor"""
+    stale = [token for token, (payload, _) in _token_cache.items() if payload.get("iss") == issuer]
+    for token in stale:
+        del _token_cache[token]
+    return len(stale)
+
+async def on_jwks_changed(event: InvalidationEvent) -> None:
+    """
+    Claves de un realm rotadas o retiradas
+    
+    Si el cambio lo detectó otra réplica se descarga el JWKS ya (sin esperar
+    al TTL ni a un kid desconocido). En todas, los tokens de ese realm salen
+    de la caché: si una clave se retiró, sus tokens dejan de aceptarse.
+    """
+    issuer = event.fields.get("issuer")
+    if not isinstance(issuer, str):
+        return
+    if not event.local:
+        tenant = issuer_registry.invalidate(issuer)
+        if tenant is not None:
+            # notify=False: no se vuelve a anunciar un cambio que ya es conocido
+            await asyncio.to_thread(issuer_registry.refresh, tenant, False, False)
+    dropped = forget_tokens(issuer)
+    # Una firma rechazada con las claves anteriores puede ser válida con las nuevas
+    token_prefilter.clear()
+    log_pipeline.emit("invalidation", event=event.kind, issuer=issuer, origin=event.origin, tokens_dropped=dropped)
+
+def on_session_revoked(event: InvalidationEvent) -> None:
+    """Back-channel logout recibido por otra réplica"""
+    if event.local:
+        return
+    revocation_list.revoke(sid=event.fields.get("sid"), sub=event.fields.get("sub"))
+    log_pipeline.emit("invalidation", event=event.kind, origin=event.origin, sid=event.fields.get("sid"))
+
+async def on_item_sold(event: InvalidationEvent) -> None:
+    """
+    Compra hecha en otra réplica
+    
+    La versión del catálogo es local a cada réplica, así que viaja el cambio
+    (item y comprador) y no la versión: se aplica, se hace bump de /items, se
+    avisa a los clientes de /events conectados aquí y se escribe en el ledger
+    local para que sobreviva a un reinicio.
+    
+    Si aquí el item ya tiene otro dueño (dos compras simultáneas en réplicas
+    distintas) no se sobrescribe: gana la compra que cada réplica vio
+    primero y el conflicto queda en la auditoría.
+    """
+    if event.local:
+        return
+    item_id = event.fields.get("item_id")
+    owner = event.fields.get("owner")
+    item = items_by_id.get(item_id)
+    if item is None or not isinstance(owner, str) or item["owner"] == owner:
+        return
+    if item["owner"]:
+        audit(
+            "purchase_conflict",
+            "/items/{item_id}/buy",
+            None,
+            item_id=item_id,
+            owner=item["owner"],
+            remote_owner=owner,
+            origin=event.origin,
+        )
+        return
+    item["owner"] = owner
+    catalog_cache.bump()
+    version = catalog_cache.version
+    event_hub.publish("item_updated", {"item": item, "version": version}, str(version))
+    if purchase_ledger is not None:
+        try:
+            await purchase_ledger.append(item_id, owner)
+        except (OSError, RuntimeError) as e:
+            log_pipeline.emit("error", message="No se pudo registrar una compra remota", item_id=item_id, error=str(e))
+
+invalidation_bus.subscribe("jwks_changed", on_jwks_changed)
+invalidation_bus.subscribe("session_revoked", on_session_revoked)
+invalidation_bus.subscribe("item_sold", on_item_sold)
+
+# ============================================
+# CAPTURA DE TRÁFICO
+# ============================================
+
+def capture_identity(scope: Dict[str, Any]) -> Optional[str]:
+    """Usuario del bearer o de la sesión BFF, sin verificar (solo para agrupar la captura)"""
+    cookie = None
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            _, _, token = value.decode("latin-1").partition(" ")
+            try:
+                username = parse_segment(split_token(token.strip())[1]).get("preferred_username")
+            except TokenVerificationError:
+                return None
+            return username if isinstance(username, str) else None
+        if name == b"cookie":
+            cookie = value.decode("latin-1")
+    if cookie is None or not BFF_ENABLED:
+        return None
+    try:
+        session = load_bff_session(cookie_parser(cookie))
+    except HTTPException:
+        return None
+    return session.claims.get("preferred_username") if session is not None else None
+
+if capture_pipeline is not None:
+    app.add_middleware(
+        TrafficCaptureMiddleware,
+        pipeline=capture_pipeline,
+        identify=capture_identity,
+        sample_rate=CAPTURE_SAMPLE_RATE,
+        salt=CAPTURE_SALT or None,
+        exclude=CAPTURE_EXCLUDE,
+    )
+
+# ============================================
+# NGINX AUTH_REQUEST
+# ============================================
+
+async def verify_auth_request(
+    authorization: Optional[str],
+    cookie_header: Optional[str],
+    original_uri: Optional[str],
+) -> Optional[Dict[str, Any]]:
+    """
+    Claims para la subrequest de nginx, o None si no está autenticada
+    
+    Mismo camino que get_token_claims (caché de tokens verificados, pool de
+    verificación, denylist de sesiones) pero sin FastAPI por medio. Las
+    sesiones BFF no se refrescan aquí: nginx no reenvía al navegador las
+    cookies de la subrequest, así que la sesión vale hasta su exp.
+    """
+    payload = None
+    if authorization is not None:
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            payload = await decode_token_async(token.strip())
+        except HTTPException:
+            return None
+    elif BFF_ENABLED and cookie_header:
+        try:
+            session = load_bff_session(cookie_parser(cookie_header))
+        except HTTPException:
+            return None
+        if session is None or session.expires_at <= time.time():
+            return None
+        payload = session.claims
+    if payload is None or revocation_list.is_revoked(payload):
+        return None
+    
+    if traffic_analytics is not None:
+        route = urlsplit(original_uri).path if original_uri else AUTH_VERIFY_PATH
+        traffic_analytics.record(payload.get("sub"), payload.get("azp"), route)
+    return payload
+
+# Más externo que CORS y el access log: /auth/verify no pasa por ningún middleware
+app.add_middleware(AuthRequestGateway, verify=verify_auth_request, path=AUTH_VERIFY_PATH)
+
+_gateway_warmup: Optional[asyncio.Task] = None
+
+async def _gateway_startup() -> None:
+    global _gateway_warmup
+    log_pipeline.start()
+    await invalidation_bus.start()
+    _gateway_warmup = asyncio.create_task(warm_up())
+
+async def _gateway_shutdown() -> None:
+    if _gateway_warmup is not None:
+        _gateway_warmup.cancel()
+    await invalidation_bus.close()
+    log_pipeline.close()
+
+# Solo el endpoint de verificación, para servirlo aparte en un Unix socket:
+#   uvicorn main:auth_gateway --uds /run/keycloak-lab/auth.sock
+auth_gateway = AuthRequestGateway(
+    None,
+    verify_auth_request,
+    path=AUTH_VERIFY_PATH,
+    on_startup=_gateway_startup,
+    on_shutdown=_gateway_shutdown,
+)
+
+# ============================================
+# FAST PATH DE PROBES Y MÉTRICAS
+# ============================================
+
+_NO_STORE = ((b"cache-control", b"no-store"),)
+
+def _ready_response() -> PrecomputedResponse:
+    status_code, body = readiness()
+    return PrecomputedResponse.json(body, status_code, _NO_STORE)
+
+def _metrics_response() -> PrecomputedResponse:
+    return PrecomputedResponse(render_metrics().encode(), content_type=b"text/plain; version=0.0.4; charset=utf-8")
+
+# Último middleware: el más externo, por delante incluso de /auth/verify
+if FAST_PATH:
+    app.add_middleware(
+        FastPathMiddleware,
+        routes={
+            "/health": PrecomputedResponse.json(health_status()),
+            "/health/live": PrecomputedResponse.json({"status": "alive"}),
+            "/health/ready": MemoizedResponse(
+                lambda: (warmup_state["done"], keycloak_circuit.state, len(warmup_state["steps"])),
+                _ready_response,
+            ),
+            "/metrics": TimedResponse(_metrics_response, METRICS_CACHE_TTL),
+        },
+    )
+
 # ============================================
 # INICIAR SERVIDOR
 # ============================================
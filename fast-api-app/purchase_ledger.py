@@ -0,0 +1,268 @@
+"""
+Registro durable de compras (append-only con group commit)
+==========================================================
+
+Las compras se añaden a un log append-only en disco antes de confirmarse
+al cliente. Para que la durabilidad no limite el throughput a la latencia
+de un fsync por compra:
+
+- Las compras que llegan mientras se hace el fsync anterior se escriben
+  juntas y comparten el siguiente fsync (group commit); commit_window añade
+  una espera opcional para agrupar más a costa de latencia
+- Cada snapshot_every compras se escribe un snapshot del estado de
+  propiedad y se empieza un segmento de log nuevo; los segmentos anteriores
+  se borran, así que el arranque solo reprocesa el último segmento
+- Al arrancar, replay() carga el snapshot y aplica el log; una última línea
+  incompleta (caída a mitad de escritura) se descarta. Una línea ilegible
+  con más registros detrás no puede venir de una caída: es corrupción y
+  replay() lanza LedgerCorruptionError en vez de perder lo que sigue
+- Si un commit falla (write o fsync), el segmento se trunca al offset previo
+  al lote: ni queda una línea a medias delante del siguiente lote ni
+  reaparece en el replay una compra que se respondió como fallida. Si
+  tampoco se puede truncar, el ledger pasa a estado fallido y rechaza
+  cualquier compra nueva
+
+Estructura del directorio:
+    snapshot.json            {"segment": N, "owners": {"<item_id>": "<owner>"}}
+    purchases-<N>.log        una compra por línea (JSON)
+"""
+
+import asyncio
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+class LedgerCorruptionError(Exception):
+    """Un segmento del log tiene registros ilegibles antes de su final"""
+
+
+class PurchaseLedger:
+    """
+    Log de compras con group commit
+
+    Uso:
+        ledger = PurchaseLedger("data")
+        owners = ledger.replay()          # {item_id: owner} ya confirmado
+        await ledger.start()
+        await ledger.append(item_id, owner)   # vuelve cuando está en disco
+        await ledger.close()
+    """
+
+    def __init__(self, directory: str, commit_window: float = 0.0, snapshot_every: int = 10000):
+        self.directory = directory
+        self.commit_window = commit_window
+        self.snapshot_every = snapshot_every
+        self._owners: Dict[int, str] = {}
+        self._segment = 0
+        self._segment_records = 0
+        self._fp = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Un solo hilo de E/S: las escrituras y snapshots quedan serializados
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="purchase-ledger")
+        # Error que dejó el log en un estado desconocido (no se pudo deshacer un commit)
+        self.failed: Optional[BaseException] = None
+        self.commits = 0
+        self.records = 0
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None and not self._writer.done()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"purchases-{segment:08d}.log")
+
+    def replay(self) -> Dict[int, str]:
+        """
+        Reconstruye el estado de propiedad desde el snapshot y el log
+
+        Raises:
+            LedgerCorruptionError: Si un segmento está dañado antes de su última línea
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        owners: Dict[int, str] = {}
+        segment = 0
+        snapshot_path = os.path.join(self.directory, "snapshot.json")
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as f:
+                snapshot = json.load(f)
+            segment = snapshot["segment"]
+            owners = {int(item_id): owner for item_id, owner in snapshot["owners"].items()}
+
+        records = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, "purchases-*.log"))):
+            number = int(os.path.basename(path)[len("purchases-"):-len(".log")])
+            if number < segment:
+                continue
+            records += self._replay_segment(path, owners)
+            segment = max(segment, number)
+
+        self._owners = owners
+        self._segment = segment
+        self._segment_records = records
+        return dict(owners)
+
+    @staticmethod
+    def _replay_segment(path: str, owners: Dict[int, str]) -> int:
+        records = 0
+        valid_bytes = 0
+        with open(path, "rb") as f:
+            lines = f.readlines()
+        for number, line in enumerate(lines, 1):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("línea sin terminar")
+                record = json.loads(line)
+                item_id, owner = record["item_id"], record["owner"]
+            except (ValueError, KeyError, TypeError) as e:
+                if number < len(lines):
+                    raise LedgerCorruptionError(
+                        f"{path}: registro ilegible en la línea {number} de {len(lines)} ({e})"
+                    ) from e
+                break
+            owners[item_id] = owner
+            valid_bytes += len(line)
+            records += 1
+        # Descartar la última línea a medio escribir para que las siguientes escrituras no la sigan
+        if valid_bytes != os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return records
+
+    async def start(self) -> None:
+        """Abre el segmento actual y arranca el writer en segundo plano"""
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io, self._open_segment)
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def _open_segment(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Sin buffer: tras un fallo no quedan bytes pendientes que un flush posterior escriba
+        self._fp = open(self._segment_path(self._segment), "ab", buffering=0)
+
+    async def append(self, item_id: int, owner: str) -> None:
+        """
+        Registra una compra y vuelve cuando está en disco (fsync)
+
+        Raises:
+            RuntimeError: Si el ledger no está arrancado o está en estado fallido
+            OSError: Si falla la escritura
+        """
+        if not self.running:
+            raise RuntimeError("El ledger de compras no está arrancado")
+        if self.failed is not None:
+            raise RuntimeError(f"El ledger de compras está en estado fallido: {self.failed}")
+        record = json.dumps({"item_id": item_id, "owner": owner, "ts": time.time()}, separators=(",", ":"))
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item_id, owner, record.encode() + b"\n", future))
+        await future
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[int, str, bytes, asyncio.Future]] = []
+            entry = await self._queue.get()
+            if entry is not None and self.commit_window > 0:
+                await asyncio.sleep(self.commit_window)
+            while True:
+                if entry is None:
+                    # Marca de cierre: se confirma lo ya encolado y se termina
+                    stopping = True
+                else:
+                    batch.append(entry)
+                if self._queue.empty():
+                    break
+                entry = self._queue.get_nowait()
+            if not batch:
+                continue
+
+            try:
+                if self.failed is not None:
+                    raise RuntimeError(f"El ledger de compras está en estado fallido: {self.failed}")
+                await loop.run_in_executor(self._io, self._commit, b"".join(entry[2] for entry in batch))
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for item_id, owner, _, future in batch:
+                self._owners[item_id] = owner
+                if not future.done():
+                    future.set_result(None)
+            self.commits += 1
+            self.records += len(batch)
+            self._segment_records += len(batch)
+
+            if self._segment_records >= self.snapshot_every:
+                owners = dict(self._owners)
+                try:
+                    await loop.run_in_executor(self._io, self._snapshot, owners)
+                    self._segment_records = 0
+                except OSError:
+                    # Sin snapshot el log sigue siendo válido; se reintenta en el siguiente commit
+                    pass
+
+    def _commit(self, data: bytes) -> None:
+        fd = self._fp.fileno()
+        offset = os.fstat(fd).st_size
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[self._fp.write(view):]
+            os.fsync(fd)
+        except OSError:
+            self._rollback(fd, offset)
+            raise
+
+    def _rollback(self, fd: int, offset: int) -> None:
+        """Deja el segmento como estaba antes del lote fallido"""
+        try:
+            os.ftruncate(fd, offset)
+            os.fsync(fd)
+        except OSError as e:
+            self.failed = e
+
+    def _snapshot(self, owners: Dict[int, str]) -> None:
+        """Escribe el snapshot y empieza un segmento nuevo (hilo de E/S)"""
+        next_segment = self._segment + 1
+        path = os.path.join(self.directory, "snapshot.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": next_segment, "owners": owners}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._fp.close()
+        self._segment = next_segment
+        self._open_segment()
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for old in glob.glob(os.path.join(self.directory, "purchases-*.log")):
+            if int(os.path.basename(old)[len("purchases-"):-len(".log")]) < next_segment:
+                os.remove(old)
+
+    async def close(self) -> None:
+        """Espera a que se confirmen las compras pendientes y cierra el log"""
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+            self._writer = None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io, self._close_file)
+
+    def _close_file(self) -> None:
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
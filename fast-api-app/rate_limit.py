@@ -0,0 +1,61 @@
+"""
+Rate limiting por cliente (token bucket)
+========================================
+
+Cada clave (p.ej. el sub de una cuenta de servicio) tiene un cubo de
+capacidad burst que se rellena a rate unidades por segundo. Una petición
+cuesta tantas unidades como trabajo pide (en /tokens/validate, una por
+token del lote), así que un lote grande gasta lo mismo que muchos pequeños.
+
+- Sin temporizadores: el relleno se calcula al consultar la clave
+- Memoria acotada: con max_keys claves se expulsa la usada hace más tiempo
+
+No es thread-safe: se usa solo desde el event loop.
+"""
+
+import time
+from typing import Dict, Tuple
+
+
+class KeyedTokenBucket:
+    """
+    Cubos de tokens independientes por clave
+
+    Uso:
+        limiter = KeyedTokenBucket(rate=1000, burst=2000)
+        retry_after = limiter.acquire(user.sub, cost=len(tokens))
+        if retry_after:
+            ...  # 429 con Retry-After
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # clave -> (unidades disponibles, último relleno); en orden de último uso
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(self, key: str, cost: float = 1) -> float:
+        """
+        Consume cost unidades de la clave
+
+        Returns:
+            0 si se concede; si no, segundos hasta que haya unidades suficientes
+            (inf si cost supera burst y nunca las habrá)
+        """
+        now = time.monotonic()
+        available, updated_at = self._buckets.pop(key, (self.burst, now))
+        available = min(self.burst, available + (now - updated_at) * self.rate)
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.pop(next(iter(self._buckets)))
+
+        if available >= cost:
+            self._buckets[key] = (available - cost, now)
+            return 0.0
+        self._buckets[key] = (available, now)
+        if cost > self.burst or self.rate <= 0:
+            return float("inf")
+        return (cost - available) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
@@ -0,0 +1,130 @@
+"""
+Caché versionada de respuestas públicas
+=======================================
+
+Para endpoints de lectura pública que cambian poco (el catálogo de items):
+
+- Un contador de versión que se incrementa en cada escritura (bump)
+- Por cada consulta se guarda el cuerpo JSON ya serializado, y su versión
+  gzip la primera vez que un cliente la acepta
+- ETag = época del proceso + versión + consulta; If-None-Match responde 304
+  sin cuerpo
+
+Mientras la versión no cambie, una lectura solo copia bytes precalculados:
+no hay serialización ni compresión por request. La época evita que un ETag
+emitido antes de un reinicio (versión reiniciada a 0) valide un estado
+distinto.
+
+No es thread-safe: se usa desde el event loop.
+"""
+
+import gzip
+import json
+import os
+import zlib
+from typing import Any, Callable, Dict, Optional
+
+from starlette.responses import Response
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """True si Accept-Encoding admite gzip (ignora gzip;q=0)"""
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        return q > 0
+    return False
+
+
+class _CachedBody:
+    __slots__ = ("version", "etag", "body", "gzip_body")
+
+    def __init__(self, version: int, etag: str, body: bytes):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.gzip_body: Optional[bytes] = None
+
+
+class VersionedResponseCache:
+    """Cuerpos serializados por (versión, consulta) con ETag y gzip"""
+
+    def __init__(self, max_entries: int = 64, min_gzip_size: int = 1024, cache_control: str = "no-cache"):
+        self.max_entries = max_entries
+        self.min_gzip_size = min_gzip_size
+        self.cache_control = cache_control
+        self.version = 0
+        self._epoch = os.urandom(4).hex()
+        self._entries: Dict[str, _CachedBody] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self) -> None:
+        """Invalida todas las respuestas (llamar tras cada escritura)"""
+        self.version += 1
+        self._entries.clear()
+
+    def _entry(self, query: str, render: Callable[[], Any]) -> _CachedBody:
+        entry = self._entries.get(query)
+        if entry is not None and entry.version == self.version:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        body = json.dumps(render(), ensure_ascii=False, separators=(",", ":")).encode()
+        etag = f'"{self._epoch}-{self.version}-{zlib.crc32(query.encode()):08x}"'
+        entry = _CachedBody(self.version, etag, body)
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[query] = entry
+        return entry
+
+    def respond(
+        self,
+        query: str,
+        render: Callable[[], Any],
+        if_none_match: Optional[str] = None,
+        accept_encoding: Optional[str] = None,
+    ) -> Response:
+        """
+        Respuesta para la consulta en la versión actual
+
+        render() solo se llama si no hay cuerpo cacheado para esta versión.
+        """
+        entry = self._entry(query, render)
+        use_gzip = len(entry.body) >= self.min_gzip_size and accepts_gzip(accept_encoding)
+        etag = entry.etag[:-1] + '-gz"' if use_gzip else entry.etag
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+
+        if if_none_match and self._matches(if_none_match, entry.etag):
+            return Response(status_code=304, headers=headers)
+
+        if use_gzip:
+            if entry.gzip_body is None:
+                entry.gzip_body = gzip.compress(entry.body, compresslevel=6, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+            return Response(entry.gzip_body, media_type="application/json", headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    @staticmethod
+    def _matches(if_none_match: str, etag: str) -> bool:
+        """Comparación débil: ignora W/ y el sufijo de codificación"""
+        if if_none_match.strip() == "*":
+            return True
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate.replace('-gz"', '"') == etag:
+                return True
+        return False
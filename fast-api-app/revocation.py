@@ -0,0 +1,146 @@
+"""
+Denylist de sesiones revocadas (back-channel logout)
+====================================================
+
+Los tokens se validan en local, así que un logout en Keycloak no los
+invalida hasta su exp. Keycloak notifica cada logout con un logout token
+(OIDC Back-Channel Logout) y aquí se registran los sid/sub/jti revocados:
+
+- Un filtro de Bloom delante responde "no revocado" sin tocar el diccionario
+  en el caso común; solo los positivos se confirman contra el conjunto exacto
+- Las entradas caducan pasado el tiempo de vida máximo de un token, ya que
+  a partir de ahí el propio exp del token lo rechaza
+- Memoria acotada: el Bloom tiene tamaño fijo y el conjunto exacto expulsa
+  las entradas más antiguas al llegar a max_entries
+
+Los filtros de Bloom no permiten borrar, así que el filtro se reconstruye a
+partir del conjunto exacto cada ttl segundos, o antes si desde la última
+reconstrucción se han insertado más de max_entries claves (para que no se
+sature y deje de filtrar).
+"""
+
+import hashlib
+import math
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class BloomFilter:
+    """Filtro de Bloom de tamaño fijo con doble hashing sobre blake2b"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        bits = self._bits
+        for pos in self._positions(item):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for pos in self._positions(item):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    Registro en memoria de sesiones (sid), usuarios (sub) y tokens (jti) revocados
+
+    Un sid o jti revocado invalida cualquier token que lo lleve. Un sub
+    revocado invalida los tokens emitidos (iat) hasta el momento del logout,
+    pero no los de un login posterior.
+
+    No es thread-safe: se usa solo desde el event loop.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 100000, error_rate: float = 0.01):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.error_rate = error_rate
+        # clave -> (instante de revocación, expira); en orden de inserción
+        self._entries: Dict[str, Tuple[float, float]] = {}
+        self._bloom = BloomFilter(max_entries, error_rate)
+        self._bloom_inserts = 0
+        self._bloom_built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _purge(self, now: float) -> None:
+        # Con ttl constante el orden de inserción es el orden de expiración
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) < self.max_entries:
+                break
+            del self._entries[key]
+
+    def _rebuild_bloom(self, now: float) -> None:
+        """Reconstruye el filtro solo con las entradas vigentes"""
+        self._purge(now)
+        bloom = BloomFilter(self.max_entries, self.error_rate)
+        for key in self._entries:
+            bloom.add(key)
+        self._bloom = bloom
+        self._bloom_inserts = len(self._entries)
+        self._bloom_built_at = now
+
+    def revoke(self, sid: Optional[str] = None, sub: Optional[str] = None, jti: Optional[str] = None) -> None:
+        """Registra la revocación de una sesión, un usuario y/o un token"""
+        now = time.time()
+        for kind, value in (("sid", sid), ("sub", sub), ("jti", jti)):
+            if not value:
+                continue
+            key = f"{kind}:{value}"
+            self._entries.pop(key, None)
+            self._purge(now)
+            self._entries[key] = (now, now + self.ttl)
+            self._bloom.add(key)
+            self._bloom_inserts += 1
+        if self._bloom_inserts > self.max_entries or now - self._bloom_built_at >= self.ttl:
+            self._rebuild_bloom(now)
+
+    def _lookup(self, key: str, now: float) -> Optional[float]:
+        if key not in self._bloom:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+    def is_revoked(self, payload: Dict[str, Any]) -> bool:
+        """True si el token (claims ya verificados) pertenece a algo revocado"""
+        if not self._entries:
+            return False
+        now = time.time()
+        if now - self._bloom_built_at >= self.ttl:
+            self._rebuild_bloom(now)
+
+        sid = payload.get("sid")
+        if sid and self._lookup(f"sid:{sid}", now) is not None:
+            return True
+        jti = payload.get("jti")
+        if jti and self._lookup(f"jti:{jti}", now) is not None:
+            return True
+        sub = payload.get("sub")
+        if sub:
+            revoked_at = self._lookup(f"sub:{sub}", now)
+            if revoked_at is not None:
+                iat = payload.get("iat")
+                return not isinstance(iat, (int, float)) or iat <= revoked_at
+        return False
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._rebuild_bloom(time.time())
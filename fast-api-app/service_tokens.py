@@ -0,0 +1,200 @@
+"""
+Tokens de servicio para llamadas salientes (client_credentials)
+===============================================================
+
+Gestor reutilizable de tokens para que el backend llame a otros servicios
+protegidos por Keycloak:
+
+- Un token en caché por (audience, scope), compartido por todas las llamadas
+- Renovación en segundo plano al llegar a una fracción de expires_in, así
+  que las llamadas salientes no esperan a que se emita un token nuevo
+- Las peticiones concurrentes de un token que aún no existe comparten una
+  sola llamada al token endpoint
+- Se integra en httpx.AsyncClient como auth hook
+
+Uso:
+    tokens = ServiceTokenManager(TOKEN_URL, CLIENT_ID, CLIENT_SECRET)
+    async with httpx.AsyncClient(auth=tokens.auth(scope="orders")) as client:
+        await client.get("https://orders.internal/api/orders")
+    await tokens.aclose()
+
+En Keycloak la audiencia del token la fijan los client scopes (audience
+mappers) del cliente; "audience" solo se envía si se indica explícitamente.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+TokenKey = Tuple[Optional[str], Optional[str]]
+
+
+class ServiceTokenError(Exception):
+    """No se pudo obtener un token de servicio"""
+
+
+@dataclass(frozen=True, slots=True)
+class _CachedToken:
+    access_token: str
+    expires_at: float
+    refresh_at: float
+
+
+class ServiceTokenManager:
+    """Caché de tokens client_credentials con renovación proactiva"""
+
+    def __init__(
+        self,
+        token_url: str,
+        client_id: str,
+        client_secret: str,
+        refresh_ratio: float = 0.8,
+        min_retry_interval: float = 1.0,
+        timeout: float = 10.0,
+    ):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_ratio = refresh_ratio
+        self.min_retry_interval = min_retry_interval
+        self.timeout = timeout
+        self._tokens: Dict[TokenKey, _CachedToken] = {}
+        self._inflight: Dict[TokenKey, asyncio.Task] = {}
+        self._refreshers: Dict[TokenKey, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def get_token(self, audience: Optional[str] = None, scope: Optional[str] = None, force: bool = False) -> str:
+        """
+        Devuelve un access token válido para (audience, scope)
+
+        Solo espera al token endpoint si no hay token en caché o ya expiró
+        (o con force, p.ej. tras un 401 del servicio destino).
+
+        Raises:
+            ServiceTokenError: Si Keycloak no emite el token
+        """
+        key = (audience, scope)
+        cached = self._tokens.get(key)
+        if cached is not None and not force and cached.expires_at > time.monotonic():
+            return cached.access_token
+        if force:
+            self._tokens.pop(key, None)
+        return (await self._fetch(key)).access_token
+
+    async def _fetch(self, key: TokenKey) -> _CachedToken:
+        """Obtiene un token nuevo; las llamadas concurrentes comparten la petición"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._request_token(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _request_token(self, key: TokenKey) -> _CachedToken:
+        audience, scope = key
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+        }
+        if scope:
+            data["scope"] = scope
+        if audience:
+            data["audience"] = audience
+
+        try:
+            response = await self._get_client().post(self.token_url, data=data)
+        except httpx.HTTPError as e:
+            raise ServiceTokenError(f"Error contactando el token endpoint: {e}") from e
+        if response.status_code != 200:
+            raise ServiceTokenError(f"Token endpoint respondió HTTP {response.status_code}")
+
+        try:
+            payload = response.json()
+            access_token = payload["access_token"]
+            lifetime = float(payload.get("expires_in", 60))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ServiceTokenError("Respuesta del token endpoint sin access_token") from e
+        if not isinstance(access_token, str) or not access_token:
+            raise ServiceTokenError("Respuesta del token endpoint sin access_token")
+        now = time.monotonic()
+        token = _CachedToken(
+            access_token=access_token,
+            # Margen de unos segundos para no usar un token a punto de expirar
+            expires_at=now + max(0.0, lifetime - min(5.0, lifetime * 0.1)),
+            refresh_at=now + lifetime * self.refresh_ratio,
+        )
+        self._tokens[key] = token
+        self._schedule_refresh(key, token)
+        return token
+
+    def _schedule_refresh(self, key: TokenKey, token: _CachedToken) -> None:
+        # Se llama desde _request_token, que corre en su propia task (_fetch),
+        # nunca en la del refresher: el anterior siempre se puede cancelar. Si
+        # estaba esperando este mismo fetch, el shield de _fetch protege la petición
+        previous = self._refreshers.get(key)
+        if previous is not None:
+            previous.cancel()
+        self._refreshers[key] = asyncio.create_task(self._refresh_later(key, token))
+
+    async def _refresh_later(self, key: TokenKey, token: _CachedToken) -> None:
+        """Renueva el token al llegar a refresh_at; reintenta mientras el actual siga válido"""
+        await asyncio.sleep(max(0.0, token.refresh_at - time.monotonic()))
+        while True:
+            try:
+                await self._fetch(key)
+                return
+            except ServiceTokenError:
+                remaining = token.expires_at - time.monotonic()
+                if remaining <= 0:
+                    # El próximo get_token pedirá el token de forma síncrona
+                    self._refreshers.pop(key, None)
+                    return
+                await asyncio.sleep(max(self.min_retry_interval, remaining / 2))
+
+    def auth(self, audience: Optional[str] = None, scope: Optional[str] = None) -> "ServiceTokenAuth":
+        """Auth hook para httpx.AsyncClient"""
+        return ServiceTokenAuth(self, audience, scope)
+
+    async def aclose(self) -> None:
+        """Cancela las renovaciones pendientes y cierra el pool de conexiones"""
+        for task in list(self._refreshers.values()) + list(self._inflight.values()):
+            task.cancel()
+        self._refreshers.clear()
+        self._tokens.clear()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class ServiceTokenAuth(httpx.Auth):
+    """
+    Añade "Authorization: Bearer <token de servicio>" a cada petición
+
+    Si el destino responde 401, pide un token nuevo y reintenta una vez.
+    """
+
+    def __init__(self, manager: ServiceTokenManager, audience: Optional[str] = None, scope: Optional[str] = None):
+        self.manager = manager
+        self.audience = audience
+        self.scope = scope
+
+    async def async_auth_flow(self, request: httpx.Request):
+        token = await self.manager.get_token(self.audience, self.scope)
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+        if response.status_code == 401:
+            token = await self.manager.get_token(self.audience, self.scope, force=True)
+            request.headers["Authorization"] = f"Bearer {token}"
+            yield request
+
+    def sync_auth_flow(self, request: httpx.Request):
+        raise RuntimeError("ServiceTokenAuth solo funciona con httpx.AsyncClient")
@@ -0,0 +1,65 @@
+"""
+Regresión: tokens con JSON que el parser no puede procesar
+==========================================================
+
+Un header o payload anidado miles de niveles hace que json.loads lance
+RecursionError; tiene que acabar en 401 (malformed), nunca en un 500.
+
+Uso (desde fast-api-app/):
+    python -m pytest -q tests
+"""
+
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("LOG_OUTPUT", os.devnull)
+
+from jwt_verifier import MALFORMED, TokenVerificationError, parse_segment  # noqa: E402
+from token_prefilter import TokenPrefilter  # noqa: E402
+
+NESTED = "[" * 5000 + "]" * 5000
+
+
+def b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+HEADER = b64url(json.dumps({"alg": "RS256", "kid": "k1"}).encode())
+NESTED_PAYLOAD_TOKEN = f"{HEADER}.{b64url(NESTED.encode())}.c2ln"
+NESTED_HEADER_TOKEN = f"{b64url(NESTED.encode())}.{b64url(b'{}')}.c2ln"
+
+
+@pytest.mark.parametrize("segment", [b64url(NESTED.encode()), b64url(b"{" * 100 + b"}"), b64url(b"[]")])
+def test_parse_segment_rejects_unparseable_json(segment):
+    with pytest.raises(TokenVerificationError) as excinfo:
+        parse_segment(segment)
+    assert excinfo.value.reason == MALFORMED
+
+
+@pytest.mark.parametrize("token", [NESTED_PAYLOAD_TOKEN, NESTED_HEADER_TOKEN])
+def test_prefilter_rejects_nested_json(token):
+    prefilter = TokenPrefilter(lambda issuer: True)
+    with pytest.raises(TokenVerificationError) as excinfo:
+        prefilter.check(token)
+    assert excinfo.value.reason == MALFORMED
+
+
+@pytest.fixture(scope="module")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app, raise_server_exceptions=False) as test_client:
+        yield test_client
+
+
+@pytest.mark.parametrize("path", ["/protected", "/auth/verify"])
+def test_nested_payload_is_401(client, path):
+    response = client.get(path, headers={"Authorization": f"Bearer {NESTED_PAYLOAD_TOKEN}"})
+    assert response.status_code == 401
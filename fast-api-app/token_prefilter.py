@@ -0,0 +1,174 @@
+"""
+Rechazo barato de tokens antes de verificar la firma
+====================================================
+
+La verificación completa (JWKS del realm, clave pública) es lo más caro de
+una request autenticada, y es justo lo que se paga por la basura: tokens
+truncados, inventados, de otro emisor, con "alg": "none" o expirados que un
+cliente reenvía en bucle. TokenPrefilter los descarta de más barato a más
+caro, sin tocar claves ni JWKS:
+
+1. Tamaño y número de segmentos (sin decodificar nada)
+2. Caché negativa: hash de los tokens rechazados hace poco
+3. Header: JSON válido, "alg" en la allowlist y "kid" presente
+4. Payload sin verificar: "iss" de confianza, exp y nbf
+
+Lo que pasa el filtro sigue a la verificación de firma con el header y el
+payload ya decodificados. Los rechazos deterministas (formato, algoritmo,
+emisor, expirado, firma inválida) se recuerdan hasta cache_ttl segundos; un
+kid desconocido o un nbf futuro no, porque pueden dejar de serlo.
+
+Cada rechazo lleva un motivo fijo de jwt_verifier (malformed, expired...),
+que es lo único que se devuelve al cliente y se cuenta en las métricas.
+Seguro entre hilos: se usa desde el event loop y desde los pools.
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from jwt_verifier import (
+    BAD_SIGNATURE,
+    EXPIRED,
+    INVALID_CLAIMS,
+    INVALID_ISSUER,
+    MALFORMED,
+    SUPPORTED_ALGORITHMS,
+    TOO_LARGE,
+    UNSUPPORTED_ALGORITHM,
+    TokenVerificationError,
+    check_time_claims,
+    parse_segment,
+)
+
+# Motivos que no cambian con el tiempo ni con una recarga del JWKS
+CACHEABLE_REASONS = frozenset({MALFORMED, UNSUPPORTED_ALGORITHM, INVALID_ISSUER, INVALID_CLAIMS, EXPIRED, BAD_SIGNATURE})
+
+
+@dataclass(frozen=True, slots=True)
+class ParsedToken:
+    """Token que ha pasado el filtro, con header y payload ya decodificados"""
+    segments: Tuple[str, str, str]
+    header: Dict[str, Any]
+    payload: Dict[str, Any]
+    digest: bytes
+
+
+class TokenPrefilter:
+    """
+    Comprobaciones sin firma y caché negativa de tokens rechazados
+
+    Uso:
+        prefilter = TokenPrefilter(lambda iss: iss in TRUSTED)
+        parsed = prefilter.check(token)          # TokenVerificationError si no pasa
+        try:
+            verify(parsed.segments, parsed.payload, parsed.header)
+        except TokenVerificationError as e:
+            prefilter.reject(parsed, e)
+            raise
+    """
+
+    def __init__(
+        self,
+        is_trusted_issuer: Callable[[Optional[str]], bool],
+        max_size: int = 16384,
+        algorithms: Iterable[str] = SUPPORTED_ALGORITHMS,
+        leeway: float = 0,
+        cache_size: int = 10000,
+        cache_ttl: float = 300,
+    ):
+        self.is_trusted_issuer = is_trusted_issuer
+        self.max_size = max_size
+        self.algorithms = frozenset(algorithms)
+        self.leeway = leeway
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # digest -> (motivo, mensaje, caduca); insertion order = antigüedad
+        self._rejected: Dict[bytes, Tuple[str, str, float]] = {}
+        self._lock = threading.Lock()
+        self.rejections: Dict[str, int] = {}
+        self.cache_hits = 0
+
+    def check(self, token: str) -> ParsedToken:
+        """
+        Aplica las comprobaciones baratas en orden
+
+        Raises:
+            TokenVerificationError: Con el motivo del rechazo
+        """
+        if len(token) > self.max_size:
+            self._count(TOO_LARGE)
+            raise TokenVerificationError("Token demasiado grande", TOO_LARGE)
+        if token.count(".") != 2:
+            self._count(MALFORMED)
+            raise TokenVerificationError("Formato de token inválido", MALFORMED)
+
+        digest = hashlib.blake2b(token.encode("utf-8", "replace"), digest_size=16).digest()
+        cached = self._rejected.get(digest)
+        if cached is not None:
+            reason, message, expires_at = cached
+            if expires_at > time.monotonic():
+                with self._lock:
+                    self.cache_hits += 1
+                    self.rejections[reason] = self.rejections.get(reason, 0) + 1
+                raise TokenVerificationError(message, reason)
+            with self._lock:
+                self._rejected.pop(digest, None)
+
+        header_segment, payload_segment, signature_segment = token.split(".")
+        try:
+            # alg, kid e iss vienen del atacante: se comprueba el tipo antes de
+            # usarlos como clave de un set o dict (una lista no es hashable)
+            header = parse_segment(header_segment)
+            alg = header.get("alg")
+            if not isinstance(alg, str):
+                raise TokenVerificationError("Falta el algoritmo", MALFORMED)
+            if alg not in self.algorithms:
+                raise TokenVerificationError("Algoritmo no permitido", UNSUPPORTED_ALGORITHM)
+            kid = header.get("kid")
+            if not isinstance(kid, str) or not kid:
+                raise TokenVerificationError("Falta el kid", MALFORMED)
+            if not signature_segment:
+                raise TokenVerificationError("Falta la firma", MALFORMED)
+
+            payload = parse_segment(payload_segment)
+            issuer = payload.get("iss")
+            if not isinstance(issuer, str) or not self.is_trusted_issuer(issuer):
+                raise TokenVerificationError("Emisor no permitido", INVALID_ISSUER)
+            check_time_claims(payload, time.time(), self.leeway)
+        except TokenVerificationError as e:
+            self._remember(digest, e)
+            raise
+        return ParsedToken((header_segment, payload_segment, signature_segment), header, payload, digest)
+
+    def reject(self, parsed: ParsedToken, error: TokenVerificationError) -> None:
+        """Registra un rechazo posterior al filtro (p.ej. firma inválida)"""
+        self._remember(parsed.digest, error)
+
+    def clear(self) -> None:
+        """Olvida los rechazos recordados (p.ej. tras una rotación de claves)"""
+        with self._lock:
+            self._rejected.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rejections": dict(self.rejections),
+                "cache_hits": self.cache_hits,
+                "cache_entries": len(self._rejected),
+            }
+
+    def _count(self, reason: str) -> None:
+        with self._lock:
+            self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    def _remember(self, digest: bytes, error: TokenVerificationError) -> None:
+        with self._lock:
+            self.rejections[error.reason] = self.rejections.get(error.reason, 0) + 1
+            if error.reason not in CACHEABLE_REASONS or self.cache_size <= 0:
+                return
+            if digest not in self._rejected and len(self._rejected) >= self.cache_size:
+                self._rejected.pop(next(iter(self._rejected)))
+            self._rejected[digest] = (error.reason, str(error), time.monotonic() + self.cache_ttl)
@@ -0,0 +1,215 @@
+"""
+Captura de tráfico real para reproducirlo en benchmarks
+=======================================================
+
+Middleware ASGI opcional que registra la forma de cada request (método,
+ruta, query, body pequeño, estado, duración y a qué usuario pertenece) como
+JSON lines, a través de un LogPipeline propio: el handler solo encola y el
+hilo escritor escribe por lotes (opcionalmente gzip).
+
+Nunca se guardan credenciales:
+
+- Authorization y cookies no se registran; solo si la request iba con
+  bearer, con cookie de sesión o sin autenticar
+- Los campos sensibles de query y body (password, refresh_token, code...)
+  se sustituyen por "<redacted>" (las listas conservan su longitud); lo que
+  esté anidado a más de MAX_DEPTH niveles también se redacta
+- El usuario se guarda como seudónimo (blake2b con sal), igual para
+  username en el body de /login que para el usuario de un token, para que
+  la sesión de cada usuario se pueda reconstruir en orden
+
+El muestreo es por usuario: con sample_rate < 1 se capturan todas las
+requests de una fracción de usuarios, no una fracción de las requests de
+cada uno (que rompería las sesiones). benchmarks/replay.py reproduce la
+captura. Un fallo al registrar una request solo se cuenta (errors): la
+respuesta ya se ha enviado y no debe verse afectada.
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import parse_qsl
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from log_pipeline import LogPipeline
+
+REDACTED = "<redacted>"
+SENSITIVE_FIELDS = frozenset({
+    "password",
+    "refresh_token",
+    "access_token",
+    "id_token",
+    "id_token_hint",
+    "token",
+    "tokens",
+    "logout_token",
+    "client_secret",
+    "code",
+    "code_verifier",
+    "state",
+    "nonce",
+})
+USER_FIELDS = frozenset({"username"})
+# Profundidad máxima de query/body que se conserva (un body real no pasa de unos pocos niveles)
+MAX_DEPTH = 32
+
+# identify(scope) -> nombre de usuario de la request (token o sesión), o None
+IdentifyFunction = Callable[[Scope], Optional[str]]
+
+
+class TrafficCaptureMiddleware:
+    """Registra cada request HTTP con credenciales redactadas"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        pipeline: LogPipeline,
+        identify: IdentifyFunction,
+        sample_rate: float = 1.0,
+        salt: Optional[str] = None,
+        max_body: int = 4096,
+        exclude: Iterable[str] = (),
+    ):
+        self.app = app
+        self.pipeline = pipeline
+        self.identify = identify
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.exclude = frozenset(exclude)
+        self._salt = salt.encode() if salt else os.urandom(16)
+        self.errors = 0
+
+    def pseudonym(self, username: str) -> str:
+        return hashlib.blake2b(username.encode(), key=self._salt[:64], digest_size=8).hexdigest()
+
+    def _sampled(self, user: Optional[str]) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        if user is None:
+            return random.random() < self.sample_rate
+        return int(user[:8], 16) / 0x100000000 < self.sample_rate
+
+    def _redact(self, value: Any, depth: int = 0) -> Any:
+        if isinstance(value, (dict, list)) and depth >= MAX_DEPTH:
+            return REDACTED
+        if isinstance(value, dict):
+            return {key: self._redact_field(key, item, depth + 1) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._redact(item, depth + 1) for item in value]
+        return value
+
+    def _redact_field(self, key: str, value: Any, depth: int) -> Any:
+        if key in SENSITIVE_FIELDS:
+            return [REDACTED] * len(value) if isinstance(value, list) else REDACTED
+        if key in USER_FIELDS and isinstance(value, str):
+            return self.pseudonym(value)
+        return self._redact(value, depth)
+
+    def _parse_body(self, content_type: str, body: bytes) -> Optional[Any]:
+        try:
+            body_type = _body_type(content_type)
+            if body_type == "json":
+                return self._redact(json.loads(body))
+            if body_type == "form":
+                return self._redact(dict(parse_qsl(body.decode(), keep_blank_values=True)))
+        except (ValueError, UnicodeDecodeError, RecursionError):
+            # RecursionError: JSON anidado miles de niveles, aunque quepa en max_body
+            pass
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.time()
+        start = time.perf_counter()
+        chunks = []
+        size = 0
+        response = {"status": 500}
+
+        async def receive_wrapper() -> Message:
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                if size + len(body) <= self.max_body:
+                    chunks.append(body)
+                size += len(body)
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            body = b"".join(chunks) if size <= self.max_body else None
+            try:
+                self._record(scope, body, size, response["status"], started_at, duration_ms)
+            except Exception:
+                self.errors += 1
+
+    def _record(
+        self,
+        scope: Scope,
+        body: Optional[bytes],
+        size: int,
+        status: int,
+        started_at: float,
+        duration_ms: float,
+    ) -> None:
+        auth = None
+        content_type = ""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth = "bearer"
+            elif name == b"cookie" and auth is None:
+                auth = "cookie"
+            elif name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+
+        fields = self._parse_body(content_type, body) if body else None
+        username = self.identify(scope) if auth is not None else None
+        if auth == "cookie" and username is None:
+            # Cookies que no son una sesión válida: a efectos de replay, anónima
+            auth = None
+        if username is None and isinstance(fields, dict) and isinstance(fields.get("username"), str):
+            user = fields["username"]  # ya seudonimizado
+        else:
+            user = self.pseudonym(username) if username else None
+        if not self._sampled(user):
+            return
+
+        query = scope["query_string"]
+        route = scope.get("route")
+        self.pipeline.emit(
+            "request",
+            started_at=round(started_at, 4),
+            user=user,
+            auth=auth,
+            method=scope["method"],
+            route=getattr(route, "path", None),
+            path=scope["path"],
+            query=self._redact(dict(parse_qsl(query.decode("latin-1"), keep_blank_values=True))) if query else None,
+            body=fields,
+            body_type=_body_type(content_type) if fields is not None else None,
+            body_bytes=size,
+            status=status,
+            duration_ms=duration_ms,
+        )
+
+
+def _body_type(content_type: str) -> Optional[str]:
+    if content_type.startswith("application/json"):
+        return "json"
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return "form"
+    return None
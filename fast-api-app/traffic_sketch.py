@@ -0,0 +1,176 @@
+"""
+Heavy hitters del tráfico autenticado con sketches de memoria fija
+=================================================================
+
+Contadores exactos por sub crecerían con el número de usuarios. En su lugar:
+
+- CountMinSketch: estimación de cuántas requests ha hecho cualquier clave
+  (nunca por debajo del valor real; por encima como mucho ~e/width del
+  total con probabilidad 1 - e^-depth). depth x width contadores fijos
+- SpaceSaving: las k claves más frecuentes con su cuenta y el error máximo
+  de esa cuenta. Estructura stream-summary (cubetas por cuenta), así que
+  cada actualización es O(1)
+
+TrafficAnalytics agrupa ambos por usuario (sub), cliente (azp) y ruta, en
+ventanas de `window` segundos: la ventana en curso y la anterior completa,
+para ver el tráfico de ahora y no el acumulado desde el arranque.
+
+No es thread-safe: se actualiza desde el event loop.
+"""
+
+import time
+from array import array
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class CountMinSketch:
+    """Frecuencias aproximadas con depth filas de width contadores"""
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+
+    def _indexes(self, key: Hashable):
+        # Doble hashing: depth índices a partir de un solo hash de 64 bits
+        h = hash(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = ((h >> 32) & 0xFFFFFFFF) | 1
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, key: Hashable, count: int = 1) -> None:
+        self.total += count
+        for row, index in zip(self._rows, self._indexes(key)):
+            row[index] += count
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+
+class SpaceSaving:
+    """Top-k aproximado (Metwally et al.) con actualizaciones O(1)"""
+
+    def __init__(self, k: int = 20):
+        self.k = k
+        self._counts: Dict[Hashable, int] = {}
+        self._errors: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, Set[Hashable]] = {}
+        self._min = 0
+
+    def _move(self, key: Hashable, old: int, new: int) -> None:
+        bucket = self._buckets[old]
+        bucket.discard(key)
+        if not bucket:
+            del self._buckets[old]
+            if old == self._min:
+                self._min = new
+        self._buckets.setdefault(new, set()).add(key)
+        self._counts[key] = new
+
+    def add(self, key: Hashable) -> None:
+        count = self._counts.get(key)
+        if count is not None:
+            self._move(key, count, count + 1)
+            return
+        if len(self._counts) < self.k:
+            self._counts[key] = 1
+            self._errors[key] = 0
+            self._buckets.setdefault(1, set()).add(key)
+            self._min = 1
+            return
+        # Lleno: la clave nueva hereda la cuenta de la menos frecuente
+        victim = next(iter(self._buckets[self._min]))
+        floor = self._min
+        del self._counts[victim]
+        del self._errors[victim]
+        self._counts[key] = floor
+        self._errors[key] = floor
+        self._buckets[floor].discard(victim)
+        self._buckets[floor].add(key)
+        self._move(key, floor, floor + 1)
+
+    def get(self, key: Hashable) -> Optional[Tuple[int, int]]:
+        """(cuenta, error máximo) si la clave está entre las vigiladas"""
+        count = self._counts.get(key)
+        return None if count is None else (count, self._errors[key])
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Hashable, int, int]]:
+        """[(clave, cuenta, error)] de mayor a menor"""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return [(key, count, self._errors[key]) for key, count in ranked[:n]]
+
+
+class _Window:
+    __slots__ = ("started_at", "total", "users", "user_sketch", "clients", "routes")
+
+    def __init__(self, k: int, width: int, depth: int):
+        self.started_at = time.time()
+        self.total = 0
+        self.users = SpaceSaving(k)
+        self.user_sketch = CountMinSketch(width, depth)
+        self.clients = SpaceSaving(k)
+        self.routes = SpaceSaving(k)
+
+    def report(self, n: Optional[int] = None) -> Dict[str, Any]:
+        def rows(summary: SpaceSaving, name: str) -> List[Dict[str, Any]]:
+            return [{name: key, "requests": count, "error": error} for key, count, error in summary.top(n)]
+
+        return {
+            "started_at": round(self.started_at, 3),
+            "total": self.total,
+            "users": rows(self.users, "sub"),
+            "clients": rows(self.clients, "client"),
+            "routes": rows(self.routes, "route"),
+        }
+
+
+class TrafficAnalytics:
+    """Top usuarios, clientes y rutas por ventana de tiempo"""
+
+    def __init__(self, k: int = 20, width: int = 2048, depth: int = 4, window: float = 60.0):
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.window = window
+        self._current = _Window(k, width, depth)
+        self._previous: Optional[_Window] = None
+
+    def _rotate(self, now: float) -> None:
+        if now - self._current.started_at >= self.window:
+            # Si pasó más de una ventana sin tráfico, la anterior estaba vacía
+            fresh = now - self._current.started_at < 2 * self.window
+            self._previous = self._current if fresh else None
+            self._current = _Window(self.k, self.width, self.depth)
+
+    def record(self, sub: Optional[str], client: Optional[str], route: Optional[str]) -> None:
+        now = time.time()
+        if now - self._current.started_at >= self.window:
+            self._rotate(now)
+        current = self._current
+        current.total += 1
+        if sub:
+            current.users.add(sub)
+            current.user_sketch.add(sub)
+        if client:
+            current.clients.add(client)
+        if route:
+            current.routes.add(route)
+
+    def estimate_user(self, sub: str) -> Dict[str, Optional[int]]:
+        """Requests estimadas de un sub en la ventana en curso y en la anterior"""
+        self._rotate(time.time())
+        previous = self._previous
+        return {
+            "current": self._current.user_sketch.estimate(sub),
+            "previous": previous.user_sketch.estimate(sub) if previous is not None else None,
+        }
+
+    def report(self, n: Optional[int] = None) -> Dict[str, Any]:
+        self._rotate(time.time())
+        return {
+            "window_seconds": self.window,
+            "current": self._current.report(n),
+            "previous": self._previous.report(n) if self._previous is not None else None,
+        }
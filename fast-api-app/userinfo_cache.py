@@ -0,0 +1,127 @@
+"""
+Caché de enriquecimiento con el endpoint userinfo de Keycloak
+=============================================================
+
+Permite emitir access tokens reducidos (sin email, name, etc.) y completar
+el perfil desde userinfo sin una llamada a Keycloak por request:
+
+- Entradas indexadas por sub, con TTL
+- Caché negativa: un fallo o una respuesta vacía se recuerda durante un TTL
+  corto para no martillear Keycloak
+- Si llega un token con un sid distinto al de la entrada (nuevo login), la
+  entrada se descarta y se vuelve a pedir
+- Las peticiones concurrentes para el mismo usuario comparten una sola
+  llamada, sobre un cliente httpx asíncrono con conexiones reutilizadas.
+  La llamada corre en su propia task: si el cliente que la inició se
+  desconecta, el resto sigue esperando el resultado
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+
+class UserInfoCache:
+    """
+    Caché de claims de userinfo por sub
+
+    Uso:
+        cache = UserInfoCache(USERINFO_URL)
+        claims = await cache.get(sub, sid, access_token)   # dict o None
+        await cache.aclose()
+    """
+
+    def __init__(
+        self,
+        userinfo_url: str,
+        ttl: float = 300,
+        negative_ttl: float = 30,
+        max_entries: int = 10000,
+        timeout: float = 5.0,
+    ):
+        self.userinfo_url = userinfo_url
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        # sub -> (expira, sid, claims o None si es una entrada negativa)
+        self._entries: Dict[str, Tuple[float, Optional[str], Optional[Dict[str, Any]]]] = {}
+        self._inflight: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+        return self._client
+
+    async def get(self, sub: str, sid: Optional[str], access_token: str) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve los claims de userinfo del usuario, o None si no están disponibles
+
+        Nunca lanza: un error de Keycloak se trata como entrada negativa.
+        """
+        entry = self._entries.get(sub)
+        if entry is not None:
+            expires_at, entry_sid, claims = entry
+            if expires_at > time.monotonic() and entry_sid == sid:
+                return claims
+            del self._entries[sub]
+
+        key = (sub, sid)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(sub, sid, access_token))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Cancelar una request solo cancela su espera, no la llamada compartida
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, sub: str, sid: Optional[str], access_token: str) -> Optional[Dict[str, Any]]:
+        claims = await self._fetch(sub, access_token)
+        self._store(sub, sid, claims)
+        return claims
+
+    async def _fetch(self, sub: str, access_token: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = await self._get_client().get(
+                self.userinfo_url,
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+        except httpx.HTTPError:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            claims = response.json()
+        except ValueError:
+            return None
+        # El sub de userinfo debe coincidir con el del token (OIDC Core 5.3.2)
+        if not isinstance(claims, dict) or claims.get("sub") != sub:
+            return None
+        return claims
+
+    def _store(self, sub: str, sid: Optional[str], claims: Optional[Dict[str, Any]]) -> None:
+        ttl = self.ttl if claims is not None else self.negative_ttl
+        if sub not in self._entries and len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)), None)
+        self._entries[sub] = (time.monotonic() + ttl, sid, claims)
+
+    def invalidate(self, sub: str) -> None:
+        """Descarta la entrada de un usuario"""
+        self._entries.pop(sub, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def aclose(self) -> None:
+        """Cancela las llamadas en curso y cierra el pool de conexiones"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -294,25 +294,28 @@ curl -X GET 'http://localhost:8000/api/admin/users' \
 """
 EJEMPLO DE CLIENTE PYTHON:
 
-import requests
+No pidas un token nuevo (y abras una conexión nueva) en cada llamada: usa el
+cliente de sdk/python (pip install ./sdk/python), que reutiliza el token hasta
+poco antes de expirar, mantiene un pool de conexiones y reintenta una vez si la
+API responde 401.
 
-# 1. Obtener token
-def get_token(username, password):
-    url = 'http://localhost:8080/realms/demo-app/protocol/openid-connect/token'
-    data = {
-        'client_id': 'demo-app-backend',
-        'client_secret': 'demo-app-backend-secret-change-me',
-        'grant_type': 'password',
-        'username': username,
-        'password': password
-    }
-    response = requests.post(url, data=data)
-    return response.json()['access_token']
+from keycloak_lab_client import KeycloakLabClient
+
+with KeycloakLabClient(
+    'http://localhost:8000',
+    keycloak_url='http://localhost:8080',
+    realm='demo-app',
+    client_id='demo-app-backend',
+    client_secret='demo-app-backend-secret-change-me',
+    username='demo-user',
+    password='demo123',
+) as api:
+    # 1. El token se pide en la primera llamada y se reutiliza en las siguientes
+    response = api.get('/api/protected/profile')
+    print(response.json())
 
-# 2. Hacer petición autenticada
-token = get_token('demo-user', 'demo123')
-headers = {'Authorization': f'Bearer {token}'}
+    # 2. Varias llamadas en paralelo con el mismo token y el mismo pool
+    responses = api.batch([lambda: api.get('/api/protected/profile') for _ in range(10)])
 
-response = requests.get('http://localhost:8000/api/protected/profile', headers=headers)
-print(response.json())
+# Versión asyncio: AsyncKeycloakLabClient, con la misma interfaz (await)
 """
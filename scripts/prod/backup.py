@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+"""
+Backup incremental de Keycloak (base de datos + realms)
+=======================================================
+
+Sustituye el volcado serie de backup.sh:
+
+- El pg_dump y el export de cada realm se leen en paralelo, en streaming,
+  sin pasar por ficheros intermedios
+- Cada stream se corta en chunks definidos por contenido: los cortes caen
+  en fronteras de registro (fin de línea en el SQL, "}," en el JSON) cuyo
+  hash cumple una condición, así que insertar o borrar filas solo cambia
+  los chunks de alrededor y el resto se deduplica entre backups
+- Los chunks se guardan comprimidos (zlib) en un almacén direccionado por
+  su SHA-256; un chunk que ya existe no se vuelve a escribir
+- Cada backup es un manifest.json con la lista de chunks de cada stream y
+  el SHA-256 del stream completo. Chunks y directorios se sincronizan a
+  disco (fsync) antes de escribir el manifest, así que tras una caída un
+  manifest nunca apunta a un chunk vacío o truncado
+- create, restore y verify toman backups/.lock compartido; prune lo toma
+  exclusivo, para no borrar chunks que un backup en curso acaba de
+  deduplicar (y que aún no referencia ningún manifest)
+
+Estructura de backups/:
+    chunks/ab/<sha256>              chunk comprimido
+    snapshots/<timestamp>/manifest.json
+    snapshots/<timestamp>/manifest.json.sha256
+
+restore reconstruye los streams en paralelo (descompresión con prefetch)
+verificando cada chunk y el SHA-256 de cada stream; restore.sh lo usa para
+obtener keycloak_db.sql y los realms.
+
+Fuentes:
+    Por defecto pg_dump vía "docker exec <contenedor>" y los realms vía la
+    Admin REST API (partial-export, con clientes, grupos y roles; Keycloak
+    enmascara los secretos). Con --source-dir se respaldan los ficheros de
+    un directorio, útil para probar con datos locales.
+
+Uso:
+    ./backup.py create [--pg-container keycloak-postgres] [--jobs 4]
+    ./backup.py create --source-dir fixtures/ --backup-dir /tmp/backups
+    ./backup.py list | latest
+    ./backup.py verify [timestamp ...]
+    ./backup.py restore <timestamp> --output-dir /tmp/restore
+    ./backup.py prune --keep-days 7
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from keycloak_admin import PROJECT_ROOT, KeycloakAdmin, KeycloakAdminError  # noqa: E402
+
+# Colores (mismos que los scripts .sh)
+GREEN = "\033[0;32m"
+YELLOW = "\033[1;33m"
+RED = "\033[0;31m"
+NC = "\033[0m"
+
+DEFAULT_BACKUP_DIR = os.path.join(PROJECT_ROOT, "backups")
+DB_STREAM = "keycloak_db.sql"
+READ_SIZE = 1 << 20
+
+# Candidatos a corte: fin de línea o fin de objeto dentro de un array JSON
+_BOUNDARY = re.compile(rb"\n|\},")
+
+
+class BackupError(Exception):
+    """Fallo al crear, verificar o restaurar un backup"""
+
+
+def fsync_dir(path: str) -> None:
+    """Sincroniza un directorio (las entradas creadas o renombradas en él)"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def backup_lock(backup_dir: str, exclusive: bool) -> Iterator[None]:
+    """Lock del directorio de backups: compartido (create, restore, verify) o exclusivo (prune)"""
+    os.makedirs(backup_dir, exist_ok=True)
+    with open(os.path.join(backup_dir, ".lock"), "a") as f:
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(f, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"{YELLOW}⏳ Esperando a otra operación sobre {backup_dir}...{NC}")
+            fcntl.flock(f, mode)
+        yield
+
+
+class Chunker:
+    """
+    Corte de un stream en chunks definidos por contenido
+
+    Un candidato (_BOUNDARY) es corte si el CRC32 de los `window` bytes que
+    lo preceden cumple `crc & mask == 0`. Los chunks miden entre min_size y
+    max_size; si no aparece ningún corte antes de max_size se corta ahí.
+
+    Un hash rodante byte a byte (gear/Rabin) sería más general, pero en
+    Python puro no pasa de unos MB/s; limitar los cortes a fronteras de
+    registro deja el trabajo por byte en C (regex + zlib).
+    """
+
+    def __init__(self, min_size: int = 64 << 10, max_size: int = 1 << 20, mask: int = 0x3FF, window: int = 48):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.mask = mask
+        self.window = window
+        self._buf = bytearray()
+        self._scanned = 0
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """Añade datos y devuelve los chunks que quedan completos"""
+        self._buf += data
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return
+            chunk = bytes(self._buf[:cut])
+            del self._buf[:cut]
+            self._scanned = 0
+            yield chunk
+
+    def finish(self) -> Iterator[bytes]:
+        """Devuelve el resto del stream"""
+        if self._buf:
+            yield bytes(self._buf)
+            self._buf = bytearray()
+
+    def _find_cut(self) -> Optional[int]:
+        buf = self._buf
+        if len(buf) < self.min_size:
+            return None
+        # El último byte puede ser la primera mitad de "},": se mira en la siguiente vuelta
+        limit = min(len(buf) - 1, self.max_size)
+        view = memoryview(buf)
+        try:
+            for match in _BOUNDARY.finditer(buf, max(self._scanned, self.min_size), limit):
+                end = match.end()
+                if zlib.crc32(view[end - self.window:end]) & self.mask == 0:
+                    return end
+        finally:
+            view.release()
+        if len(buf) >= self.max_size:
+            return self.max_size
+        self._scanned = max(self.min_size, limit - 1)
+        return None
+
+
+class ChunkStore:
+    """Almacén de chunks comprimidos direccionado por SHA-256"""
+
+    def __init__(self, root: str, level: int = 6):
+        self.root = os.path.join(root, "chunks")
+        self.level = level
+        self._known: set = set()
+        # Directorios con chunks nuevos, pendientes de fsync
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, chunk: bytes) -> Tuple[str, int]:
+        """Guarda el chunk si no existe; devuelve (sha256, bytes escritos)"""
+        digest = hashlib.sha256(chunk).hexdigest()
+        with self._lock:
+            if digest in self._known:
+                return digest, 0
+        path = self.path(digest)
+        written = 0
+        if not os.path.exists(path):
+            data = zlib.compress(chunk, self.level)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            written = len(data)
+            with self._lock:
+                self._dirty.add(os.path.dirname(path))
+        with self._lock:
+            self._known.add(digest)
+        return digest, written
+
+    def sync(self) -> None:
+        """fsync de los directorios con chunks nuevos (antes de escribir el manifest)"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        for directory in sorted(dirty):
+            fsync_dir(directory)
+        # Los subdirectorios <aa>/ recién creados son entradas de chunks/
+        fsync_dir(self.root)
+
+    def get(self, digest: str) -> bytes:
+        """Lee, descomprime y verifica un chunk"""
+        try:
+            with open(self.path(digest), "rb") as f:
+                chunk = zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            raise BackupError(f"Chunk {digest[:12]} ilegible: {e}") from e
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise BackupError(f"Chunk {digest[:12]} corrupto (checksum)")
+        return chunk
+
+
+# ============================================
+# FUENTES
+# ============================================
+
+Source = Tuple[str, Callable[[], Iterable[bytes]]]
+
+
+def _read_blocks(fp: BinaryIO) -> Iterator[bytes]:
+    while True:
+        block = fp.read(READ_SIZE)
+        if not block:
+            return
+        yield block
+
+
+def command_source(name: str, command: List[str]) -> Source:
+    """Stream de la salida estándar de un comando (p.ej. pg_dump)"""
+
+    def blocks() -> Iterator[bytes]:
+        # stderr a fichero: con un pipe, un comando muy verboso podría bloquearse
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                yield from _read_blocks(process.stdout)
+            finally:
+                process.stdout.close()
+                if process.wait() != 0:
+                    stderr.seek(0)
+                    message = stderr.read().decode(errors="replace").strip()[:300]
+                    raise BackupError(f"{' '.join(command)} terminó con código {process.returncode}: {message}")
+
+    return name, blocks
+
+
+def file_source(name: str, path: str) -> Source:
+    def blocks() -> Iterator[bytes]:
+        with open(path, "rb") as f:
+            yield from _read_blocks(f)
+
+    return name, blocks
+
+
+def realm_source(admin: KeycloakAdmin, realm: str) -> Source:
+    """Export del realm vía partial-export (en streaming)"""
+
+    def blocks() -> Iterator[bytes]:
+        response = admin.request(
+            "POST",
+            f"/{realm}/partial-export",
+            params={"exportClients": "true", "exportGroupsAndRoles": "true"},
+            stream=True,
+        )
+        try:
+            yield from response.iter_content(READ_SIZE)
+        finally:
+            response.close()
+
+    return f"realms/{realm}-realm.json", blocks
+
+
+def directory_sources(directory: str) -> List[Source]:
+    """Un stream por fichero del directorio (ruta relativa como nombre)"""
+    sources = []
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            sources.append(file_source(os.path.relpath(path, directory).replace(os.sep, "/"), path))
+    return sorted(sources)
+
+
+# ============================================
+# BACKUP
+# ============================================
+
+def backup_stream(store: ChunkStore, name: str, blocks: Callable[[], Iterable[bytes]]) -> Dict[str, Any]:
+    """Trocea, deduplica y guarda un stream; devuelve su entrada del manifest"""
+    chunker = Chunker()
+    digest = hashlib.sha256()
+    chunks: List[List[Any]] = []
+    size = stored = new_chunks = 0
+
+    def store_chunk(chunk: bytes) -> None:
+        nonlocal stored, new_chunks
+        chunk_digest, written = store.put(chunk)
+        chunks.append([chunk_digest, len(chunk)])
+        if written:
+            stored += written
+            new_chunks += 1
+
+    for block in blocks():
+        size += len(block)
+        digest.update(block)
+        for chunk in chunker.feed(block):
+            store_chunk(chunk)
+    for chunk in chunker.finish():
+        store_chunk(chunk)
+
+    return {
+        "name": name,
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "chunks": chunks,
+        "new_chunks": new_chunks,
+        "stored_bytes": stored,
+    }
+
+
+def snapshot_dir(backup_dir: str, timestamp: str) -> str:
+    return os.path.join(backup_dir, "snapshots", timestamp)
+
+
+def write_manifest(backup_dir: str, manifest: Dict[str, Any]) -> str:
+    directory = snapshot_dir(backup_dir, manifest["timestamp"])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "manifest.json")
+    data = json.dumps(manifest, indent=1).encode()
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+    with open(f"{path}.sha256", "w") as f:
+        f.write(f"{hashlib.sha256(data).hexdigest()}  manifest.json\n")
+        f.flush()
+        os.fsync(f.fileno())
+    fsync_dir(directory)
+    return path
+
+
+def load_manifest(backup_dir: str, timestamp: str) -> Dict[str, Any]:
+    path = os.path.join(snapshot_dir(backup_dir, timestamp), "manifest.json")
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        raise BackupError(f"No existe el backup {timestamp}") from e
+    checksum_path = f"{path}.sha256"
+    if os.path.exists(checksum_path):
+        with open(checksum_path) as f:
+            expected = f.read().split()[0]
+        if hashlib.sha256(data).hexdigest() != expected:
+            raise BackupError(f"Manifest de {timestamp} corrupto (checksum)")
+    return json.loads(data)
+
+
+def list_snapshots(backup_dir: str) -> List[str]:
+    root = os.path.join(backup_dir, "snapshots")
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, "manifest.json")))
+
+
+def collect_sources(args: argparse.Namespace) -> List[Source]:
+    if args.source_dir:
+        return directory_sources(args.source_dir)
+
+    sources: List[Source] = []
+    if not args.no_db:
+        command = shlex.split(args.pg_dump_cmd) if args.pg_dump_cmd else [
+            "docker", "exec", args.pg_container, "pg_dump", "-U", "keycloak", "keycloak",
+        ]
+        sources.append(command_source(DB_STREAM, command))
+    if not args.no_realms:
+        admin = KeycloakAdmin.from_env(base_url=args.url, pool_size=args.jobs)
+        try:
+            realms = [realm["realm"] for realm in admin.get_realms()]
+        except (KeycloakAdminError, OSError) as e:
+            print(f"{YELLOW}⚠️  No se pudo listar los realms, saltando export de realms: {e}{NC}")
+            realms = []
+        sources.extend(realm_source(admin, realm) for realm in realms)
+    return sources
+
+
+def run_create(args: argparse.Namespace) -> int:
+    sources = collect_sources(args)
+    if not sources:
+        print(f"{RED}❌ No hay nada que respaldar{NC}")
+        return 1
+
+    timestamp = args.timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    store = ChunkStore(args.backup_dir, level=args.level)
+    print(f"{YELLOW}📦 Backup {timestamp}: {len(sources)} streams, {args.jobs} en paralelo...{NC}")
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [(name, pool.submit(backup_stream, store, name, blocks)) for name, blocks in sources]
+        streams = []
+        failed = False
+        for name, future in futures:
+            try:
+                entry = future.result()
+            except (BackupError, KeycloakAdminError, OSError) as e:
+                print(f"{RED}❌ {name}: {e}{NC}")
+                failed = True
+                continue
+            streams.append(entry)
+            print(
+                f"   {name}: {entry['size'] / 1e6:.1f} MB, {len(entry['chunks'])} chunks "
+                f"({entry['new_chunks']} nuevos, {entry['stored_bytes'] / 1e6:.2f} MB escritos)"
+            )
+    if failed:
+        print(f"{RED}❌ Backup incompleto, no se escribe el manifest{NC}")
+        return 1
+    store.sync()
+
+    elapsed = time.monotonic() - start
+    manifest = {
+        "version": 1,
+        "timestamp": timestamp,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "duration_s": round(elapsed, 2),
+        "streams": streams,
+    }
+    write_manifest(args.backup_dir, manifest)
+
+    total = sum(entry["size"] for entry in streams)
+    stored = sum(entry["stored_bytes"] for entry in streams)
+    print(f"{GREEN}✅ Backup {timestamp}: {total / 1e6:.1f} MB leídos, {stored / 1e6:.2f} MB nuevos en {elapsed:.1f}s{NC}")
+    return 0
+
+
+# ============================================
+# RESTORE / VERIFY
+# ============================================
+
+def iter_stream(store: ChunkStore, entry: Dict[str, Any], pool: ThreadPoolExecutor, prefetch: int) -> Iterator[bytes]:
+    """Chunks del stream en orden, descomprimidos y verificados con prefetch en el pool"""
+    pending: deque = deque()
+    chunks = iter(entry["chunks"])
+    digest = hashlib.sha256()
+    size = 0
+
+    for digest_hex, _ in chunks:
+        pending.append(pool.submit(store.get, digest_hex))
+        if len(pending) >= prefetch:
+            break
+    while pending:
+        chunk = pending.popleft().result()
+        for digest_hex, _ in chunks:
+            pending.append(pool.submit(store.get, digest_hex))
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        yield chunk
+
+    if size != entry["size"] or digest.hexdigest() != entry["sha256"]:
+        raise BackupError(f"{entry['name']}: el stream reconstruido no coincide con el manifest")
+
+
+def restore_stream(store: ChunkStore, entry: Dict[str, Any], output_dir: str, pool: ThreadPoolExecutor, prefetch: int) -> str:
+    path = os.path.join(output_dir, *entry["name"].split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        for chunk in iter_stream(store, entry, pool, prefetch):
+            f.write(chunk)
+    os.replace(tmp, path)
+    return path
+
+
+def run_restore(args: argparse.Namespace) -> int:
+    manifest = load_manifest(args.backup_dir, args.timestamp)
+    store = ChunkStore(args.backup_dir)
+    streams = [entry for entry in manifest["streams"] if not args.only or entry["name"] in args.only]
+    print(f"{YELLOW}📦 Restaurando {len(streams)} streams de {args.timestamp} en {args.output_dir}...{NC}")
+    start = time.monotonic()
+
+    # Un pool para los streams y otro para descomprimir: así los streams no
+    # se bloquean esperando chunks que no tienen hilo libre
+    with ThreadPoolExecutor(max_workers=args.jobs) as chunk_pool, ThreadPoolExecutor(max_workers=args.jobs) as stream_pool:
+        futures = [
+            (entry["name"], stream_pool.submit(restore_stream, store, entry, args.output_dir, chunk_pool, args.jobs * 2))
+            for entry in streams
+        ]
+        failed = False
+        for name, future in futures:
+            try:
+                print(f"   {future.result()}")
+            except (BackupError, OSError) as e:
+                print(f"{RED}❌ {name}: {e}{NC}")
+                failed = True
+    if failed:
+        return 1
+    print(f"{GREEN}✅ Restaurado en {time.monotonic() - start:.1f}s{NC}")
+    return 0
+
+
+def verify_snapshot(store: ChunkStore, manifest: Dict[str, Any], pool: ThreadPoolExecutor) -> List[str]:
+    """Reconstruye cada stream en memoria por bloques y devuelve los errores"""
+    errors = []
+    for entry in manifest["streams"]:
+        try:
+            for _ in iter_stream(store, entry, pool, prefetch=8):
+                pass
+        except BackupError as e:
+            errors.append(str(e))
+    return errors
+
+
+def run_verify(args: argparse.Namespace) -> int:
+    timestamps = args.timestamps or list_snapshots(args.backup_dir)
+    if not timestamps:
+        print(f"{YELLOW}No hay backups para verificar{NC}")
+        return 0
+    store = ChunkStore(args.backup_dir)
+    invalid = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for timestamp in timestamps:
+            try:
+                errors = verify_snapshot(store, load_manifest(args.backup_dir, timestamp), pool)
+            except BackupError as e:
+                errors = [str(e)]
+            if errors:
+                invalid += 1
+                print(f"{timestamp} {RED}✗ CORRUPTO{NC}")
+                for error in errors:
+                    print(f"  └─ {error}")
+            else:
+                print(f"{timestamp} {GREEN}✓ OK{NC}")
+    return 1 if invalid else 0
+
+
+def run_list(args: argparse.Namespace) -> int:
+    for timestamp in list_snapshots(args.backup_dir):
+        manifest = load_manifest(args.backup_dir, timestamp)
+        size = sum(entry["size"] for entry in manifest["streams"])
+        stored = sum(entry.get("stored_bytes", 0) for entry in manifest["streams"])
+        realms = sum(1 for entry in manifest["streams"] if entry["name"].startswith("realms/"))
+        print(f"{timestamp}  {size / 1e6:8.1f} MB  (+{stored / 1e6:.2f} MB nuevos)  {realms} realms")
+    return 0
+
+
+def run_latest(args: argparse.Namespace) -> int:
+    snapshots = list_snapshots(args.backup_dir)
+    if not snapshots:
+        return 1
+    print(snapshots[-1])
+    return 0
+
+
+def run_prune(args: argparse.Namespace) -> int:
+    """Borra snapshots antiguos y los chunks que ya no referencia ninguno"""
+    snapshots = list_snapshots(args.backup_dir)
+    cutoff = time.time() - args.keep_days * 86400
+    # El más reciente se conserva siempre
+    removable = [
+        timestamp for timestamp in snapshots[:-1]
+        if os.path.getmtime(os.path.join(snapshot_dir(args.backup_dir, timestamp), "manifest.json")) < cutoff
+    ]
+    for timestamp in removable:
+        shutil.rmtree(snapshot_dir(args.backup_dir, timestamp))
+
+    referenced = set()
+    for timestamp in list_snapshots(args.backup_dir):
+        for entry in load_manifest(args.backup_dir, timestamp)["streams"]:
+            referenced.update(digest for digest, _ in entry["chunks"])
+
+    removed_chunks = 0
+    chunk_root = os.path.join(args.backup_dir, "chunks")
+    for root, _, files in os.walk(chunk_root):
+        for filename in files:
+            if filename not in referenced:
+                os.remove(os.path.join(root, filename))
+                removed_chunks += 1
+    print(f"{GREEN}✅ {len(removable)} backups y {removed_chunks} chunks eliminados{NC}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backup-dir", default=DEFAULT_BACKUP_DIR)
+    parser.add_argument("--jobs", type=int, default=4, help="Streams / chunks en paralelo")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="Crear un backup")
+    create.add_argument("--url", help="URL base de Keycloak (por defecto KEYCLOAK_ADMIN_URL o https://localhost:8443)")
+    create.add_argument("--pg-container", default="keycloak-postgres")
+    create.add_argument("--pg-dump-cmd", help="Comando alternativo que escribe el dump SQL en stdout")
+    create.add_argument("--no-db", action="store_true", help="No incluir la base de datos")
+    create.add_argument("--no-realms", action="store_true", help="No exportar los realms")
+    create.add_argument("--source-dir", help="Respaldar los ficheros de este directorio en lugar de Keycloak")
+    create.add_argument("--timestamp", help="Nombre del backup (por defecto fecha actual)")
+    create.add_argument("--level", type=int, default=6, help="Nivel de compresión zlib")
+
+    restore = sub.add_parser("restore", help="Reconstruir los ficheros de un backup")
+    restore.add_argument("timestamp")
+    restore.add_argument("--output-dir", required=True)
+    restore.add_argument("--only", nargs="+", help="Restaurar solo estos streams")
+
+    verify = sub.add_parser("verify", help="Verificar chunks y checksums")
+    verify.add_argument("timestamps", nargs="*")
+
+    sub.add_parser("list", help="Listar backups")
+    sub.add_parser("latest", help="Imprimir el timestamp del último backup")
+
+    prune = sub.add_parser("prune", help="Eliminar backups antiguos y chunks huérfanos")
+    prune.add_argument("--keep-days", type=int, default=7)
+
+    args = parser.parse_args()
+    commands = {
+        "create": run_create,
+        "restore": run_restore,
+        "verify": run_verify,
+        "list": run_list,
+        "latest": run_latest,
+        "prune": run_prune,
+    }
+    # prune no puede correr a la vez que create (ni que restore/verify)
+    locks = {"create": False, "restore": False, "verify": False, "prune": True}
+    try:
+        if args.command not in locks:
+            return commands[args.command](args)
+        with backup_lock(args.backup_dir, exclusive=locks[args.command]):
+            return commands[args.command](args)
+    except BackupError as e:
+        print(f"{RED}❌ {e}{NC}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,7 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 BACKUP_DIR="${SCRIPT_DIR}/../../backups"
 BACKUP_SCRIPT="${SCRIPT_DIR}/backup.sh"
 RESTORE_SCRIPT="${SCRIPT_DIR}/restore.sh"
+BACKUP_TOOL="python3 ${SCRIPT_DIR}/backup.py --backup-dir ${BACKUP_DIR}"
 
 # Load environment variables from docker/.env
 if [ -f "${SCRIPT_DIR}/../../docker/.env" ]; then
@@ -85,7 +86,7 @@ show_system_status() {
     echo -e "${YELLOW}Espacio en disco (backups):${NC}"
     if [ -d "$BACKUP_DIR" ]; then
         du -sh "$BACKUP_DIR" 2>/dev/null || echo "  Sin backups"
-        echo "  Número de backups: $(ls -1 "$BACKUP_DIR"/*.sql.gz 2>/dev/null | wc -l)"
+        echo "  Número de backups: $(( $($BACKUP_TOOL list | wc -l) + $(legacy_backups | wc -l) ))"
     else
         echo "  No existe directorio de backups"
     fi
@@ -93,11 +94,9 @@ show_system_status() {
     
     # Último backup
     echo -e "${YELLOW}Último backup:${NC}"
-    local last_backup=$(ls -t "$BACKUP_DIR"/*.sql.gz 2>/dev/null | head -1)
+    local last_backup=$($BACKUP_TOOL list | tail -1)
     if [ -n "$last_backup" ]; then
-        echo "  Archivo: $(basename $last_backup)"
-        echo "  Fecha: $(date -r "$last_backup" '+%Y-%m-%d %H:%M:%S')"
-        echo "  Tamaño: $(du -h "$last_backup" | cut -f1)"
+        echo "  $last_backup"
     else
         echo "  No hay backups disponibles"
     fi
@@ -106,6 +105,12 @@ show_system_status() {
     return 0
 }
 
+# Timestamps de los backups en el formato anterior
+# (keycloak_db_<timestamp>.sql.gz + realms_<timestamp>/), más recientes primero
+legacy_backups() {
+    ls -1t "$BACKUP_DIR"/keycloak_db_*.sql.gz 2>/dev/null | sed 's/.*keycloak_db_//; s/\.sql\.gz$//'
+}
+
 # Listar backups
 list_backups() {
     echo -e "${BLUE}════════════════════════════════════════════════════════════${NC}"
@@ -113,32 +118,38 @@ list_backups() {
     echo -e "${BLUE}════════════════════════════════════════════════════════════${NC}"
     echo ""
     
-    if [ ! -d "$BACKUP_DIR" ] || [ -z "$(ls -A "$BACKUP_DIR"/*.sql.gz 2>/dev/null)" ]; then
+    local backups=$($BACKUP_TOOL list)
+    local legacy=$(legacy_backups)
+    if [ -z "$backups" ] && [ -z "$legacy" ]; then
         echo -e "${YELLOW}No hay backups disponibles${NC}"
         echo ""
         return 0
     fi
     
-    echo -e "${CYAN}Timestamp           Fecha/Hora          Tamaño    Realm${NC}"
-    echo "────────────────────────────────────────────────────────────"
-    
-    for backup in $(ls -t "$BACKUP_DIR"/*.sql.gz 2>/dev/null); do
-        local timestamp=$(basename "$backup" | sed 's/keycloak_db_//' | sed 's/.sql.gz//')
-        local size=$(du -h "$backup" | cut -f1)
-        local date_str=$(date -r "$backup" '+%Y-%m-%d %H:%M:%S')
-        local realm_dir="$BACKUP_DIR/realms_$timestamp"
-        local realm_info=""
-        
-        if [ -d "$realm_dir" ]; then
-            local realm_count=$(ls -1 "$realm_dir"/*.json 2>/dev/null | wc -l)
-            realm_info="✓ ($realm_count realms)"
-        else
-            realm_info="✗"
-        fi
-        
-        echo -e "${GREEN}$timestamp${NC}  $date_str  ${YELLOW}$size${NC}    $realm_info"
-    done
-    echo ""
+    if [ -n "$backups" ]; then
+        echo -e "${CYAN}Timestamp          Tamaño       Nuevo en este backup   Realms${NC}"
+        echo "────────────────────────────────────────────────────────────"
+        echo "$backups"
+        echo ""
+    fi
+    
+    if [ -n "$legacy" ]; then
+        echo -e "${CYAN}Formato anterior (.sql.gz)${NC}"
+        echo -e "${CYAN}Timestamp           Fecha/Hora          Tamaño    Realm${NC}"
+        echo "────────────────────────────────────────────────────────────"
+        for timestamp in $legacy; do
+            local backup="$BACKUP_DIR/keycloak_db_${timestamp}.sql.gz"
+            local size=$(du -h "$backup" | cut -f1)
+            local date_str=$(date -r "$backup" '+%Y-%m-%d %H:%M:%S')
+            local realm_dir="$BACKUP_DIR/realms_$timestamp"
+            local realm_info="✗"
+            if [ -d "$realm_dir" ]; then
+                realm_info="✓ ($(ls -1 "$realm_dir"/*.json 2>/dev/null | wc -l) realms)"
+            fi
+            echo -e "${GREEN}$timestamp${NC}  $date_str  ${YELLOW}$size${NC}    $realm_info"
+        done
+        echo ""
+    fi
     
     return 0
 }
@@ -196,9 +207,13 @@ restore_backup() {
         return
     fi
     
-    local backup_file="$BACKUP_DIR/keycloak_db_${timestamp}.sql.gz"
-    if [ ! -f "$backup_file" ]; then
-        echo -e "${RED}❌ No existe el backup: $backup_file${NC}"
+    local backup_info=$($BACKUP_TOOL list | grep "^${timestamp} ")
+    local legacy_file="$BACKUP_DIR/keycloak_db_${timestamp}.sql.gz"
+    if [ -z "$backup_info" ] && [ -f "$legacy_file" ]; then
+        backup_info="$timestamp  $(du -h "$legacy_file" | cut -f1)  (formato anterior: $(basename "$legacy_file"))"
+    fi
+    if [ -z "$backup_info" ]; then
+        echo -e "${RED}❌ No existe el backup: $timestamp${NC}"
         echo ""
         return 1
     fi
@@ -206,10 +221,7 @@ restore_backup() {
     echo ""
     echo -e "${RED}⚠️  ADVERTENCIA: Esta operación sobrescribirá TODOS los datos actuales${NC}"
     echo -e "${YELLOW}Backup a restaurar:${NC}"
-    echo "  Timestamp: $timestamp"
-    echo "  Archivo: $(basename $backup_file)"
-    echo "  Tamaño: $(du -h "$backup_file" | cut -f1)"
-    echo "  Fecha: $(date -r "$backup_file" '+%Y-%m-%d %H:%M:%S')"
+    echo "  $backup_info"
     echo ""
     
     bash "$RESTORE_SCRIPT" "$timestamp"
@@ -232,47 +244,26 @@ verify_backups() {
     echo -e "${BLUE}════════════════════════════════════════════════════════════${NC}"
     echo ""
     
-    if [ ! -d "$BACKUP_DIR" ] || [ -z "$(ls -A "$BACKUP_DIR"/*.sql.gz 2>/dev/null)" ]; then
-        echo -e "${YELLOW}No hay backups para verificar${NC}"
-        echo ""
-        return
-    fi
+    # Cada chunk se descomprime y se comprueba su SHA-256 y el de cada stream
+    $BACKUP_TOOL --jobs 4 verify
+    local result=$?
+    echo ""
     
-    local total=0
-    local valid=0
-    local invalid=0
-    
-    for backup in $(ls "$BACKUP_DIR"/*.sql.gz 2>/dev/null); do
-        total=$((total + 1))
-        local timestamp=$(basename "$backup" | sed 's/keycloak_db_//' | sed 's/.sql.gz//')
-        
-        echo -n "Verificando backup $timestamp... "
-        
-        # Verificar que el archivo gzip es válido
-        if gunzip -t "$backup" 2>/dev/null; then
+    # Formato anterior: solo se puede comprobar que el gzip es válido
+    for timestamp in $(legacy_backups); do
+        echo -n "Verificando backup $timestamp (formato anterior)... "
+        if gunzip -t "$BACKUP_DIR/keycloak_db_${timestamp}.sql.gz" 2>/dev/null; then
             echo -e "${GREEN}✓ OK${NC}"
-            valid=$((valid + 1))
-            
-            # Verificar si existe el directorio de realms correspondiente
-            local realm_dir="$BACKUP_DIR/realms_$timestamp"
-            if [ -d "$realm_dir" ]; then
-                local realm_count=$(ls -1 "$realm_dir"/*.json 2>/dev/null | wc -l)
-                echo "  └─ Realms: $realm_count archivos"
-            else
+            if [ ! -d "$BACKUP_DIR/realms_$timestamp" ]; then
                 echo -e "  └─ ${YELLOW}Sin backups de realms${NC}"
             fi
         else
             echo -e "${RED}✗ CORRUPTO${NC}"
-            invalid=$((invalid + 1))
+            result=1
         fi
     done
     
-    echo ""
-    echo -e "${CYAN}Resumen de verificación:${NC}"
-    echo "  Total: $total backups"
-    echo -e "  Válidos: ${GREEN}$valid${NC}"
-    echo -e "  Corruptos: ${RED}$invalid${NC}"
-    echo ""
+    return $result
 }
 
 # Prueba de disaster recovery (automática)
@@ -298,14 +289,13 @@ test_disaster_recovery() {
     # Ejecutar backup y capturar salida
     if bash "$BACKUP_SCRIPT" > "$BACKUP_LOG" 2>&1; then
         # Backup exitoso
-        local test_backup=$(ls -t "$BACKUP_DIR"/*.sql.gz 2>/dev/null | head -1)
-        if [ -z "$test_backup" ]; then
+        local test_timestamp=$($BACKUP_TOOL latest)
+        if [ -z "$test_timestamp" ]; then
             echo -e "${RED}✗ No se encontró el backup creado${NC}"
             rm -f "$BACKUP_LOG"
             return 1
         fi
-        
-        local test_timestamp=$(basename "$test_backup" | sed 's/keycloak_db_//' | sed 's/.sql.gz//')
+
         echo -e "${GREEN}✓ Backup creado: $test_timestamp${NC}"
         rm -f "$BACKUP_LOG"
     else
@@ -427,53 +417,26 @@ verify_backups() {
     echo -e "${BLUE}════════════════════════════════════════════════════════════${NC}"
     echo ""
     
-    if [ ! -d "$BACKUP_DIR" ] || [ -z "$(ls -A "$BACKUP_DIR"/*.sql.gz 2>/dev/null)" ]; then
-        echo -e "${YELLOW}No hay backups para verificar${NC}"
-        echo ""
-        return 0
-    fi
+    # Cada chunk se descomprime y se comprueba su SHA-256 y el de cada stream
+    $BACKUP_TOOL --jobs 4 verify
+    local result=$?
+    echo ""
     
-    local total=0
-    local valid=0
-    local invalid=0
-    
-    for backup in $(ls "$BACKUP_DIR"/*.sql.gz 2>/dev/null); do
-        total=$((total + 1))
-        local timestamp=$(basename "$backup" | sed 's/keycloak_db_//' | sed 's/.sql.gz//')
-        
-        echo -n "Verificando backup $timestamp... "
-        
-        # Verificar que el archivo gzip es válido
-        if gunzip -t "$backup" 2>/dev/null; then
+    # Formato anterior: solo se puede comprobar que el gzip es válido
+    for timestamp in $(legacy_backups); do
+        echo -n "Verificando backup $timestamp (formato anterior)... "
+        if gunzip -t "$BACKUP_DIR/keycloak_db_${timestamp}.sql.gz" 2>/dev/null; then
             echo -e "${GREEN}✓ OK${NC}"
-            valid=$((valid + 1))
-            
-            # Verificar si existe el directorio de realms correspondiente
-            local realm_dir="$BACKUP_DIR/realms_$timestamp"
-            if [ -d "$realm_dir" ]; then
-                local realm_count=$(ls -1 "$realm_dir"/*.json 2>/dev/null | wc -l)
-                echo "  └─ Realms: $realm_count archivos"
-            else
+            if [ ! -d "$BACKUP_DIR/realms_$timestamp" ]; then
                 echo -e "  └─ ${YELLOW}Sin backups de realms${NC}"
             fi
         else
             echo -e "${RED}✗ CORRUPTO${NC}"
-            invalid=$((invalid + 1))
+            result=1
         fi
     done
     
-    echo ""
-    echo -e "${CYAN}Resumen de verificación:${NC}"
-    echo "  Total: $total backups"
-    echo -e "  Válidos: ${GREEN}$valid${NC}"
-    if [ $invalid -gt 0 ]; then
-        echo -e "  Corruptos: ${RED}$invalid${NC}"
-    else
-        echo -e "  Corruptos: ${GREEN}0${NC}"
-    fi
-    echo ""
-    
-    return 0
+    return $result
 }
 
 # Main - Ejecución automática
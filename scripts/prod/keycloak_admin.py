@@ -0,0 +1,192 @@
+"""
+Cliente de la Admin REST API de Keycloak para los scripts de producción
+=======================================================================
+
+Versión reutilizable del KeycloakAdmin de keycloak/examples: obtiene el
+token de admin del realm master (admin-cli, igual que backup.sh), lo renueva
+antes de que expire y comparte una sesión HTTP con pool de conexiones entre
+hilos.
+
+Configuración por entorno (docker/.env se carga si existe):
+    KEYCLOAK_ADMIN_URL   URL base de Keycloak (por defecto https://localhost:8443)
+    KC_ADMIN_USERNAME    Usuario admin (por defecto admin)
+    KC_ADMIN_PASSWORD    Password admin (por defecto admin)
+    KEYCLOAK_VERIFY_TLS  "true" para verificar el certificado (por defecto false,
+                         los certificados de desarrollo son autofirmados)
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def load_env_file(path: str = os.path.join(PROJECT_ROOT, "docker", ".env")) -> None:
+    """Carga variables KEY=VALUE de docker/.env sin pisar las ya definidas"""
+    if not os.path.isfile(path):
+        return
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
+
+
+class KeycloakAdminError(Exception):
+    """Error devuelto por la Admin REST API"""
+
+
+class KeycloakAdmin:
+    """Cliente para administración de Keycloak"""
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        password: str,
+        verify: bool = True,
+        timeout: float = 60,
+        pool_size: int = 16,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs: Any) -> "KeycloakAdmin":
+        """Construye el cliente con la configuración de entorno / docker/.env"""
+        load_env_file()
+        verify = kwargs.pop("verify", None)
+        if verify is None:
+            verify = os.getenv("KEYCLOAK_VERIFY_TLS", "false").lower() == "true"
+        if not verify:
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        return cls(
+            base_url=kwargs.pop("base_url", None) or os.getenv("KEYCLOAK_ADMIN_URL", "https://localhost:8443"),
+            username=os.getenv("KC_ADMIN_USERNAME", "admin"),
+            password=os.getenv("KC_ADMIN_PASSWORD", "admin"),
+            verify=verify,
+            **kwargs,
+        )
+
+    def get_admin_token(self, force: bool = False) -> str:
+        """Obtiene (o reutiliza) el token de administración"""
+        with self._token_lock:
+            # Renovar con margen: el token de admin-cli dura 60 s por defecto
+            if not force and self.token and time.monotonic() < self._token_expires_at:
+                return self.token
+            response = self.session.post(
+                f"{self.base_url}/realms/master/protocol/openid-connect/token",
+                data={
+                    "client_id": "admin-cli",
+                    "grant_type": "password",
+                    "username": self.username,
+                    "password": self.password,
+                },
+                timeout=self.timeout,
+            )
+            if response.status_code != 200:
+                raise KeycloakAdminError(f"No se pudo obtener token de admin: HTTP {response.status_code}")
+            data = response.json()
+            self.token = data["access_token"]
+            self._token_expires_at = time.monotonic() + max(5, data.get("expires_in", 60) * 0.8)
+            return self.token
+
+    def request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        """
+        Llama a /admin/realms/... con el token de admin
+
+        Reintenta una vez con un token nuevo si recibe 401.
+
+        Raises:
+            KeycloakAdminError: Si la respuesta no es 2xx
+        """
+        url = f"{self.base_url}/admin/realms{path}"
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(2):
+            headers = {"Authorization": f"Bearer {self.get_admin_token(force=attempt > 0)}"}
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            if response.status_code != 401:
+                break
+        if not response.ok:
+            raise KeycloakAdminError(f"{method} {path}: HTTP {response.status_code} {response.text[:300]}")
+        return response
+
+    def get(self, path: str, **params: Any) -> Any:
+        response = self.request("GET", path, params=params or None)
+        return response.json() if response.content else None
+
+    def post(self, path: str, json: Any = None) -> Any:
+        response = self.request("POST", path, json=json)
+        return response.json() if response.content else None
+
+    def create(self, path: str, json: Any = None) -> Optional[str]:
+        """POST que crea un recurso; devuelve su id (cabecera Location) si lo hay"""
+        response = self.request("POST", path, json=json)
+        location = response.headers.get("Location")
+        return location.rstrip("/").rsplit("/", 1)[-1] if location else None
+
+    def put(self, path: str, json: Any = None) -> None:
+        self.request("PUT", path, json=json)
+
+    def delete(self, path: str) -> None:
+        self.request("DELETE", path)
+
+    def get_realms(self) -> list:
+        """Lista los realms (sin master)"""
+        return [realm for realm in self.get("") if realm.get("realm") != "master"]
+
+    def get_users(self, realm: str, first: int = 0, max_results: int = 100) -> list:
+        """Página de usuarios del realm con su representación completa"""
+        return self.get(f"/{realm}/users", first=first, max=max_results, briefRepresentation="false")
+
+    def count_users(self, realm: str) -> int:
+        return int(self.get(f"/{realm}/users/count"))
+
+    def get_paged(self, path: str, page_size: int = 500, **params: Any) -> list:
+        """Todas las páginas (first/max) de un listado"""
+        items: list = []
+        while True:
+            page = self.get(path, first=len(items), max=page_size, **params) or []
+            items.extend(page)
+            if len(page) < page_size:
+                return items
+
+    def get_realm_roles(self, realm: str) -> list:
+        return self.get_paged(f"/{realm}/roles", briefRepresentation="false")
+
+    def get_clients(self, realm: str) -> list:
+        """Clientes del realm, con sus protocol mappers"""
+        return self.get_paged(f"/{realm}/clients")
+
+    def get_client_roles(self, realm: str, client_uuid: str) -> list:
+        return self.get_paged(f"/{realm}/clients/{client_uuid}/roles", briefRepresentation="false")
+
+    def get_groups(self, realm: str) -> list:
+        """Grupos de primer nivel con atributos y roles"""
+        return self.get_paged(f"/{realm}/groups", briefRepresentation="false")
+
+    def get_group_children(self, realm: str, group_id: str) -> list:
+        # Desde Keycloak 23 los subgrupos se paginan aparte (por defecto de 10 en 10)
+        return self.get_paged(f"/{realm}/groups/{group_id}/children", briefRepresentation="false")
+
+    def partial_import(self, realm: str, representation: Dict[str, Any]) -> Dict[str, Any]:
+        """POST /admin/realms/{realm}/partialImport"""
+        return self.post(f"/{realm}/partialImport", json=representation)
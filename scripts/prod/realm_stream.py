@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Importación / exportación en streaming de usuarios de un realm
+==============================================================
+
+Para realms con cientos de miles de usuarios, donde importar el JSON del
+realm de una vez (--import-realm) o exportarlo con una sola llamada no es
+viable.
+
+import:
+    Lee el JSON del realm (o shards NDJSON generados por export) de forma
+    incremental, con memoria constante: solo el array "users" se decodifica,
+    elemento a elemento, y el resto del documento se salta sin construirlo.
+    Los usuarios se envían en lotes al endpoint partialImport con varios
+    workers en paralelo. Cada lote completado se anota en un fichero de
+    estado, así que --resume continúa tras un fallo sin repetir lotes.
+
+export:
+    Pagina /admin/realms/{realm}/users y escribe shards NDJSON
+    (users-00000.ndjson, ...) en paralelo, más realm.json con la
+    configuración del realm sin usuarios. export.json identifica la
+    exportación (run_id, realm, tamaño de página); el directorio de salida
+    tiene que estar vacío, salvo con --resume, que continúa esa misma
+    exportación conservando sus shards ya escritos.
+
+La Admin REST API no expone hashes de contraseñas ni mapeos de roles en la
+representación de usuario: un export hecho con esta herramienta no sustituye
+al backup de la base de datos (ver backup.sh).
+
+Uso:
+    ./realm_stream.py import --realm demo-app keycloak/realms/demo-realm.json
+    ./realm_stream.py import --realm demo-app --resume export-dir/users-*.ndjson
+    ./realm_stream.py export --realm demo-app --out backups/demo-app-users
+    ./realm_stream.py export --realm demo-app --out backups/demo-app-users --resume
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Set, TextIO
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from keycloak_admin import KeycloakAdmin, KeycloakAdminError  # noqa: E402
+
+# Colores (mismos que los scripts .sh)
+GREEN = "\033[0;32m"
+YELLOW = "\033[1;33m"
+RED = "\033[0;31m"
+NC = "\033[0m"
+
+_WHITESPACE = " \t\r\n"
+_STRUCTURAL = re.compile(r'["\\\[\]{}]')
+
+
+class JsonStream:
+    """
+    Lector incremental de un documento JSON
+
+    Mantiene en memoria solo un buffer de lectura y el valor que se está
+    decodificando en cada momento.
+    """
+
+    def __init__(self, fp: TextIO, chunk_size: int = 1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Siguiente carácter no blanco (sin consumirlo), o '' al final"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON inesperado: se esperaba '{char}' y se encontró '{found}'")
+        self.pos += 1
+
+    def decode_value(self) -> Any:
+        """Decodifica el siguiente valor completo"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Un número al final del buffer puede estar cortado: leer más y repetir
+            if end == len(self.buf) and not self.eof and not isinstance(value, (dict, list, str)):
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self) -> None:
+        """Salta el siguiente valor sin construirlo (memoria constante)"""
+        if self.peek() not in "[{":
+            self.decode_value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            match = _STRUCTURAL.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise ValueError("JSON truncado")
+                continue
+            char = match.group()
+            self.pos = match.end()
+            if char == "\\":
+                # Escape: saltar también el carácter escapado
+                if self.pos >= len(self.buf) and not self._fill():
+                    raise ValueError("JSON truncado")
+                self.pos += 1
+            elif char == '"':
+                in_string = not in_string
+            elif in_string:
+                continue
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def iter_json_array(fp: TextIO, key: str) -> Iterator[Any]:
+    """Itera los elementos del array `key` del objeto JSON raíz"""
+    stream = JsonStream(fp)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        name = stream.decode_value()
+        stream.expect(":")
+        if name == key:
+            stream.expect("[")
+            if stream.peek() == "]":
+                return
+            while True:
+                yield stream.decode_value()
+                if stream.peek() == ",":
+                    stream.pos += 1
+                    continue
+                stream.expect("]")
+                return
+        stream.skip_value()
+        if stream.peek() == ",":
+            stream.pos += 1
+            continue
+        stream.expect("}")
+        return
+
+
+def iter_users(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Usuarios de los ficheros indicados (JSON de realm o shards NDJSON), en orden"""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".ndjson"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from iter_json_array(f, "users")
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ImportState:
+    """
+    Registro de lotes importados (uno por línea), para poder reanudar
+
+    La primera línea identifica la importación (ficheros y tamaño de lote):
+    reanudar con otros parámetros produciría lotes distintos y se rechaza.
+    """
+
+    def __init__(self, path: str, signature: Dict[str, Any], resume: bool):
+        self.path = path
+        self.done: Set[int] = set()
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                header = json.loads(f.readline() or "{}")
+                if header != signature:
+                    raise SystemExit(f"{RED}❌ El estado {path} corresponde a otra importación{NC}")
+                self.done = {int(line) for line in f if line.strip()}
+            self._fp = open(path, "a")
+        else:
+            self._fp = open(path, "w")
+            self._fp.write(json.dumps(signature) + "\n")
+            self._fp.flush()
+
+    def mark_done(self, batch_number: int) -> None:
+        with self._lock:
+            self._fp.write(f"{batch_number}\n")
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self.done.add(batch_number)
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+def import_batch(admin: KeycloakAdmin, realm: str, users: List[Dict[str, Any]], policy: str, retries: int = 3) -> Dict[str, Any]:
+    """Envía un lote a partialImport con reintentos y backoff"""
+    for attempt in range(retries):
+        try:
+            return admin.partial_import(realm, {"ifResourceExists": policy, "users": users})
+        except (KeycloakAdminError, OSError) as e:
+            if attempt == retries - 1:
+                raise
+            print(f"{YELLOW}⚠️  Reintentando lote tras error: {e}{NC}", file=sys.stderr)
+            time.sleep(2 ** attempt)
+    raise AssertionError("unreachable")
+
+
+def run_import(args: argparse.Namespace) -> int:
+    paths = sorted(p for pattern in args.sources for p in glob.glob(pattern)) or args.sources
+    state_path = args.state_file or f"{paths[0]}.import-state"
+    signature = {"sources": [os.path.abspath(p) for p in paths], "batch_size": args.batch_size, "realm": args.realm}
+    state = ImportState(state_path, signature, args.resume)
+    admin = KeycloakAdmin.from_env(base_url=args.url, pool_size=args.workers)
+
+    print(f"{YELLOW}📦 Importando usuarios en '{args.realm}' (lotes de {args.batch_size}, {args.workers} workers)...{NC}")
+    if state.done:
+        print(f"{YELLOW}   Reanudando: {len(state.done)} lotes ya importados{NC}")
+
+    imported = skipped = 0
+    failed: List[int] = []
+    start = time.monotonic()
+    pending = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for number, batch in enumerate(iter_batches(iter_users(paths), args.batch_size)):
+            if number in state.done:
+                continue
+            # Como mucho 2 lotes por worker en memoria
+            while len(pending) >= args.workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    imported, skipped = _collect(future, pending.pop(future), state, failed, imported, skipped)
+            pending[pool.submit(import_batch, admin, args.realm, batch, args.if_exists)] = number
+        for future in list(pending):
+            imported, skipped = _collect(future, pending.pop(future), state, failed, imported, skipped)
+    state.close()
+
+    elapsed = time.monotonic() - start
+    print(f"{GREEN}✅ Añadidos: {imported}, omitidos: {skipped} en {elapsed:.1f}s{NC}")
+    if failed:
+        print(f"{RED}❌ {len(failed)} lotes fallidos; vuelve a ejecutar con --resume{NC}")
+        return 1
+    return 0
+
+
+def _collect(future, number: int, state: ImportState, failed: List[int], imported: int, skipped: int):
+    try:
+        result = future.result() or {}
+    except Exception as e:
+        print(f"{RED}❌ Lote {number} fallido: {e}{NC}", file=sys.stderr)
+        failed.append(number)
+        return imported, skipped
+    state.mark_done(number)
+    return imported + result.get("added", 0) + result.get("overwritten", 0), skipped + result.get("skipped", 0)
+
+
+def _write_shard(path: str, users: List[Dict[str, Any]]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for user in users:
+            f.write(json.dumps(user, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+    os.replace(tmp, path)
+
+
+EXPORT_MANIFEST = "export.json"
+
+
+def open_export(out_dir: str, realm: str, page_size: int, resume: bool) -> Dict[str, Any]:
+    """
+    Manifiesto de la exportación en out_dir, nuevo o (con resume) el existente
+
+    Sin resume el directorio tiene que estar vacío: los shards de otra
+    exportación son páginas de otro estado del realm y no deben mezclarse.
+    Con resume el manifiesto tiene que ser del mismo realm y tamaño de página.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, EXPORT_MANIFEST)
+    if resume:
+        if not os.path.exists(manifest_path):
+            raise SystemExit(f"{RED}❌ {out_dir} no tiene {EXPORT_MANIFEST}: no hay exportación que reanudar{NC}")
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("realm") != realm or manifest.get("page_size") != page_size:
+            raise SystemExit(
+                f"{RED}❌ {out_dir} es una exportación de '{manifest.get('realm')}' con páginas de "
+                f"{manifest.get('page_size')}; reanúdala con los mismos parámetros{NC}"
+            )
+        return manifest
+    if os.listdir(out_dir):
+        raise SystemExit(f"{RED}❌ {out_dir} no está vacío; usa otro directorio o --resume para continuar esa exportación{NC}")
+    manifest = {"run_id": uuid.uuid4().hex, "realm": realm, "page_size": page_size, "started_at": time.time()}
+    _write_manifest(out_dir, manifest)
+    return manifest
+
+
+def _write_manifest(out_dir: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(out_dir, EXPORT_MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_shard(admin: KeycloakAdmin, realm: str, number: int, page_size: int, out_dir: str) -> int:
+    """
+    Exporta una página de usuarios a su shard; devuelve cuántos usuarios tenía
+
+    Un shard ya presente se conserva: open_export garantiza que es de esta
+    misma exportación.
+    """
+    path = os.path.join(out_dir, f"users-{number:05d}.ndjson")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return sum(1 for _ in f)
+    users = admin.get_users(realm, first=number * page_size, max_results=page_size)
+    if users:
+        _write_shard(path, users)
+    return len(users)
+
+
+def run_export(args: argparse.Namespace) -> int:
+    manifest = open_export(args.out, args.realm, args.page_size, args.resume)
+    admin = KeycloakAdmin.from_env(base_url=args.url, pool_size=args.workers)
+
+    realm_repr = admin.get(f"/{args.realm}")
+    realm_repr.pop("users", None)
+    with open(os.path.join(args.out, "realm.json"), "w", encoding="utf-8") as f:
+        json.dump(realm_repr, f, indent=2, ensure_ascii=False)
+
+    total = admin.count_users(args.realm)
+    shards = (total + args.page_size - 1) // args.page_size
+    print(f"{YELLOW}📦 Exportando {total} usuarios de '{args.realm}' en {shards} shards...{NC}")
+    if args.resume:
+        print(f"{YELLOW}   Reanudando la exportación {manifest['run_id']}{NC}")
+
+    start = time.monotonic()
+    exported = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(export_shard, admin, args.realm, n, args.page_size, args.out) for n in range(shards)]
+        for future in futures:
+            exported += future.result()
+
+    # Usuarios creados durante la exportación: seguir paginando hasta una página incompleta
+    number = shards
+    while True:
+        count = export_shard(admin, args.realm, number, args.page_size, args.out)
+        exported += count
+        if count < args.page_size:
+            break
+        number += 1
+
+    shard_files = glob.glob(os.path.join(args.out, "users-*.ndjson"))
+    manifest.update(completed_at=time.time(), users=exported, shards=len(shard_files))
+    _write_manifest(args.out, manifest)
+    print(f"{GREEN}✅ {exported} usuarios exportados en {time.monotonic() - start:.1f}s → {args.out}{NC}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL base de Keycloak (por defecto KEYCLOAK_ADMIN_URL o https://localhost:8443)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Importar usuarios por lotes vía partialImport")
+    imp.add_argument("sources", nargs="+", help="JSON de realm o shards .ndjson (admite globs)")
+    imp.add_argument("--realm", required=True)
+    imp.add_argument("--batch-size", type=int, default=500)
+    imp.add_argument("--workers", type=int, default=4)
+    imp.add_argument("--if-exists", choices=["SKIP", "OVERWRITE", "FAIL"], default="SKIP")
+    imp.add_argument("--resume", action="store_true", help="Continuar una importación interrumpida")
+    imp.add_argument("--state-file", help="Fichero de estado (por defecto <primer fichero>.import-state)")
+
+    exp = sub.add_parser("export", help="Exportar usuarios a shards NDJSON")
+    exp.add_argument("--realm", required=True)
+    exp.add_argument("--out", required=True, help="Directorio de salida")
+    exp.add_argument("--page-size", type=int, default=1000)
+    exp.add_argument("--workers", type=int, default=4)
+    exp.add_argument("--resume", action="store_true", help="Continuar una exportación interrumpida en --out")
+
+    args = parser.parse_args()
+    return run_import(args) if args.command == "import" else run_export(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+Sincronización incremental de la configuración de un realm
+==========================================================
+
+Aplica un JSON de realm (p.ej. keycloak/realms/demo-realm.json) sobre un
+Keycloak en marcha sin reimportar el realm completo:
+
+1. Lee en paralelo el estado actual vía Admin REST API: ajustes del realm,
+   roles de realm, clientes (con sus protocol mappers), roles de cliente y
+   el árbol de grupos
+2. Compara estructuralmente ese estado con el JSON. Solo cuentan los campos
+   que declara el JSON: lo que Keycloak rellena por defecto no es un cambio
+3. Aplica el mínimo de llamadas create/update/delete, en fases ordenadas
+   por dependencias (roles y clientes, luego sus mappers y roles, luego
+   grupos por nivel y sus roles) y en paralelo dentro de cada fase
+
+Reglas:
+
+- Las listas de escalares (redirectUris, webOrigins...) se comparan sin
+  orden y los valores enmascarados ("**********") se dan por iguales
+- Sin --prune nunca se borra nada. Con --prune se borran los recursos que
+  no están en el JSON, solo en las secciones que el JSON declara (si no hay
+  "groups", los grupos no se tocan) y nunca los clientes y roles que crea
+  Keycloak (admin-cli, realm-management, default-roles-<realm>...)
+- Los realmRoles declarados en un grupo son la lista completa de sus roles
+- Un recurso renombrado es un borrado más una creación
+- Usuarios, client scopes, flujos, roles compuestos y roles de cliente de
+  los grupos no se sincronizan (usuarios: realm_stream.py)
+
+plan muestra los cambios sin aplicarlos (dry-run); apply los aplica.
+
+Uso:
+    ./realm_sync.py plan keycloak/realms/demo-realm.json
+    ./realm_sync.py apply keycloak/realms/demo-realm.json [--prune] [--jobs 8]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from keycloak_admin import KeycloakAdmin, KeycloakAdminError  # noqa: E402
+
+# Colores (mismos que los scripts .sh)
+GREEN = "\033[0;32m"
+YELLOW = "\033[1;33m"
+RED = "\033[0;31m"
+NC = "\033[0m"
+
+MASKED = "**********"
+
+# Campos del realm que no son ajustes o que no gestiona esta herramienta
+REALM_SKIP = frozenset({
+    "id", "realm", "users", "roles", "clients", "groups", "clientScopes", "components",
+    "identityProviders", "identityProviderMappers", "authenticationFlows", "authenticatorConfig",
+    "requiredActions", "scopeMappings", "clientScopeMappings", "federatedUsers", "defaultRole",
+    "protocolMappers", "organizations",
+})
+# Campos de cada recurso que asigna Keycloak
+RESOURCE_SKIP = frozenset({"id", "containerId", "clientRole", "subGroups", "subGroupCount", "path", "parentId", "access"})
+
+PROTECTED_CLIENTS = frozenset({
+    "account", "account-console", "admin-cli", "broker", "realm-management", "security-admin-console",
+})
+PROTECTED_ROLES = frozenset({"offline_access", "uma_authorization"})
+
+# Fases de apply: cada una depende de las anteriores
+PHASE_REALM = 0
+PHASE_ROLES_CLIENTS = 1
+PHASE_CLIENT_CHILDREN = 2
+PHASE_GROUPS = 10  # + profundidad del grupo
+PHASE_GROUP_ROLES = 100
+PHASE_DELETE = 200
+
+
+class SyncError(Exception):
+    """El JSON no se puede sincronizar con el realm"""
+
+
+# ============================================
+# COMPARACIÓN
+# ============================================
+
+def diff_fields(desired: Any, current: Any, prefix: str = "") -> List[str]:
+    """
+    Campos de desired que difieren de current (rutas con puntos)
+
+    Solo se miran las claves de desired. Un campo ausente en current equivale
+    a uno vacío en desired (Keycloak omite listas y mapas vacíos).
+    """
+    if isinstance(desired, dict):
+        if current is None:
+            current = {}
+        if not isinstance(current, dict):
+            return [prefix or "."]
+        changed = []
+        for key, value in desired.items():
+            if key in RESOURCE_SKIP and not prefix:
+                continue
+            changed.extend(diff_fields(value, current.get(key), f"{prefix}{key}" if not prefix else f"{prefix}.{key}"))
+        return changed
+    if isinstance(desired, list):
+        if current is None:
+            current = []
+        if not isinstance(current, list):
+            return [prefix]
+        if all(not isinstance(item, (dict, list)) for item in desired + current):
+            equal = sorted(map(json.dumps, desired)) == sorted(map(json.dumps, current))
+        else:
+            equal = len(desired) == len(current) and not any(
+                diff_fields(a, b) for a, b in zip(desired, current)
+            )
+        return [] if equal else [prefix]
+    if current == MASKED:
+        return []
+    if current is None and desired in ("", None):
+        return []
+    return [] if desired == current else [prefix]
+
+
+def merge(current: Dict[str, Any], desired: Dict[str, Any]) -> Dict[str, Any]:
+    """Representación actual con los campos de desired (mapas anidados fusionados)"""
+    merged = dict(current)
+    for key, value in desired.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def without(representation: Dict[str, Any], *keys: str) -> Dict[str, Any]:
+    return {key: value for key, value in representation.items() if key not in keys}
+
+
+# ============================================
+# ESTADO
+# ============================================
+
+@dataclass
+class RealmState:
+    """Recursos del realm indexados por su nombre natural"""
+    settings: Dict[str, Any] = field(default_factory=dict)
+    roles: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    clients: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # clientId -> nombre del rol -> rol
+    client_roles: Dict[str, Dict[str, Dict[str, Any]]] = field(default_factory=dict)
+    # path ("/padre/hijo") -> grupo sin subGroups
+    groups: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+def group_path(parent: str, name: str) -> str:
+    return f"{parent}/{name}"
+
+
+def _flatten_groups(groups: List[Dict[str, Any]], parent: str, out: Dict[str, Dict[str, Any]]) -> None:
+    for group in groups:
+        path = group_path(parent, group["name"])
+        if path in out:
+            raise SyncError(f"Grupo duplicado en el JSON: {path}")
+        out[path] = without(group, "subGroups")
+        _flatten_groups(group.get("subGroups") or [], path, out)
+
+
+def desired_state(document: Dict[str, Any]) -> RealmState:
+    """Estado deseado a partir del JSON del realm"""
+    state = RealmState(settings={key: value for key, value in document.items() if key not in REALM_SKIP})
+    roles = document.get("roles") or {}
+    state.roles = {role["name"]: role for role in roles.get("realm") or []}
+    state.clients = {client["clientId"]: client for client in document.get("clients") or []}
+    state.client_roles = {
+        client_id: {role["name"]: role for role in client_roles}
+        for client_id, client_roles in (roles.get("client") or {}).items()
+    }
+    for client_id in state.client_roles:
+        if client_id not in state.clients and client_id not in PROTECTED_CLIENTS:
+            raise SyncError(f"roles.client.{client_id}: el cliente no está en el JSON")
+    _flatten_groups(document.get("groups") or [], "", state.groups)
+    return state
+
+
+def fetch_state(admin: KeycloakAdmin, realm: str, desired: RealmState, jobs: int, groups: bool = True) -> RealmState:
+    """
+    Estado actual del realm, con todas las lecturas en paralelo
+
+    Los roles de cliente solo se leen de los clientes que declara el JSON, y
+    el árbol de grupos solo si groups.
+    """
+    state = RealmState()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        settings = pool.submit(admin.get, f"/{realm}")
+        roles = pool.submit(admin.get_realm_roles, realm)
+        clients = pool.submit(admin.get_clients, realm)
+
+        state.clients = {client["clientId"]: client for client in clients.result()}
+        client_roles = {
+            client_id: pool.submit(admin.get_client_roles, realm, state.clients[client_id]["id"])
+            for client_id in desired.client_roles
+            if client_id in state.clients
+        }
+
+        # Árbol de grupos: los hijos de cada nivel se piden en cuanto se conoce el padre
+        pending: Dict[Any, str] = {pool.submit(admin.get_groups, realm): ""} if groups else {}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                parent = pending.pop(future)
+                for group in future.result():
+                    path = group_path(parent, group["name"])
+                    state.groups[path] = without(group, "subGroups")
+                    if group.get("subGroupCount", 1) > 0:
+                        pending[pool.submit(admin.get_group_children, realm, group["id"])] = path
+
+        state.settings = settings.result()
+        state.roles = {role["name"]: role for role in roles.result()}
+        state.client_roles = {
+            client_id: {role["name"]: role for role in future.result()}
+            for client_id, future in client_roles.items()
+        }
+    return state
+
+
+# ============================================
+# PLAN
+# ============================================
+
+@dataclass
+class Change:
+    phase: int
+    action: str  # create | update | delete
+    kind: str
+    name: str
+    apply: Callable[[], None]
+    fields: List[str] = field(default_factory=list)
+
+    def describe(self) -> str:
+        symbol, color = {"create": ("+", GREEN), "update": ("~", YELLOW), "delete": ("-", RED)}[self.action]
+        detail = f": {', '.join(self.fields)}" if self.fields else ""
+        return f"{color}{symbol}{NC} {self.kind:<12} {self.name}{detail}"
+
+
+class Planner:
+    """Calcula los cambios; cada Change sabe aplicarse"""
+
+    def __init__(self, admin: KeycloakAdmin, realm: str, desired: RealmState, current: RealmState, document: Dict[str, Any], prune: bool):
+        self.admin = admin
+        self.realm = realm
+        self.desired = desired
+        self.current = current
+        self.document = document
+        self.prune = prune
+        self.changes: List[Change] = []
+        # Ids de clientes y grupos, incluidos los que se crean durante apply
+        self._ids_lock = threading.Lock()
+        self.client_ids = {client_id: client["id"] for client_id, client in current.clients.items()}
+        self.group_ids = {path: group["id"] for path, group in current.groups.items()}
+        self._role_cache: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, phase: int, action: str, kind: str, name: str, apply: Callable[[], None], fields: Optional[List[str]] = None) -> None:
+        self.changes.append(Change(phase, action, kind, name, apply, fields or []))
+
+    def plan(self) -> List[Change]:
+        self._plan_settings()
+        self._plan_roles()
+        self._plan_clients()
+        if "roles" in self.document:
+            self._plan_client_roles()
+        if "groups" in self.document:
+            self._plan_groups()
+        return sorted(self.changes, key=lambda change: change.phase)
+
+    # --- ids resueltos en apply ---
+
+    def client_uuid(self, client_id: str) -> str:
+        with self._ids_lock:
+            return self.client_ids[client_id]
+
+    def group_id(self, path: str) -> str:
+        with self._ids_lock:
+            return self.group_ids[path]
+
+    def realm_role(self, name: str) -> Dict[str, Any]:
+        """Rol de realm con su id (los creados en este apply se leen de Keycloak)"""
+        with self._ids_lock:
+            role = self._role_cache.get(name) or self.current.roles.get(name)
+        if role is None:
+            role = self.admin.get(f"/{self.realm}/roles/{quote(name, safe='')}")
+            with self._ids_lock:
+                self._role_cache[name] = role
+        return {"id": role["id"], "name": role["name"]}
+
+    # --- secciones ---
+
+    def _plan_settings(self) -> None:
+        changed = diff_fields(self.desired.settings, self.current.settings)
+        if changed:
+            body = merge(without(self.current.settings, *REALM_SKIP - {"id", "realm"}), self.desired.settings)
+            self.add(PHASE_REALM, "update", "realm", self.realm, lambda: self.admin.put(f"/{self.realm}", body), changed)
+
+    def _plan_roles(self) -> None:
+        base = f"/{self.realm}/roles"
+        for name, role in self.desired.roles.items():
+            body = without(role, "composites")
+            current = self.current.roles.get(name)
+            if current is None:
+                self.add(PHASE_ROLES_CLIENTS, "create", "role", name, lambda body=body: self.admin.create(base, body))
+            elif (changed := diff_fields(body, current)):
+                merged = merge(without(current, "composites"), body)
+                self.add(PHASE_ROLES_CLIENTS, "update", "role", name,
+                         lambda name=name, merged=merged: self.admin.put(f"{base}/{quote(name, safe='')}", merged), changed)
+        if self.prune and "roles" in self.document:
+            protected = PROTECTED_ROLES | {f"default-roles-{self.realm}"}
+            for name in sorted(self.current.roles.keys() - self.desired.roles.keys() - protected):
+                self.add(PHASE_DELETE, "delete", "role", name,
+                         lambda name=name: self.admin.delete(f"{base}/{quote(name, safe='')}"))
+
+    def _plan_clients(self) -> None:
+        base = f"/{self.realm}/clients"
+        for client_id, client in self.desired.clients.items():
+            current = self.current.clients.get(client_id)
+            if current is None:
+                mappers = [f"+mapper {mapper['name']}" for mapper in client.get("protocolMappers") or []]
+                self.add(PHASE_ROLES_CLIENTS, "create", "client", client_id,
+                         lambda client_id=client_id, client=client: self._create_client(client_id, client), mappers)
+                continue
+            body = without(client, "protocolMappers")
+            if (changed := diff_fields(body, current)):
+                merged = merge(without(current, "protocolMappers"), body)
+                self.add(PHASE_ROLES_CLIENTS, "update", "client", client_id,
+                         lambda merged=merged, uuid=current["id"]: self.admin.put(f"{base}/{uuid}", merged), changed)
+            if "protocolMappers" in client:
+                self._plan_mappers(client_id, client["protocolMappers"], current.get("protocolMappers") or [])
+        if self.prune and "clients" in self.document:
+            for client_id in sorted(self.current.clients.keys() - self.desired.clients.keys() - PROTECTED_CLIENTS):
+                uuid = self.current.clients[client_id]["id"]
+                self.add(PHASE_DELETE, "delete", "client", client_id, lambda uuid=uuid: self.admin.delete(f"{base}/{uuid}"))
+
+    def _create_client(self, client_id: str, client: Dict[str, Any]) -> None:
+        # Los protocol mappers se crean con el cliente, en la misma llamada
+        uuid = self.admin.create(f"/{self.realm}/clients", client)
+        if uuid is None:
+            uuid = self.admin.get(f"/{self.realm}/clients", clientId=client_id)[0]["id"]
+        with self._ids_lock:
+            self.client_ids[client_id] = uuid
+
+    def _plan_mappers(self, client_id: str, desired: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> None:
+        current_by_name = {mapper["name"]: mapper for mapper in current}
+        desired_by_name = {mapper["name"]: mapper for mapper in desired}
+        base = f"/{self.realm}/clients/{{uuid}}/protocol-mappers/models"
+
+        def path(suffix: str = "") -> str:
+            return base.format(uuid=self.client_uuid(client_id)) + suffix
+
+        for name, mapper in desired_by_name.items():
+            existing = current_by_name.get(name)
+            if existing is None:
+                self.add(PHASE_CLIENT_CHILDREN, "create", "mapper", f"{client_id}/{name}",
+                         lambda mapper=mapper: self.admin.create(path(), without(mapper, "id")))
+            elif (changed := diff_fields(mapper, existing)):
+                merged = merge(existing, without(mapper, "id"))
+                self.add(PHASE_CLIENT_CHILDREN, "update", "mapper", f"{client_id}/{name}",
+                         lambda merged=merged: self.admin.put(path(f"/{merged['id']}"), merged), changed)
+        if self.prune:
+            for name in sorted(current_by_name.keys() - desired_by_name.keys()):
+                mapper_id = current_by_name[name]["id"]
+                self.add(PHASE_DELETE, "delete", "mapper", f"{client_id}/{name}",
+                         lambda mapper_id=mapper_id: self.admin.delete(path(f"/{mapper_id}")))
+
+    def _plan_client_roles(self) -> None:
+        for client_id, roles in self.desired.client_roles.items():
+            current = self.current.client_roles.get(client_id, {})
+
+            def path(suffix: str = "", client_id: str = client_id) -> str:
+                return f"/{self.realm}/clients/{self.client_uuid(client_id)}/roles{suffix}"
+
+            for name, role in roles.items():
+                body = without(role, "composites")
+                existing = current.get(name)
+                label = f"{client_id}/{name}"
+                if existing is None:
+                    self.add(PHASE_CLIENT_CHILDREN, "create", "client-role", label,
+                             lambda body=body, path=path: self.admin.create(path(), body))
+                elif (changed := diff_fields(body, existing)):
+                    merged = merge(without(existing, "composites"), body)
+                    self.add(PHASE_CLIENT_CHILDREN, "update", "client-role", label,
+                             lambda name=name, merged=merged, path=path: self.admin.put(path(f"/{quote(name, safe='')}"), merged),
+                             changed)
+            if self.prune:
+                for name in sorted(current.keys() - roles.keys()):
+                    self.add(PHASE_DELETE, "delete", "client-role", f"{client_id}/{name}",
+                             lambda name=name, path=path: self.admin.delete(path(f"/{quote(name, safe='')}")))
+
+    def _plan_groups(self) -> None:
+        for path, group in self.desired.groups.items():
+            parent, _, name = path.rpartition("/")
+            depth = path.count("/")
+            body = without(group, "realmRoles", "clientRoles")
+            existing = self.current.groups.get(path)
+            if existing is None:
+                self.add(PHASE_GROUPS + depth, "create", "group", path,
+                         lambda path=path, parent=parent, body=body: self._create_group(path, parent, body))
+            elif (changed := diff_fields(body, existing)):
+                merged = merge(without(existing, "realmRoles", "clientRoles", "subGroups"), body)
+                self.add(PHASE_GROUPS + depth, "update", "group", path,
+                         lambda merged=merged: self.admin.put(f"/{self.realm}/groups/{merged['id']}", merged), changed)
+            if "realmRoles" in group:
+                self._plan_group_roles(path, set(group["realmRoles"]), set((existing or {}).get("realmRoles") or []))
+        if self.prune:
+            removed = self.current.groups.keys() - self.desired.groups.keys()
+            for path in sorted(removed):
+                # Borrar un grupo borra sus subgrupos
+                if path.rpartition("/")[0] in removed:
+                    continue
+                group_id = self.current.groups[path]["id"]
+                self.add(PHASE_DELETE, "delete", "group", path,
+                         lambda group_id=group_id: self.admin.delete(f"/{self.realm}/groups/{group_id}"))
+
+    def _create_group(self, path: str, parent: str, body: Dict[str, Any]) -> None:
+        if parent:
+            group_id = self.admin.create(f"/{self.realm}/groups/{self.group_id(parent)}/children", body)
+        else:
+            group_id = self.admin.create(f"/{self.realm}/groups", body)
+        with self._ids_lock:
+            self.group_ids[path] = group_id
+
+    def _plan_group_roles(self, path: str, desired: set, current: set) -> None:
+        def mappings() -> str:
+            return f"/{self.realm}/groups/{self.group_id(path)}/role-mappings/realm"
+
+        if desired - current:
+            added = sorted(desired - current)
+            self.add(PHASE_GROUP_ROLES, "update", "group-roles", path,
+                     lambda: self.admin.post(mappings(), [self.realm_role(name) for name in added]),
+                     [f"+{name}" for name in added])
+        if current - desired:
+            removed = sorted(current - desired)
+            self.add(PHASE_GROUP_ROLES, "update", "group-roles", path,
+                     lambda: self.admin.request("DELETE", mappings(), json=[self.realm_role(name) for name in removed]),
+                     [f"-{name}" for name in removed])
+
+
+# ============================================
+# APPLY
+# ============================================
+
+def apply_changes(changes: List[Change], jobs: int) -> List[Tuple[Change, Exception]]:
+    """
+    Aplica los cambios fase a fase, en paralelo dentro de cada fase
+
+    Si una fase falla no se ejecutan las siguientes (dependen de ella).
+    """
+    phases: Dict[int, List[Change]] = {}
+    for change in changes:
+        phases.setdefault(change.phase, []).append(change)
+
+    failures: List[Tuple[Change, Exception]] = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for phase in sorted(phases):
+            futures = [(change, pool.submit(change.apply)) for change in phases[phase]]
+            for change, future in futures:
+                try:
+                    future.result()
+                    print(f"   {change.describe()}")
+                except (KeycloakAdminError, OSError, KeyError) as e:
+                    print(f"   {change.describe()} {RED}✗ {e}{NC}")
+                    failures.append((change, e))
+            if failures:
+                break
+    return failures
+
+
+def load_document(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise SyncError(f"No se pudo leer {path}: {e}") from e
+
+
+def run(args: argparse.Namespace) -> int:
+    document = load_document(args.realm_file)
+    realm = args.realm or document.get("realm")
+    if not realm:
+        raise SyncError("El JSON no indica el realm; usa --realm")
+    desired = desired_state(document)
+    admin = KeycloakAdmin.from_env(base_url=args.url, pool_size=args.jobs)
+
+    start = time.monotonic()
+    try:
+        current = fetch_state(admin, realm, desired, args.jobs, groups="groups" in document)
+    except KeycloakAdminError as e:
+        raise SyncError(f"No se pudo leer el realm '{realm}' (¿existe? para crearlo usa --import-realm): {e}") from e
+    fetched = time.monotonic() - start
+
+    changes = Planner(admin, realm, desired, current, document, args.prune).plan()
+    print(f"{YELLOW}📋 Realm '{realm}': {len(changes)} cambios (estado leído en {fetched:.2f}s){NC}")
+    if not changes:
+        print(f"{GREEN}✅ Sin cambios{NC}")
+        return 0
+
+    if args.command == "plan":
+        for change in changes:
+            print(f"   {change.describe()}")
+        if not args.prune:
+            print("   (sin --prune no se borra nada)")
+        return 0
+
+    start = time.monotonic()
+    failures = apply_changes(changes, args.jobs)
+    elapsed = time.monotonic() - start
+    if failures:
+        print(f"{RED}❌ {len(failures)} cambios fallidos; las fases siguientes no se aplicaron. "
+              f"Vuelve a ejecutar apply tras corregir el error{NC}")
+        return 1
+    print(f"{GREEN}✅ {len(changes)} cambios aplicados en {elapsed:.2f}s{NC}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL base de Keycloak (por defecto KEYCLOAK_ADMIN_URL o https://localhost:8443)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("plan", "Mostrar los cambios sin aplicarlos"), ("apply", "Aplicar los cambios")):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("realm_file", help="JSON del realm (estado deseado)")
+        command.add_argument("--realm", help="Realm destino (por defecto el campo realm del JSON)")
+        command.add_argument("--prune", action="store_true", help="Borrar lo que no está en el JSON")
+        command.add_argument("--jobs", type=int, default=8, help="Llamadas a la Admin API en paralelo")
+
+    args = parser.parse_args()
+    try:
+        return run(args)
+    except SyncError as e:
+        print(f"{RED}❌ {e}{NC}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -55,11 +55,13 @@ if [ -z "$TIMESTAMP" ]; then
     echo "  -y, --yes    Omitir confirmación"
     echo ""
     echo "Backups disponibles:"
-    ls -1 "${PROJECT_ROOT}/backups"/*.sql.gz 2>/dev/null | sed 's/.*keycloak_db_/  /' | sed 's/.sql.gz//' || echo "  No hay backups disponibles"
+    python3 "${SCRIPT_DIR}/backup.py" --backup-dir "${PROJECT_ROOT}/backups" list | sed 's/^/  /'
+    ls -1 "${PROJECT_ROOT}/backups"/*.sql.gz 2>/dev/null | sed 's/.*keycloak_db_/  /' | sed 's/.sql.gz/  (formato anterior)/'
     exit 1
 fi
 
 BACKUP_DIR="${PROJECT_ROOT}/backups"
+SNAPSHOT_MANIFEST="${BACKUP_DIR}/snapshots/${TIMESTAMP}/manifest.json"
 DB_BACKUP_FILE="${BACKUP_DIR}/keycloak_db_${TIMESTAMP}.sql.gz"
 REALM_BACKUP_DIR="${BACKUP_DIR}/realms_${TIMESTAMP}"
 
@@ -67,8 +69,8 @@ echo -e "${YELLOW}🔄 Restaurando Keycloak desde backup: $TIMESTAMP${NC}"
 echo ""
 
 # Verificar que existan los archivos
-if [ ! -f "$DB_BACKUP_FILE" ]; then
-    echo -e "${RED}❌ No se encuentra el archivo de backup: $DB_BACKUP_FILE${NC}"
+if [ ! -f "$SNAPSHOT_MANIFEST" ] && [ ! -f "$DB_BACKUP_FILE" ]; then
+    echo -e "${RED}❌ No se encuentra el backup: $TIMESTAMP${NC}"
     exit 1
 fi
 
@@ -83,6 +85,22 @@ if [ "$SKIP_CONFIRMATION" = false ]; then
     fi
 fi
 
+# 0. Reconstruir los ficheros del backup (antes de parar nada: si un chunk
+#    está corrupto, Keycloak sigue en marcha con los datos actuales)
+RESTORE_TMP=$(mktemp -d)
+if [ -f "$SNAPSHOT_MANIFEST" ]; then
+    echo -e "${YELLOW}📦 Reconstruyendo backup (verificando checksums)...${NC}"
+    if ! python3 "${SCRIPT_DIR}/backup.py" --backup-dir "$BACKUP_DIR" restore "$TIMESTAMP" --output-dir "$RESTORE_TMP"; then
+        echo -e "${RED}❌ El backup no se pudo reconstruir, no se modifica nada${NC}"
+        rm -rf "$RESTORE_TMP"
+        exit 1
+    fi
+    REALM_BACKUP_DIR="${RESTORE_TMP}/realms"
+else
+    # Formato anterior: .sql.gz + realms_<timestamp>/
+    gunzip -c "$DB_BACKUP_FILE" > "${RESTORE_TMP}/keycloak_db.sql"
+fi
+
 # 1. Detener Keycloak
 echo -e "${YELLOW}⏸️  Deteniendo Keycloak...${NC}"
 docker stop $KEYCLOAK_CONTAINER > /dev/null 2>&1
@@ -90,9 +108,6 @@ docker stop $KEYCLOAK_CONTAINER > /dev/null 2>&1
 # 2. Restaurar base de datos
 echo -e "${YELLOW}📦 Restaurando base de datos PostgreSQL...${NC}"
 
-# Descomprimir backup
-gunzip -c "$DB_BACKUP_FILE" > /tmp/keycloak_restore.sql
-
 # Terminar todas las conexiones activas
 echo -e "${YELLOW}   Cerrando conexiones activas...${NC}"
 docker exec $POSTGRES_CONTAINER psql -U keycloak -d postgres -c "SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = 'keycloak' AND pid <> pg_backend_pid();" > /dev/null 2>&1 || true
@@ -102,10 +117,7 @@ docker exec $POSTGRES_CONTAINER psql -U keycloak -d postgres -c "DROP DATABASE I
 docker exec $POSTGRES_CONTAINER psql -U keycloak -d postgres -c "CREATE DATABASE keycloak;"
 
 # Restaurar datos
-docker exec -i $POSTGRES_CONTAINER psql -U keycloak -d keycloak < /tmp/keycloak_restore.sql
-
-# Limpiar archivo temporal
-rm /tmp/keycloak_restore.sql
+docker exec -i $POSTGRES_CONTAINER psql -U keycloak -d keycloak < "${RESTORE_TMP}/keycloak_db.sql"
 
 echo -e "${GREEN}✅ Base de datos restaurada${NC}"
 
@@ -122,6 +134,9 @@ else
     echo -e "${YELLOW}⚠️  No se encontraron backups de realms${NC}"
 fi
 
+# Limpiar ficheros temporales
+rm -rf "$RESTORE_TMP"
+
 # 4. Reiniciar Keycloak
 echo -e "${YELLOW}🚀 Reiniciando Keycloak...${NC}"
 docker start $KEYCLOAK_CONTAINER
@@ -0,0 +1,139 @@
+"""
+Ciclo completo de backup.py sobre un directorio local (--source-dir)
+====================================================================
+
+create, verify, restore y prune a través de la CLI, igual que los usan
+backup.sh, restore.sh y disaster_recovery.sh. No hace falta Keycloak ni
+PostgreSQL.
+
+Uso (desde scripts/prod/):
+    python -m pytest -q tests
+"""
+
+import glob
+import os
+import random
+import subprocess
+import sys
+import time
+
+import pytest
+
+BACKUP_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backup.py")
+
+
+def backup(backup_dir, *args):
+    return subprocess.run(
+        [sys.executable, BACKUP_PY, "--backup-dir", str(backup_dir), *map(str, args)],
+        capture_output=True,
+        text=True,
+    )
+
+
+def read_tree(root):
+    files = {}
+    for path in glob.glob(os.path.join(root, "**", "*"), recursive=True):
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root)] = f.read()
+    return files
+
+
+def chunk_files(backup_dir):
+    return glob.glob(os.path.join(backup_dir, "chunks", "*", "*"))
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Un dump SQL de varios chunks y un par de realms"""
+    rng = random.Random(0)
+    root = tmp_path / "source"
+    (root / "realms").mkdir(parents=True)
+    rows = "".join(
+        f"INSERT INTO user_entity VALUES ('{i}', 'user-{i}', '{rng.getrandbits(128):032x}');\n"
+        for i in range(40000)
+    )
+    (root / "keycloak_db.sql").write_text(rows)
+    (root / "realms" / "demo-app-realm.json").write_text('{"realm": "demo-app", "enabled": true}')
+    (root / "realms" / "master-realm.json").write_text('{"realm": "master", "enabled": true}')
+    return root
+
+
+@pytest.fixture
+def backup_dir(tmp_path):
+    return tmp_path / "backups"
+
+
+def test_create_verify_restore_roundtrip(source, backup_dir, tmp_path):
+    result = backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260101_000000")
+    assert result.returncode == 0, result.stdout
+    assert len(chunk_files(backup_dir)) > 2
+
+    assert backup(backup_dir, "verify").returncode == 0
+    assert backup(backup_dir, "latest").stdout.strip() == "20260101_000000"
+
+    output = tmp_path / "restored"
+    result = backup(backup_dir, "restore", "20260101_000000", "--output-dir", output)
+    assert result.returncode == 0, result.stdout
+    assert read_tree(output) == read_tree(source)
+
+
+def test_second_backup_deduplicates(source, backup_dir):
+    assert backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260101_000000").returncode == 0
+    before = len(chunk_files(backup_dir))
+
+    with open(source / "keycloak_db.sql", "a") as f:
+        f.write("INSERT INTO user_entity VALUES ('new', 'user-new', '0');\n")
+    assert backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260102_000000").returncode == 0
+
+    # Solo cambia el final del dump: el resto de chunks se reutiliza
+    assert len(chunk_files(backup_dir)) - before < before / 2
+
+
+def test_corrupt_chunk_fails_verify_and_restore(source, backup_dir, tmp_path):
+    assert backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260101_000000").returncode == 0
+    victim = sorted(chunk_files(backup_dir))[0]
+    with open(victim, "r+b") as f:
+        f.seek(4)
+        f.write(b"\x00" * 8)
+
+    result = backup(backup_dir, "verify")
+    assert result.returncode == 1
+    assert "CORRUPTO" in result.stdout
+
+    output = tmp_path / "restored"
+    assert backup(backup_dir, "restore", "20260101_000000", "--output-dir", output).returncode == 1
+
+
+def test_prune_removes_old_snapshots_and_orphan_chunks(source, backup_dir, tmp_path):
+    assert backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260101_000000").returncode == 0
+    (source / "keycloak_db.sql").write_text("SELECT 1;\n")
+    assert backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260102_000000").returncode == 0
+
+    old_manifest = backup_dir / "snapshots" / "20260101_000000" / "manifest.json"
+    ten_days_ago = time.time() - 10 * 86400
+    os.utime(old_manifest, (ten_days_ago, ten_days_ago))
+    before = len(chunk_files(backup_dir))
+
+    result = backup(backup_dir, "prune", "--keep-days", 7)
+    assert result.returncode == 0, result.stdout
+    assert backup(backup_dir, "list").stdout.split()[0] == "20260102_000000"
+    assert not old_manifest.exists()
+    assert len(chunk_files(backup_dir)) < before
+
+    # Lo que queda sigue completo
+    assert backup(backup_dir, "verify").returncode == 0
+    output = tmp_path / "restored"
+    assert backup(backup_dir, "restore", "20260102_000000", "--output-dir", output).returncode == 0
+    assert read_tree(output) == read_tree(source)
+
+
+def test_prune_keeps_latest_even_if_old(source, backup_dir):
+    assert backup(backup_dir, "create", "--source-dir", source, "--timestamp", "20260101_000000").returncode == 0
+    manifest = backup_dir / "snapshots" / "20260101_000000" / "manifest.json"
+    ten_days_ago = time.time() - 10 * 86400
+    os.utime(manifest, (ten_days_ago, ten_days_ago))
+
+    assert backup(backup_dir, "prune", "--keep-days", 7).returncode == 0
+    assert manifest.exists()
+    assert backup(backup_dir, "verify").returncode == 0
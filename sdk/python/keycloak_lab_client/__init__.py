@@ -0,0 +1,25 @@
+"""
+Cliente Python de la API de keycloak-lab
+========================================
+
+Clientes síncrono y asyncio con pool de conexiones, tokens en caché
+renovados antes de expirar y reintento único tras un 401.
+"""
+
+from .client import AsyncKeycloakLabClient, BatchError, BearerAuth, KeycloakLabClient, token_endpoint
+from .tokens import AsyncTokenProvider, Credentials, SyncTokenProvider, TokenError, TokenSet
+
+__all__ = [
+    "AsyncKeycloakLabClient",
+    "AsyncTokenProvider",
+    "BatchError",
+    "BearerAuth",
+    "Credentials",
+    "KeycloakLabClient",
+    "SyncTokenProvider",
+    "TokenError",
+    "TokenSet",
+    "token_endpoint",
+]
+
+__version__ = "0.1.0"
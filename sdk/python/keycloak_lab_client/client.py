@@ -0,0 +1,269 @@
+"""
+Clientes de la API protegida
+============================
+
+KeycloakLabClient (síncrono) y AsyncKeycloakLabClient (asyncio) comparten la
+misma interfaz:
+
+- Un único pool de conexiones httpx para Keycloak y para la API, en lugar
+  de una conexión nueva por llamada
+- El token se pide una vez y se reutiliza hasta poco antes de expirar
+  (ver tokens.py)
+- Si la API responde 401 se descarta el token y se reintenta una vez
+- batch() lanza muchas llamadas en paralelo con concurrencia acotada
+
+Uso:
+    with KeycloakLabClient(
+        "http://localhost:8000",
+        keycloak_url="http://localhost:8080", realm="demo-app",
+        client_id="demo-app-backend", client_secret="...",
+        username="demo-user", password="demo123",
+    ) as api:
+        print(api.profile())
+        results = api.batch([lambda: api.buy(i) for i in (1, 2, 3)])
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Generator, List, Optional, Sequence, TypeVar, Union
+
+import httpx
+
+from .tokens import AsyncTokenProvider, Credentials, SyncTokenProvider
+
+T = TypeVar("T")
+
+
+class BatchError:
+    """Resultado de una llamada de batch() que lanzó una excepción"""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"BatchError({self.error!r})"
+
+
+def token_endpoint(keycloak_url: str, realm: str) -> str:
+    return f"{keycloak_url.rstrip('/')}/realms/{realm}/protocol/openid-connect/token"
+
+
+class BearerAuth(httpx.Auth):
+    """
+    Añade "Authorization: Bearer <token>" a cada petición
+
+    Si la API responde 401 (token revocado o clave rotada), invalida ese
+    token, pide otro y reintenta una vez.
+    """
+
+    def __init__(self, tokens: Union[SyncTokenProvider, AsyncTokenProvider]):
+        self.tokens = tokens
+
+    def sync_auth_flow(self, request: httpx.Request) -> Generator[httpx.Request, httpx.Response, None]:
+        token = self.tokens.get_token()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+        if response.status_code == 401:
+            self.tokens.invalidate(token)
+            request.headers["Authorization"] = f"Bearer {self.tokens.get_token()}"
+            yield request
+
+    async def async_auth_flow(self, request: httpx.Request):
+        token = await self.tokens.get_token()
+        request.headers["Authorization"] = f"Bearer {token}"
+        response = yield request
+        if response.status_code == 401:
+            self.tokens.invalidate(token)
+            request.headers["Authorization"] = f"Bearer {await self.tokens.get_token()}"
+            yield request
+
+
+def _credentials(
+    keycloak_url: Optional[str],
+    realm: Optional[str],
+    token_url: Optional[str],
+    client_id: str,
+    client_secret: Optional[str],
+    username: Optional[str],
+    password: Optional[str],
+    scope: Optional[str],
+) -> Credentials:
+    if token_url is None:
+        if keycloak_url is None or realm is None:
+            raise ValueError("Indica token_url o keycloak_url y realm")
+        token_url = token_endpoint(keycloak_url, realm)
+    return Credentials(token_url, client_id, client_secret, username, password, scope)
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def _json(response: httpx.Response) -> Any:
+    response.raise_for_status()
+    return response.json()
+
+
+class KeycloakLabClient:
+    """Cliente síncrono; seguro entre hilos"""
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        client_id: str,
+        client_secret: Optional[str] = None,
+        keycloak_url: Optional[str] = None,
+        realm: Optional[str] = None,
+        token_url: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        scope: Optional[str] = None,
+        refresh_margin: float = 30.0,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        transport: Optional[httpx.BaseTransport] = None,
+    ):
+        credentials = _credentials(keycloak_url, realm, token_url, client_id, client_secret, username, password, scope)
+        self.max_connections = max_connections
+        self.http = httpx.Client(base_url=base_url, timeout=timeout, limits=_limits(max_connections), transport=transport)
+        self.tokens = SyncTokenProvider(credentials, self.http, refresh_margin)
+        self.http.auth = BearerAuth(self.tokens)
+
+    def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        return self.http.request(method, path, **kwargs)
+
+    def get(self, path: str, **kwargs: Any) -> httpx.Response:
+        return self.http.get(path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> httpx.Response:
+        return self.http.post(path, **kwargs)
+
+    def profile(self) -> Any:
+        return _json(self.get("/profile"))
+
+    def protected(self) -> Any:
+        return _json(self.get("/protected"))
+
+    def items(self, available: Optional[bool] = None) -> Any:
+        params = {} if available is None else {"available": str(available).lower()}
+        return _json(self.get("/items", params=params))
+
+    def my_items(self) -> Any:
+        return _json(self.get("/my-items"))
+
+    def buy(self, item_id: int) -> Any:
+        return _json(self.post(f"/items/{item_id}/buy"))
+
+    def batch(self, calls: Sequence[Callable[[], T]], max_concurrency: Optional[int] = None) -> List[Union[T, BatchError]]:
+        """
+        Ejecuta las llamadas en paralelo y devuelve los resultados en orden
+
+        Una llamada que falla no cancela las demás: su posición contiene un
+        BatchError con la excepción.
+        """
+        workers = max(1, min(len(calls), max_concurrency or self.max_connections))
+
+        def run(call: Callable[[], T]) -> Union[T, BatchError]:
+            try:
+                return call()
+            except Exception as e:
+                return BatchError(e)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(run, calls))
+
+    def close(self) -> None:
+        self.http.close()
+
+    def __enter__(self) -> "KeycloakLabClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class AsyncKeycloakLabClient:
+    """Cliente asyncio; se usa desde un solo event loop"""
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        client_id: str,
+        client_secret: Optional[str] = None,
+        keycloak_url: Optional[str] = None,
+        realm: Optional[str] = None,
+        token_url: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        scope: Optional[str] = None,
+        refresh_margin: float = 30.0,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        credentials = _credentials(keycloak_url, realm, token_url, client_id, client_secret, username, password, scope)
+        self.max_connections = max_connections
+        self.http = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=_limits(max_connections), transport=transport)
+        self.tokens = AsyncTokenProvider(credentials, self.http, refresh_margin)
+        self.http.auth = BearerAuth(self.tokens)
+
+    async def request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.http.request(method, path, **kwargs)
+
+    async def get(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.http.get(path, **kwargs)
+
+    async def post(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.http.post(path, **kwargs)
+
+    async def profile(self) -> Any:
+        return _json(await self.get("/profile"))
+
+    async def protected(self) -> Any:
+        return _json(await self.get("/protected"))
+
+    async def items(self, available: Optional[bool] = None) -> Any:
+        params = {} if available is None else {"available": str(available).lower()}
+        return _json(await self.get("/items", params=params))
+
+    async def my_items(self) -> Any:
+        return _json(await self.get("/my-items"))
+
+    async def buy(self, item_id: int) -> Any:
+        return _json(await self.post(f"/items/{item_id}/buy"))
+
+    async def batch(
+        self,
+        calls: Sequence[Callable[[], Awaitable[T]]],
+        max_concurrency: Optional[int] = None,
+    ) -> List[Union[T, BatchError]]:
+        """
+        Ejecuta las llamadas en paralelo y devuelve los resultados en orden
+
+        Una llamada que falla no cancela las demás: su posición contiene un
+        BatchError con la excepción.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_connections))
+
+        async def run(call: Callable[[], Awaitable[T]]) -> Union[T, BatchError]:
+            async with semaphore:
+                try:
+                    return await call()
+                except Exception as e:
+                    return BatchError(e)
+
+        return list(await asyncio.gather(*(run(call) for call in calls)))
+
+    async def aclose(self) -> None:
+        self.tokens.cancel()
+        await self.http.aclose()
+
+    async def __aenter__(self) -> "AsyncKeycloakLabClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
@@ -0,0 +1,234 @@
+"""
+Caché de tokens del cliente
+===========================
+
+Un token por cliente, pedido a Keycloak solo cuando hace falta:
+
+- Mientras el token tiene más de refresh_margin segundos de vida se reutiliza
+  sin tocar la red
+- Dentro del margen se renueva (con el refresh token si lo hay) mientras las
+  demás llamadas siguen usando el token actual, que aún es válido
+- Single-flight: aunque lleguen muchas llamadas a la vez con el token
+  caducado, solo una va al token endpoint y el resto espera su resultado
+- invalidate(token) tras un 401 descarta ese token solo si sigue siendo el
+  actual: un 401 tardío de un token ya renovado no provoca otra petición
+
+Grants: password (con username/password) o client_credentials (sin ellos).
+Si el refresh token ya no vale, se repite el grant original.
+
+SyncTokenProvider es seguro entre hilos; AsyncTokenProvider se usa desde un
+solo event loop.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+
+class TokenError(Exception):
+    """Keycloak no emitió el token"""
+
+
+@dataclass(frozen=True, slots=True)
+class TokenSet:
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: float
+    refresh_at: float
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any], refresh_margin: float) -> "TokenSet":
+        now = time.monotonic()
+        lifetime = float(data.get("expires_in", 60))
+        return cls(
+            access_token=data["access_token"],
+            refresh_token=data.get("refresh_token"),
+            # Unos segundos de margen para no enviar un token a punto de expirar
+            expires_at=now + max(0.0, lifetime - min(5.0, lifetime * 0.1)),
+            refresh_at=now + max(0.0, lifetime - min(refresh_margin, lifetime / 2)),
+        )
+
+    def valid(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def stale(self, now: float) -> bool:
+        return now >= self.refresh_at
+
+
+@dataclass(frozen=True)
+class Credentials:
+    """Cliente de Keycloak y, para el password grant, el usuario"""
+    token_url: str
+    client_id: str
+    client_secret: Optional[str] = None
+    username: Optional[str] = None
+    password: Optional[str] = None
+    scope: Optional[str] = None
+
+    def grant(self) -> Dict[str, str]:
+        if self.username is not None:
+            data = {"grant_type": "password", "username": self.username, "password": self.password or ""}
+        else:
+            data = {"grant_type": "client_credentials"}
+        return self._with_client(data)
+
+    def refresh(self, refresh_token: str) -> Dict[str, str]:
+        return self._with_client({"grant_type": "refresh_token", "refresh_token": refresh_token})
+
+    def _with_client(self, data: Dict[str, str]) -> Dict[str, str]:
+        data["client_id"] = self.client_id
+        if self.client_secret:
+            data["client_secret"] = self.client_secret
+        if self.scope:
+            data["scope"] = self.scope
+        return data
+
+
+def _parse(response: httpx.Response, refresh_margin: float) -> TokenSet:
+    if response.status_code != 200:
+        raise TokenError(f"Token endpoint respondió HTTP {response.status_code}")
+    try:
+        return TokenSet.from_response(response.json(), refresh_margin)
+    except (ValueError, KeyError) as e:
+        raise TokenError("Respuesta del token endpoint sin access_token") from e
+
+
+class SyncTokenProvider:
+    """Tokens para KeycloakLabClient (httpx.Client, varios hilos)"""
+
+    def __init__(self, credentials: Credentials, http: httpx.Client, refresh_margin: float = 30.0):
+        self.credentials = credentials
+        self.http = http
+        self.refresh_margin = refresh_margin
+        self.requests = 0
+        self._tokens: Optional[TokenSet] = None
+        self._lock = threading.Lock()
+
+    def get_token(self) -> str:
+        """
+        Access token válido
+
+        Raises:
+            TokenError: Si hay que pedir uno y Keycloak no lo emite
+        """
+        tokens = self._tokens
+        now = time.monotonic()
+        if tokens is not None and tokens.valid(now):
+            # En el margen de renovación: renueva un hilo, el resto no espera
+            if tokens.stale(now) and self._lock.acquire(blocking=False):
+                try:
+                    if self._tokens is tokens:
+                        try:
+                            self._tokens = self._fetch(tokens)
+                        except TokenError:
+                            pass  # el token actual sigue valiendo; se reintenta en la próxima llamada
+                finally:
+                    self._lock.release()
+            return self._tokens.access_token if self._tokens is not None else tokens.access_token
+        with self._lock:
+            tokens = self._tokens
+            if tokens is None or not tokens.valid(time.monotonic()):
+                tokens = self._tokens = self._fetch(tokens)
+            return tokens.access_token
+
+    def invalidate(self, access_token: str) -> None:
+        """Descarta el token tras un 401, si nadie lo ha renovado ya"""
+        with self._lock:
+            if self._tokens is not None and self._tokens.access_token == access_token:
+                self._tokens = None
+
+    def _fetch(self, previous: Optional[TokenSet]) -> TokenSet:
+        if previous is not None and previous.refresh_token:
+            try:
+                return self._post(self.credentials.refresh(previous.refresh_token))
+            except TokenError:
+                pass  # refresh token caducado o revocado: grant completo
+        return self._post(self.credentials.grant())
+
+    def _post(self, data: Dict[str, str]) -> TokenSet:
+        self.requests += 1
+        try:
+            response = self.http.post(self.credentials.token_url, data=data, auth=None)
+        except httpx.HTTPError as e:
+            raise TokenError(f"Error contactando el token endpoint: {e}") from e
+        return _parse(response, self.refresh_margin)
+
+
+class AsyncTokenProvider:
+    """Tokens para AsyncKeycloakLabClient (httpx.AsyncClient)"""
+
+    def __init__(self, credentials: Credentials, http: httpx.AsyncClient, refresh_margin: float = 30.0):
+        self.credentials = credentials
+        self.http = http
+        self.refresh_margin = refresh_margin
+        self.requests = 0
+        self._tokens: Optional[TokenSet] = None
+        self._inflight: Optional[asyncio.Task] = None
+
+    async def get_token(self) -> str:
+        """
+        Access token válido
+
+        Raises:
+            TokenError: Si hay que pedir uno y Keycloak no lo emite
+        """
+        tokens = self._tokens
+        now = time.monotonic()
+        if tokens is not None and tokens.valid(now):
+            if tokens.stale(now) and self._inflight is None:
+                # Renovación en segundo plano: esta llamada no espera
+                task = self._start_fetch(tokens)
+                task.add_done_callback(_consume_error)
+            return tokens.access_token
+        return (await asyncio.shield(self._start_fetch(tokens))).access_token
+
+    def invalidate(self, access_token: str) -> None:
+        """Descarta el token tras un 401, si nadie lo ha renovado ya"""
+        if self._tokens is not None and self._tokens.access_token == access_token:
+            self._tokens = None
+
+    def _start_fetch(self, previous: Optional[TokenSet]) -> asyncio.Task:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch(previous))
+            self._inflight.add_done_callback(self._clear_inflight)
+        return self._inflight
+
+    def _clear_inflight(self, task: asyncio.Task) -> None:
+        if self._inflight is task:
+            self._inflight = None
+
+    async def _fetch(self, previous: Optional[TokenSet]) -> TokenSet:
+        tokens = None
+        if previous is not None and previous.refresh_token:
+            try:
+                tokens = await self._post(self.credentials.refresh(previous.refresh_token))
+            except TokenError:
+                pass  # refresh token caducado o revocado: grant completo
+        if tokens is None:
+            tokens = await self._post(self.credentials.grant())
+        self._tokens = tokens
+        return tokens
+
+    async def _post(self, data: Dict[str, str]) -> TokenSet:
+        self.requests += 1
+        try:
+            response = await self.http.post(self.credentials.token_url, data=data, auth=None)
+        except httpx.HTTPError as e:
+            raise TokenError(f"Error contactando el token endpoint: {e}") from e
+        return _parse(response, self.refresh_margin)
+
+    def cancel(self) -> None:
+        if self._inflight is not None:
+            self._inflight.cancel()
+            self._inflight = None
+
+
+def _consume_error(task: asyncio.Task) -> None:
+    # Un fallo de la renovación en segundo plano no se pierde en el log del
+    # loop: la siguiente llamada lo reintenta mientras el token siga válido
+    if not task.cancelled():
+        task.exception()